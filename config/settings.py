@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'store.media.MediaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,7 +84,14 @@ WSGI_APPLICATION = 'config.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # BEGIN IMMEDIATE: cada transação pede logo o lock de escrita (e espera por ele até
+            # `timeout`). Com o modo DEFERRED, uma transação que lê antes de escrever (checkout,
+            # reservas) falha de imediato com "database is locked" quando outra já está a escrever.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -128,6 +136,39 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Configuração de Media (Uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Os uploads são servidos pelo store.media.MediaMiddleware (sendfile, Range, ETag).
+# Atrás de um nginx, defina um location `internal` para MEDIA_ROOT e indique-o aqui
+# para que o nginx envie os ficheiros: STORE_MEDIA_ACCEL_REDIRECT = '/protected-media/'
+
+# Cache (dados de referência, versões do catálogo, páginas em cache). Tem de ser partilhada
+# entre os workers (gunicorn): uma alteração no admin muda a versão na cache e todos a veem.
+# Por defeito usa ficheiros em CACHE_LOCATION (pasta com escrita); com REDIS_URL usa o Redis.
+# Os testes (store/tests.py) usam o mesmo backend numa pasta temporária.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache')),
+            # Ao chegar ao limite o Django apaga um terço das entradas (páginas incluídas)
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+# Carrinho de compras guardado no servidor (a sessão guarda apenas o id do carrinho)
+# Alternativa: 'store.cart.CacheCartBackend' (requer Redis ou Memcached: o lock de cada carrinho usa cache.add,
+# que só é atómico nesses backends)
+CART_BACKEND = 'store.cart.DatabaseCartBackend'
+
+# Minutos durante os quais as unidades adicionadas ao carrinho ficam reservadas.
+# As reservas expiradas são apagadas em lote por: python manage.py expire_reservations
+STOCK_RESERVATION_MINUTES = 15
 
 # Configuração de Email (Para desenvolvimento: imprime na consola)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -139,6 +180,11 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # EMAIL_HOST_USER = 'o_seu_email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'a_sua_senha_de_aplicacao'
 
+# Destinatário dos avisos de nova encomenda (Substitua pelo seu email)
+ADMIN_NOTIFICATION_EMAIL = 'seu_email_de_admin@exemplo.com'
+# Os emails são gravados na tabela EmailOutbox e enviados em lote por:
+#   python manage.py send_outbox --loop
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
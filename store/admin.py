@@ -1,21 +1,52 @@
 from django.contrib import admin
 from django import forms
 from django.db import models
-from decimal import Decimal
-from django.db.models import Sum, Count
-from django.utils import timezone
-from datetime import timedelta
+from django.db.models import Prefetch
+from django.utils.text import Truncator
 from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.contrib.auth.models import Group
-from .models import Category, Product, ProductImage, ProductVariant, Order, OrderItem, SiteSettings, PaymentMethod, ShippingMethod, Client, Administrator, Profile, Ceremony, CeremonyRegistration, Anamnesis, Therapy, Appointment
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from .models import Category, Product, ProductImage, ProductVariant, Order, OrderItem, SiteSettings, EmailOutbox, PaymentMethod, ShippingMethod, Client, Administrator, Profile, Ceremony, CeremonyRegistration, Anamnesis, Therapy, Appointment
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from . import agenda, exports, sales
+from .orders import summarize_items
 
 admin.site.unregister(Group) # Remove "Grupos" para limpar o CMS
 admin.site.unregister(User) # Remove o menu "Users" original para evitar confusão
 
+# --- EXPORTAÇÕES (store/exports.py) ---
+class ExportMixin:
+    """Ações e URLs (exportar/csv/, exportar/xlsx/) que exportam o changelist com os filtros atuais."""
+    change_list_template = 'admin/export_change_list.html'
+    actions = ['export_csv', 'export_xlsx']
+
+    def get_urls(self):
+        name = f'{self.opts.app_label}_{self.opts.model_name}_export'
+        return [
+            path('exportar/<str:fmt>/', self.admin_site.admin_view(self.export_view), name=name),
+        ] + super().get_urls()
+
+    def export_view(self, request, fmt):
+        if fmt not in exports.FORMATS:
+            raise Http404("Formato desconhecido.")
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        # O ChangeList aplica os mesmos filtros, pesquisa e ordenação que a lista
+        changelist = self.get_changelist_instance(request)
+        return exports.export_response(changelist.get_queryset(request), fmt)
+
+    @admin.action(description="Exportar selecionados (CSV)")
+    def export_csv(self, request, queryset):
+        return exports.export_response(queryset, 'csv')
+
+    @admin.action(description="Exportar selecionados (XLSX)")
+    def export_xlsx(self, request, queryset):
+        return exports.export_response(queryset, 'xlsx')
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug']
@@ -132,8 +163,8 @@ class AdministratorAdmin(BaseUserAdmin):
         return super().get_queryset(request).filter(is_staff=True)
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'full_name', 'link_to_client', 'get_items_summary', 'total_price', 'paid', 'status', 'created_at']
+class OrderAdmin(ExportMixin, admin.ModelAdmin):
+    list_display = ['id', 'full_name', 'link_to_client', 'get_items_summary', 'items_count', 'total_price', 'paid', 'status', 'created_at']
     list_display_links = ['id', 'full_name'] 
     list_filter = ['paid', 'status', 'created_at']
     search_fields = ['id', 'full_name', 'email', 'user__username'] # Pesquisa por ID, Nome, Email
@@ -171,10 +202,20 @@ class OrderAdmin(admin.ModelAdmin):
     link_to_client.short_description = "Ficha"
 
     def get_items_summary(self, obj):
-        items = obj.items.all()
-        return ", ".join([f"{item.quantity}x {item.product.name}" for item in items])
+        if obj.items_summary:
+            return Truncator(obj.items_summary).chars(120)
+        # Encomendas anteriores ao resumo (até correr backfill_order_summaries): itens pré-carregados
+        return Truncator(summarize_items((item.quantity, item.product.name) for item in obj.items.all())).chars(120)
     get_items_summary.short_description = "Artigos na Encomenda"
 
+    def get_queryset(self, request):
+        # Uma query para a página de encomendas (com o cliente) e uma para os itens em falta
+        return super().get_queryset(request).select_related('user').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.filter(order__items_count=0).select_related('product').only(
+                'order_id', 'quantity', 'product__name',
+            )),
+        )
+
 @admin.register(SiteSettings)
 class SiteSettingsAdmin(admin.ModelAdmin):
     # Impede adicionar mais de uma configuração
@@ -184,6 +225,13 @@ class SiteSettingsAdmin(admin.ModelAdmin):
 admin.site.register(PaymentMethod)
 admin.site.register(ShippingMethod)
 
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'to']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
 class AnamnesisInline(admin.StackedInline):
     model = Anamnesis
     can_delete = False
@@ -196,16 +244,20 @@ class CeremonyRegistrationInline(admin.TabularInline):
 
 @admin.register(Ceremony)
 class CeremonyAdmin(admin.ModelAdmin):
-    list_display = ['name', 'event_date', 'max_participants', 'get_registrations_count']
+    list_display = ['name', 'event_date', 'max_participants', 'registrations_count']
     inlines = [CeremonyRegistrationInline]
 
-    def get_registrations_count(self, obj):
-        return obj.registrations.count()
-    get_registrations_count.short_description = "Inscritos"
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Não regrava registrations_count: inscrições feitas entretanto não se perdem
+            obj.save(update_fields=[f.name for f in obj._meta.concrete_fields if not f.primary_key and f.name != 'registrations_count'])
+        else:
+            super().save_model(request, obj, form, change)
 
 @admin.register(CeremonyRegistration)
-class CeremonyRegistrationAdmin(admin.ModelAdmin):
+class CeremonyRegistrationAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ['full_name', 'ceremony', 'created_at']
+    list_filter = ['ceremony', 'created_at']
     inlines = [AnamnesisInline]
 
 @admin.register(Therapy)
@@ -214,7 +266,7 @@ class TherapyAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(ExportMixin, admin.ModelAdmin):
     list_display = ['therapy', 'user', 'start_time', 'end_time', 'payment_method', 'confirmed']
     list_filter = ['start_time', 'confirmed', 'therapy']
     ordering = ['-start_time']
@@ -222,6 +274,7 @@ class AppointmentAdmin(admin.ModelAdmin):
 # --- AGENDA / CALENDÁRIO ---
 from django.urls import path
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 def admin_calendar_view(request):
     context = admin.site.each_context(request)
@@ -229,54 +282,31 @@ def admin_calendar_view(request):
     return TemplateResponse(request, 'admin/calendar.html', context)
 
 def admin_calendar_events(request):
-    events = []
-    
-    # 1. Adicionar Terapias
-    appointments = Appointment.objects.all()
-    for app in appointments:
-        events.append({
-            'title': f"{app.therapy.name} ({app.user.first_name})",
-            'start': app.start_time.isoformat(),
-            'end': app.end_time.isoformat(),
-            'color': '#10b981' if app.confirmed else '#f59e0b', # Verde se confirmado, Amarelo se pendente
-            'url': reverse('admin:store_appointment_change', args=[app.id])
-        })
-
-    # 2. Adicionar Cerimónias
-    ceremonies = Ceremony.objects.all()
-    for cer in ceremonies:
-        events.append({
-            'title': f"Cerimónia: {cer.name}",
-            'start': cer.event_date.isoformat(),
-            'color': '#6366f1', # Roxo
-            'url': reverse('admin:store_ceremony_change', args=[cer.id])
-        })
-    
-    return JsonResponse(events, safe=False)
+    # Só os eventos da janela visível no FullCalendar (store/agenda.py), com ETag/304
+    try:
+        window = agenda.parse_window(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    etag = agenda.window_etag(window)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(agenda.events(window), safe=False)
+        response['ETag'] = etag
+    # O browser guarda a resposta mas confirma sempre com If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 # --- DASHBOARD PERSONALIZADO ---
 def admin_dashboard(request, extra_context=None):
-    # 1. Top 10 Artigos Mais Vendidos
-    top_products = OrderItem.objects.values('product__name').annotate(total_sold=Sum('quantity')).order_by('-total_sold')[:10]
-
-    # 2. Total Vendas (Mês, Semana, Dia) - Apenas encomendas pagas
-    now = timezone.now()
-    orders = Order.objects.filter(paid=True)
-    
-    sales_day = orders.filter(created_at__date=now.date()).aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-    
-    start_week = now - timedelta(days=now.weekday())
-    sales_week = orders.filter(created_at__gte=start_week).aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-    
-    start_month = now.replace(day=1)
-    sales_month = orders.filter(created_at__gte=start_month).aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
+    # 1 e 2. Vendas (dia, semana, mês) e Top 10 Artigos: lidos das tabelas de resumo (store/sales.py)
+    numbers = sales.dashboard_numbers()
 
     # 3. Número de Clientes (Excluindo Staff)
     total_clients = Client.objects.filter(is_staff=False).count()
 
-    # 4. Total de Clientes por Cerimónia
-    ceremonies = Ceremony.objects.annotate(total_registrations=Count('registrations'))
+    # 4. Total de Clientes por Cerimónia (contador mantido em store/ceremonies.py)
+    ceremonies = Ceremony.objects.only('name', 'registrations_count')
 
     # 5. Encomendas Recentes
     recent_orders = Order.objects.order_by('-created_at')[:5]
@@ -288,8 +318,7 @@ def admin_dashboard(request, extra_context=None):
         **admin.site.each_context(request),
         'title': 'Dashboard da Loja',
         'app_list': app_list,
-        'top_products': top_products,
-        'sales_day': sales_day, 'sales_week': sales_week, 'sales_month': sales_month,
+        **numbers,
         'total_clients': total_clients, 'ceremonies': ceremonies, 'recent_orders': recent_orders,
     }
     return TemplateResponse(request, 'admin/dashboard.html', context)
@@ -299,8 +328,8 @@ original_get_urls = admin.site.get_urls
 def get_admin_urls():
     urls = original_get_urls()
     custom_urls = [
-        path('agenda/', admin_calendar_view, name='admin_calendar'),
-        path('agenda/events/', admin_calendar_events, name='admin_calendar_events'),
+        path('agenda/', admin.site.admin_view(admin_calendar_view), name='admin_calendar'),
+        path('agenda/events/', admin.site.admin_view(admin_calendar_events), name='admin_calendar_events'),
     ]
     return custom_urls + urls
 admin.site.get_urls = get_admin_urls
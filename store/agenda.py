@@ -0,0 +1,102 @@
+import hashlib
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from . import reference
+from .models import Appointment, Ceremony
+from .page_cache import CATALOGUE
+
+# Eventos da agenda do admin (FullCalendar) limitados à janela pedida (?start=...&end=...).
+# Cada modelo é lido com uma query sobre o índice de datas, já com os nomes das relações,
+# e o ETag vem do updated_at mais recente e do número de eventos da janela: ao navegar para
+# trás e para a frente o browser recebe 304 sem se voltar a montar o JSON.
+
+# Nenhuma marcação dura mais do que isto: permite procurar só por start_time no índice
+MAX_APPOINTMENT_DURATION = timedelta(days=1)
+# Janela usada sem parâmetros e tamanho máximo aceite (o FullCalendar pede ~6 semanas)
+DEFAULT_WINDOW = timedelta(days=42)
+MAX_WINDOW = timedelta(days=400)
+APPOINTMENT_COLORS = {True: '#10b981', False: '#f59e0b'}  # Verde se confirmado, Amarelo se pendente
+CEREMONY_COLOR = '#6366f1'  # Roxo
+
+
+def parse_moment(value):
+    """Aceita datas ISO com ou sem hora/fuso (o FullCalendar envia '2026-09-28T00:00:00+01:00')."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Data inválida: {value!r}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_window(params):
+    """Devolve (início, fim) a partir de ?start=&end=; ValueError se forem inválidos."""
+    start = parse_moment(params['start']) if params.get('start') else None
+    end = parse_moment(params['end']) if params.get('end') else None
+    if start is None:
+        start = (end or timezone.now()) - (DEFAULT_WINDOW if end else timedelta(days=7))
+    if end is None:
+        end = start + DEFAULT_WINDOW
+    if end <= start:
+        raise ValueError("O fim tem de ser depois do início.")
+    return start, min(end, start + MAX_WINDOW)
+
+
+def appointments_in(window):
+    start, end = window
+    return Appointment.objects.filter(
+        start_time__gte=start - MAX_APPOINTMENT_DURATION, start_time__lt=end, end_time__gt=start,
+    )
+
+
+def ceremonies_in(window):
+    start, end = window
+    return Ceremony.objects.filter(event_date__gte=start, event_date__lt=end)
+
+
+def window_etag(window):
+    """Muda quando um evento da janela é criado, alterado ou apagado (ou quando uma terapia muda de nome)."""
+    parts = [str(window[0].timestamp()), str(window[1].timestamp()), reference.current_version(CATALOGUE)]
+    for queryset in (appointments_in(window), ceremonies_in(window)):
+        state = queryset.aggregate(last=Max('updated_at'), count=Count('id'))
+        parts += [state['last'].isoformat() if state['last'] else '', str(state['count'])]
+    return '"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def change_url_format(model_name):
+    # reverse() uma vez por modelo; os ids entram por format
+    return reverse(f'admin:store_{model_name}_change', args=[0]).replace('/0/', '/{}/')
+
+
+def events(window):
+    appointment_url = change_url_format('appointment')
+    ceremony_url = change_url_format('ceremony')
+    appointments = appointments_in(window).order_by('start_time').values_list(
+        'id', 'start_time', 'end_time', 'confirmed', 'therapy__name', 'user__first_name',
+    )
+    result = [
+        {
+            'title': f"{therapy} ({first_name})",
+            'start': start_time.isoformat(),
+            'end': end_time.isoformat(),
+            'color': APPOINTMENT_COLORS[confirmed],
+            'url': appointment_url.format(pk),
+        }
+        for pk, start_time, end_time, confirmed, therapy, first_name in appointments
+    ]
+    result += [
+        {
+            'title': f"Cerimónia: {name}",
+            'start': event_date.isoformat(),
+            'color': CEREMONY_COLOR,
+            'url': ceremony_url.format(pk),
+        }
+        for pk, name, event_date in ceremonies_in(window).order_by('event_date').values_list('id', 'name', 'event_date')
+    ]
+    return result
@@ -1,58 +1,358 @@
+import time
+from contextlib import contextmanager
 from decimal import Decimal
 from django.conf import settings
-from .models import Product, ProductVariant
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Product, ProductVariant, StoredCart, CartLine, generate_cart_token
+from . import reservations
+
+# O carrinho vive no servidor (base de dados ou cache); a sessão guarda apenas um id opaco.
+# O backend é escolhido em settings.CART_BACKEND.
+
+CART_SESSION_KEY = 'cart_id'
+
+
+def make_cart_key(product_id, variant_id=None):
+    return f"{product_id}_{variant_id or 'no_variant'}"
+
+
+class CartBusyError(Exception):
+    """O carrinho está a ser alterado por outro pedido há demasiado tempo (lock não obtido)."""
+
+
+class DatabaseCartBackend:
+    """Guarda as linhas do carrinho nos modelos StoredCart / CartLine."""
+
+    def load(self, cart_id):
+        """Devolve {key: {'product_id', 'variant_id', 'quantity'}} numa só query."""
+        lines = CartLine.objects.filter(cart__token=cart_id).values_list('key', 'product_id', 'variant_id', 'quantity')
+        return {
+            key: {'product_id': product_id, 'variant_id': variant_id, 'quantity': quantity}
+            for key, product_id, variant_id, quantity in lines
+        }
+
+    def create(self, user=None):
+        if user is not None:
+            cart, _ = StoredCart.objects.get_or_create(user=user)
+        else:
+            cart = StoredCart.objects.create()
+        return cart.token
+
+    def user_cart(self, user):
+        return StoredCart.objects.filter(user=user).values_list('token', flat=True).first()
+
+    def add(self, cart_id, product_id, variant_id, quantity):
+        """Soma `quantity` à linha do produto/variante. Devolve False se o carrinho já não existir."""
+        carts = StoredCart.objects.filter(token=cart_id)
+        cart_pk = carts.values_list('id', flat=True).first()
+        if cart_pk is None:
+            return False
+        carts.update(updated_at=timezone.now())
+        self._increment(cart_pk, product_id, variant_id, quantity)
+        return True
+
+    def _increment(self, cart_pk, product_id, variant_id, quantity):
+        key = make_cart_key(product_id, variant_id)
+        lines = CartLine.objects.filter(cart_id=cart_pk, key=key)
+        if lines.update(quantity=F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                CartLine.objects.create(cart_id=cart_pk, key=key, product_id=product_id, variant_id=variant_id, quantity=quantity)
+        except IntegrityError:
+            # Outro pedido criou a mesma linha entretanto
+            lines.update(quantity=F('quantity') + quantity)
+
+    def set_quantity(self, cart_id, key, quantity):
+        CartLine.objects.filter(cart__token=cart_id, key=key).update(quantity=quantity)
+
+    def remove(self, cart_id, key):
+        CartLine.objects.filter(cart__token=cart_id, key=key).delete()
+
+    def clear(self, cart_id):
+        CartLine.objects.filter(cart__token=cart_id).delete()
+
+    @transaction.atomic
+    def merge(self, cart_id, user):
+        """Junta o carrinho anónimo `cart_id` ao carrinho do utilizador numa só transação."""
+        user_cart, _ = StoredCart.objects.get_or_create(user=user)
+        if cart_id == user_cart.token:
+            return user_cart.token
+        anonymous = StoredCart.objects.filter(token=cart_id, user__isnull=True).first()
+        if anonymous is None:
+            return user_cart.token
+
+        existing = {line.key: line for line in user_cart.lines.all()}
+        to_update, to_create = [], []
+        for line in anonymous.lines.all():
+            if line.key in existing:
+                existing[line.key].quantity += line.quantity
+                to_update.append(existing[line.key])
+            else:
+                to_create.append(CartLine(cart=user_cart, key=line.key, product_id=line.product_id,
+                                          variant_id=line.variant_id, quantity=line.quantity))
+        CartLine.objects.bulk_update(to_update, ['quantity'])
+        CartLine.objects.bulk_create(to_create)
+        anonymous.delete()
+        return user_cart.token
+
+
+class CacheCartBackend:
+    """
+    Guarda as linhas do carrinho na cache do Django (ex: Redis/Memcached partilhado entre workers).
+    Cada alteração é um ler -> mudar -> gravar do carrinho inteiro, por isso corre com um lock
+    por carrinho (cache.add, atómico em Redis/Memcached): dois pedidos simultâneos (duplo clique) não perdem linhas.
+    """
+    timeout = settings.SESSION_COOKIE_AGE
+    lock_timeout = 5
+    lock_wait = 0.01
+
+    def _key(self, cart_id):
+        return f"store:cart:{cart_id}"
+
+    def _user_key(self, user):
+        return f"store:cart:user:{user.pk}"
+
+    @contextmanager
+    def _locked(self, cart_id):
+        lock_key = self._key(cart_id) + ':lock'
+        token = generate_cart_token()
+        deadline = time.monotonic() + self.lock_timeout
+        # O lock expira sozinho: um worker que morra a meio não bloqueia o carrinho para sempre
+        while not cache.add(lock_key, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                # Sem o lock, gravar o carrinho inteiro podia apagar a alteração do outro pedido
+                raise CartBusyError(cart_id)
+            time.sleep(self.lock_wait)
+        try:
+            yield
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def load(self, cart_id):
+        return cache.get(self._key(cart_id)) or {}
+
+    def _store(self, cart_id, lines):
+        cache.set(self._key(cart_id), lines, self.timeout)
+
+    def user_cart(self, user):
+        return cache.get(self._user_key(user))
+
+    def create(self, user=None):
+        if user is not None:
+            cart_id = self.user_cart(user)
+            if cart_id and cache.get(self._key(cart_id)) is not None:
+                return cart_id
+        cart_id = generate_cart_token()
+        self._store(cart_id, {})
+        if user is not None:
+            cache.set(self._user_key(user), cart_id, None)
+        return cart_id
+
+    def add(self, cart_id, product_id, variant_id, quantity):
+        with self._locked(cart_id):
+            lines = cache.get(self._key(cart_id))
+            if lines is None:
+                return False
+            key = make_cart_key(product_id, variant_id)
+            line = lines.setdefault(key, {'product_id': product_id, 'variant_id': variant_id, 'quantity': 0})
+            line['quantity'] += quantity
+            self._store(cart_id, lines)
+            return True
+
+    def set_quantity(self, cart_id, key, quantity):
+        with self._locked(cart_id):
+            lines = self.load(cart_id)
+            if key in lines:
+                lines[key]['quantity'] = quantity
+                self._store(cart_id, lines)
+
+    def remove(self, cart_id, key):
+        with self._locked(cart_id):
+            lines = self.load(cart_id)
+            if lines.pop(key, None) is not None:
+                self._store(cart_id, lines)
+
+    def clear(self, cart_id):
+        with self._locked(cart_id):
+            self._store(cart_id, {})
+
+    def merge(self, cart_id, user):
+        user_cart_id = self.create(user)
+        if cart_id == user_cart_id:
+            return user_cart_id
+        with self._locked(user_cart_id):
+            lines = self.load(user_cart_id)
+            for key, line in self.load(cart_id).items():
+                if key in lines:
+                    lines[key]['quantity'] += line['quantity']
+                else:
+                    lines[key] = line
+            self._store(user_cart_id, lines)
+        cache.delete(self._key(cart_id))
+        return user_cart_id
+
+
+def get_cart_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', 'store.cart.DatabaseCartBackend'))()
+
 
 class Cart:
     def __init__(self, request):
+        # Só lê a sessão: o carrinho é criado (e o id gravado na sessão) apenas no primeiro add(),
+        # para que páginas de consulta não criem sessões nem enviem Set-Cookie
+        self.request = request
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        self.backend = get_cart_backend()
+        self.cart_id = self.session.get(CART_SESSION_KEY)
+        self._lines = None
+        self._items = None
+
+    @property
+    def cart(self):
+        if self._lines is None:
+            self._lines = self.backend.load(self.cart_id) if self.cart_id else {}
+        return self._lines
+
+    def _invalidate(self):
+        self._lines = None
+        self._items = None
+
+    def _create(self):
+        user = self.request.user if self.request.user.is_authenticated else None
+        self.cart_id = self.backend.create(user)
+        self.session[CART_SESSION_KEY] = self.cart_id
+
+    def quantity_of(self, product_id, exclude_key=None):
+        """Unidades do produto no carrinho (todas as variantes)."""
+        return sum(
+            line['quantity'] for key, line in self.cart.items()
+            if line['product_id'] == product_id and key != exclude_key
+        )
 
     def add(self, product, quantity=1, variant=None):
-        product_id = str(product.id)
-        variant_id = str(variant.id) if variant else 'no_variant'
-        cart_key = f"{product_id}_{variant_id}"
-
-        if cart_key not in self.cart:
-            price = float(product.price)
-            if variant:
-                price += float(variant.price_extra)
-                
-            self.cart[cart_key] = {
-                'quantity': 0,
-                'price': price,
-                'product_id': product_id,
-                'variant_id': variant.id if variant else None,
-                'name': product.name,
-                'variant_name': variant.name if variant else '',
-                'image': product.image.url if product.image else ''
-            }
-        
-        self.cart[cart_key]['quantity'] += quantity
-        self.save()
+        """Adiciona ao carrinho e reserva o stock. Lança OutOfStockError se não houver unidades disponíveis."""
+        variant_id = variant.id if variant else None
+        if not self.cart_id:
+            self._create()
+        # Reserva primeiro: sem stock disponível o carrinho fica como estava
+        previous = self.quantity_of(product.id)
+        reservations.hold(self.cart_id, product.id, previous + quantity)
+        try:
+            added = self.backend.add(self.cart_id, product.id, variant_id, quantity)
+        except CartBusyError:
+            reservations.hold(self.cart_id, product.id, previous, check=False)
+            raise
+        if not added:
+            # O carrinho guardado já não existe (expirou/foi apagado): começa um novo
+            reservations.release(self.cart_id)
+            self._create()
+            reservations.hold(self.cart_id, product.id, quantity)
+            self.backend.add(self.cart_id, product.id, variant_id, quantity)
+        self._invalidate()
 
     def remove(self, cart_key):
-        if cart_key in self.cart:
-            del self.cart[cart_key]
-            self.save()
+        if self.cart_id and cart_key in self.cart:
+            product_id = self.cart[cart_key]['product_id']
+            remaining = self.quantity_of(product_id, exclude_key=cart_key)
+            self.backend.remove(self.cart_id, cart_key)
+            reservations.hold(self.cart_id, product_id, remaining, check=False)
+            self._invalidate()
+
+    def set_quantity(self, cart_key, quantity):
+        """Define a quantidade de uma linha existente (0 remove a linha). Pode lançar OutOfStockError."""
+        if quantity <= 0:
+            self.remove(cart_key)
+        elif self.cart_id and cart_key in self.cart:
+            line = self.cart[cart_key]
+            total = self.quantity_of(line['product_id'], exclude_key=cart_key) + quantity
+            reservations.hold(self.cart_id, line['product_id'], total, check=quantity > line['quantity'])
+            try:
+                self.backend.set_quantity(self.cart_id, cart_key, quantity)
+            except CartBusyError:
+                previous = total - quantity + line['quantity']
+                reservations.hold(self.cart_id, line['product_id'], previous, check=False)
+                raise
+            self._invalidate()
+
+    def hydrate(self):
+        """
+        Carrega todos os produtos e variantes do carrinho (uma query para cada, independentemente
+        do número de linhas) e calcula os preços em Decimal a partir do catálogo.
+        O resultado fica memorizado até o carrinho ser alterado.
+        """
+        if self._items is not None:
+            return self._items
 
-    def save(self):
-        self.session.modified = True
+        lines = self.cart
+        product_ids = {line['product_id'] for line in lines.values()}
+        variant_ids = {line['variant_id'] for line in lines.values() if line['variant_id']}
+        products = Product.objects.in_bulk(product_ids) if product_ids else {}
+        variants = ProductVariant.objects.in_bulk(variant_ids) if variant_ids else {}
+
+        items = []
+        for key, line in lines.items():
+            product = products.get(line['product_id'])
+            variant = variants.get(line['variant_id']) if line['variant_id'] else None
+            # Ignora linhas cujo produto/variante foi entretanto apagado
+            if product is None or (line['variant_id'] and (variant is None or variant.product_id != product.id)):
+                continue
+            price = product.price + variant.price_extra if variant else product.price
+            items.append({
+                'key': key,
+                'product': product,
+                'variant': variant,
+                'product_id': product.id,
+                'variant_id': variant.id if variant else None,
+                'name': product.name,
+                'variant_name': variant.name if variant else '',
+                'image': product.image.url if product.image else '',
+                'price': price,
+                'quantity': line['quantity'],
+                'total_price': price * line['quantity'],
+            })
+        self._items = items
+        return items
 
     def __iter__(self):
-        for key, item in self.cart.items():
-            item['total_price'] = Decimal(item['price']) * item['quantity']
-            item['key'] = key
-            yield item
+        return iter(self.hydrate())
 
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return sum((item['total_price'] for item in self.hydrate()), Decimal('0.00'))
 
     def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
+        return sum(line['quantity'] for line in self.cart.values())
 
     def clear(self):
-        del self.session['cart']
-        self.save()
\ No newline at end of file
+        if self.cart_id:
+            self.backend.clear(self.cart_id)
+            reservations.release(self.cart_id)
+        self._lines = {}
+        self._items = []
+
+
+def get_cart(request):
+    """Devolve o Cart do pedido atual, partilhado entre a view e o context processor."""
+    if not hasattr(request, '_store_cart'):
+        request._store_cart = Cart(request)
+    return request._store_cart
+
+
+def merge_cart_on_login(request, user):
+    """Junta o carrinho anónimo da sessão ao carrinho do utilizador que acabou de entrar."""
+    backend = get_cart_backend()
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if cart_id:
+        user_cart_id = backend.merge(cart_id, user)
+        if user_cart_id != cart_id:
+            reservations.transfer(cart_id, user_cart_id)
+        request.session[CART_SESSION_KEY] = user_cart_id
+    else:
+        user_cart_id = backend.user_cart(user)
+        if user_cart_id:
+            request.session[CART_SESSION_KEY] = user_cart_id
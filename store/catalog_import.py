@@ -0,0 +1,241 @@
+import csv
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.db import transaction
+from django.utils.text import slugify
+from .models import Category, Product, ProductVariant, ProductImage
+from . import page_cache, reference, search
+
+# Importação do catálogo a partir de CSV ou JSONL (`manage.py import_catalog`).
+# O ficheiro é lido linha a linha e gravado em lotes com bulk_create(update_conflicts=True),
+# por isso a memória não depende do tamanho do ficheiro (exceto um digest de 8 bytes e o slug
+# por produto, para resolver colisões). O slug é a identidade do produto; as linhas sem slug
+# são associadas pelo nome a produtos existentes, por isso importar de novo o mesmo ficheiro
+# atualiza os produtos em vez de os duplicar ou de sobrepor outros.
+#
+# Colunas: category, name, slug (opcional), description, price, stock, is_active, is_featured,
+# image, variants, images. Em CSV, variants = "Nome:preço_extra|Nome:preço_extra" e
+# images = "ficheiro|ficheiro"; em JSONL são listas ({"name", "price_extra"} e nomes).
+
+BATCH_SIZE = 1000
+PRODUCT_UPDATE_FIELDS = ['category', 'name', 'price', 'updated_at']
+# Só atualizados quando a linha traz a coluna: um ficheiro sem descrições ou imagens não apaga
+# as dos produtos existentes (os produtos novos ficam com os valores por defeito)
+OPTIONAL_UPDATE_FIELDS = ['description', 'stock', 'is_active', 'is_featured', 'image']
+TRUE_VALUES = ('1', 'true', 'sim', 'yes', 's', 'y')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def read_rows(f, fmt):
+    """Gera (número da linha, dicionário) sem carregar o ficheiro."""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, ImportRowError(f"JSON inválido: {e}")
+
+
+def parse_bool(value, default):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def parse_decimal(value, field):
+    try:
+        return Decimal(str(value).strip().replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        raise ImportRowError(f"{field} inválido: {value!r}")
+
+
+def parse_variants(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [
+            dict(zip(('name', 'price_extra'), part.rsplit(':', 1))) if ':' in part else {'name': part}
+            for part in value.split('|') if part.strip()
+        ]
+    return [(v['name'].strip(), parse_decimal(v.get('price_extra') or 0, 'price_extra')) for v in value]
+
+
+def parse_images(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split('|')
+    return [name.strip() for name in value if name.strip()]
+
+
+def digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+
+class SlugResolver:
+    """
+    Slugs gerados a partir do nome: dois nomes diferentes que dão o mesmo slug recebem
+    sufixos (-2, -3, ...). Começa com os produtos que já existem, por isso uma linha sem slug
+    com o nome de um produto existente recebe o slug dele (importar de novo não muda nem
+    sobrepõe produtos). Guarda digests de 8 bytes (slug -> nome) e o slug de cada nome.
+    """
+
+    def __init__(self, existing=()):
+        self.seen = {}
+        self.by_name = {}
+        for slug, name in existing:
+            self.claim(slug, name)
+
+    def claim(self, slug, name):
+        """Regista que `slug` pertence ao produto `name` (slug vindo da base de dados ou do ficheiro)."""
+        name_digest = digest(name)
+        self.seen[digest(slug)] = name_digest
+        self.by_name.setdefault(name_digest, slug)
+
+    def resolve(self, name):
+        name_digest = digest(name)
+        known = self.by_name.get(name_digest)
+        if known is not None:
+            return known
+        base = slugify(name)[:45] or 'produto'
+        slug, n = base, 1
+        while True:
+            owner = self.seen.setdefault(digest(slug), name_digest)
+            if owner == name_digest:
+                self.by_name[name_digest] = slug
+                return slug
+            n += 1
+            slug = f"{base}-{n}"
+
+
+class CatalogImporter:
+
+    def __init__(self, batch_size=BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.slugs = SlugResolver(Product.objects.order_by('id').values_list('slug', 'name').iterator())
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.stats = {'rows': 0, 'products': 0, 'variants': 0, 'images': 0, 'categories': 0, 'errors': 0}
+        self.errors = []
+
+    def run(self, f, fmt):
+        rows = read_rows(f, fmt)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self.stats)
+        # bulk_create não dispara sinais: invalida as caches de uma vez no fim
+        reference.invalidate('categories')
+        page_cache.bump_catalogue_version()
+        return self.stats
+
+    def parse(self, row):
+        if isinstance(row, Exception):
+            raise row
+        name = (row.get('name') or '').strip()
+        category = (row.get('category') or '').strip()
+        if not name or not category:
+            raise ImportRowError("name e category são obrigatórios")
+        slug = (row.get('slug') or '').strip()[:50]
+        if slug:
+            self.slugs.claim(slug, name[:255])
+        else:
+            slug = self.slugs.resolve(name[:255])
+        stock = row.get('stock') or 0
+        try:
+            stock = int(stock)
+        except (TypeError, ValueError):
+            raise ImportRowError(f"stock inválido: {stock!r}")
+        return {
+            'category': category,
+            'category_slug': (row.get('category_slug') or '').strip() or slugify(category),
+            'product': Product(
+                name=name[:255], slug=slug, description=row.get('description') or '',
+                price=parse_decimal(row.get('price'), 'price'), stock=max(stock, 0),
+                is_active=parse_bool(row.get('is_active'), True),
+                is_featured=parse_bool(row.get('is_featured'), False),
+                image=(row.get('image') or '').strip() or None,
+            ),
+            'update_fields': tuple(PRODUCT_UPDATE_FIELDS + [field for field in OPTIONAL_UPDATE_FIELDS if field in row]),
+            'variants': parse_variants(row.get('variants')),
+            'images': parse_images(row.get('images')),
+        }
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        parsed = {}
+        for line_number, row in batch:
+            self.stats['rows'] += 1
+            try:
+                item = self.parse(row)
+            except (ImportRowError, KeyError, AttributeError, TypeError) as e:
+                self.stats['errors'] += 1
+                if len(self.errors) < 20:
+                    self.errors.append(f"linha {line_number}: {e}")
+                continue
+            # A mesma linha repetida no lote: fica a última (o upsert não aceita duplicados)
+            parsed[item['product'].slug] = item
+
+        if not parsed:
+            return
+        self.upsert_categories(parsed.values())
+        for item in parsed.values():
+            item['product'].category_id = self.categories[item['category_slug']]
+
+        # Um upsert por conjunto de colunas presentes (num CSV é sempre um só)
+        groups = defaultdict(list)
+        for item in parsed.values():
+            groups[item['update_fields']].append(item['product'])
+        for update_fields, products in groups.items():
+            Product.objects.bulk_create(
+                products, update_conflicts=True, unique_fields=['slug'], update_fields=list(update_fields),
+            )
+        product_ids = dict(Product.objects.filter(slug__in=parsed.keys()).values_list('slug', 'id'))
+        self.stats['products'] += len(parsed)
+
+        variants = {
+            (product_ids[slug], name): ProductVariant(product_id=product_ids[slug], name=name[:100], price_extra=price)
+            for slug, item in parsed.items() for name, price in item['variants']
+        }
+        if variants:
+            ProductVariant.objects.bulk_create(
+                variants.values(), update_conflicts=True, unique_fields=['product', 'name'], update_fields=['price_extra'],
+            )
+            self.stats['variants'] += len(variants)
+
+        gallery = {
+            (product_ids[slug], image): ProductImage(product_id=product_ids[slug], image=image)
+            for slug, item in parsed.items() for image in item['images']
+        }
+        if gallery:
+            ProductImage.objects.bulk_create(gallery.values(), ignore_conflicts=True)
+            self.stats['images'] += len(gallery)
+
+        search.index_products(product_ids.values())
+
+    def upsert_categories(self, items):
+        missing = {item['category_slug']: item['category'] for item in items if item['category_slug'] not in self.categories}
+        if not missing:
+            return
+        Category.objects.bulk_create(
+            [Category(name=name[:255], slug=slug) for slug, name in missing.items()],
+            update_conflicts=True, unique_fields=['slug'], update_fields=['name'],
+        )
+        self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+        self.stats['categories'] += len(missing)
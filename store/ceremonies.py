@@ -0,0 +1,55 @@
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Ceremony
+
+# Inscrições em cerimónias com lotação garantida pela base de dados.
+# Ceremony.registrations_count é incrementado com um único UPDATE condicional
+# (`max_participants = 0 OR registrations_count < max_participants`), na mesma transação que
+# grava a inscrição: dois pedidos simultâneos para o último lugar não passam os dois.
+# Inscrições criadas/apagadas pelo admin atualizam o contador nos sinais (store/signals.py).
+
+
+class CeremonyFullError(Exception):
+    pass
+
+
+def claim_seat(ceremony_id):
+    """Ocupa um lugar se houver. Devolve False se a cerimónia estiver lotada."""
+    return bool(
+        Ceremony.objects.filter(Q(max_participants=0) | Q(registrations_count__lt=F('max_participants')), pk=ceremony_id)
+        .update(registrations_count=F('registrations_count') + 1)
+    )
+
+
+def adjust(ceremony_id, delta):
+    """Soma `delta` ao contador sem verificar a lotação (admin, inscrições apagadas)."""
+    queryset = Ceremony.objects.filter(pk=ceremony_id)
+    if delta < 0:
+        queryset = queryset.filter(registrations_count__gte=-delta)
+    queryset.update(registrations_count=F('registrations_count') + delta)
+
+
+@transaction.atomic
+def register(ceremony, registration):
+    """Grava a inscrição ocupando um lugar; lança CeremonyFullError se já não houver."""
+    if not claim_seat(ceremony.pk):
+        raise CeremonyFullError(ceremony.name)
+    registration.ceremony = ceremony
+    # O lugar já foi contado: o sinal post_save não volta a incrementar
+    registration._seat_claimed = True
+    registration.save()
+    ceremony.registrations_count += 1
+    return registration
+
+
+def recount(apps=global_apps):
+    """Recalcula todos os contadores a partir das inscrições (backfills e dados gerados em bulk)."""
+    Ceremony = apps.get_model('store', 'Ceremony')
+    CeremonyRegistration = apps.get_model('store', 'CeremonyRegistration')
+    counts = (
+        CeremonyRegistration.objects.filter(ceremony=OuterRef('pk')).order_by()
+        .values('ceremony').annotate(total=Count('id')).values('total')
+    )
+    return Ceremony.objects.update(registrations_count=Coalesce(Subquery(counts), Value(0)))
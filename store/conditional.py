@@ -0,0 +1,39 @@
+import hashlib
+from django.views.decorators.http import condition
+from . import reference
+from .page_cache import CATALOGUE
+
+# GET condicional (ETag / Last-Modified) para as páginas do catálogo.
+# O estado da página vem das linhas que ela mostra (id e updated_at dos produtos da página,
+# já lidos para o render e memorizados no pedido) e das versões do catálogo e das
+# configurações, por isso um 304 sai sem render e sem queries extra. O stock disponível
+# não entra nestas páginas (views.product_availability), logo não pode ficar desatualizado.
+
+
+def page_state(request, rows):
+    """Devolve (etag, last_modified) memorizados no pedido, ou (None, None) se a página não tiver produtos."""
+    if not hasattr(request, '_store_page_state'):
+        rows = list(rows)
+        if not rows:
+            request._store_page_state = (None, None)
+            return request._store_page_state
+        versions = [reference.current_version(CATALOGUE), reference.current_version('site_settings')]
+        raw = '|'.join([*(f'{row.pk}:{row.updated_at.isoformat()}' for row in rows), *versions])
+        # O catálogo também muda sem mexer em updated_at (imagens, categorias, configurações)
+        last_modified = max([*(row.updated_at for row in rows), *filter(None, map(reference.version_time, versions))])
+        request._store_page_state = (hashlib.md5(raw.encode()).hexdigest(), last_modified)
+    return request._store_page_state
+
+
+def catalogue_condition(get_rows):
+    """
+    Decorator de views: `get_rows(request, *args, **kwargs)` devolve os produtos que a página
+    mostra. Deve memorizá-los no pedido para que a view os reutilize no render.
+    """
+    def etag(request, *args, **kwargs):
+        return page_state(request, get_rows(request, *args, **kwargs))[0]
+
+    def last_modified(request, *args, **kwargs):
+        return page_state(request, get_rows(request, *args, **kwargs))[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -1,9 +1,12 @@
-from .models import SiteSettings, Category
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
+from . import reference
 
 def store_context(request):
+    # Configurações e categorias vêm da cache de dados de referência (sem queries por página)
     return {
-        'site_settings': SiteSettings.objects.first(),
-        'cart': Cart(request),
-        'categories': Category.objects.all()
-    }
\ No newline at end of file
+        'site_settings': reference.site_settings(request),
+        # Preguiçoso: páginas que não mostram o carrinho não leem a sessão (nem recebem Vary: Cookie)
+        'cart': SimpleLazyObject(lambda: get_cart(request)),
+        'categories': reference.categories(request),
+    }
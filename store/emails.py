@@ -0,0 +1,108 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailOutbox
+
+# Envio de emails através da tabela EmailOutbox.
+# As views só gravam a mensagem (rápido e dentro da transação da encomenda);
+# o comando `send_outbox` envia-as em lotes, com uma só ligação SMTP por lote.
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BASE_RETRY_DELAY = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=6)
+# Enquanto um lote está a ser enviado as mensagens ficam "reservadas" durante este tempo;
+# se o processo morrer a meio, voltam a ficar disponíveis depois disso.
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def build_email(subject, body, recipients, from_email=None):
+    return EmailOutbox(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        to='\n'.join(recipients),
+    )
+
+
+def queue_email(subject, body, recipients, from_email=None):
+    message = build_email(subject, body, recipients, from_email)
+    message.save()
+    return message
+
+
+def queue_order_emails(order):
+    """Confirmação para o cliente e aviso para a loja (uma só query)."""
+    EmailOutbox.objects.bulk_create([
+        build_email(
+            f'Confirmação da Encomenda #{order.id}',
+            f'Olá {order.full_name},\n\nObrigado pela sua encomenda! O total foi de {order.total_price}€.\n\n'
+            'Enviaremos novidades sobre o envio em breve.',
+            [order.email],
+        ),
+        build_email(
+            f'Nova Encomenda #{order.id}',
+            f'Recebeu uma nova encomenda de {order.full_name} no valor de {order.total_price}€.',
+            [settings.ADMIN_NOTIFICATION_EMAIL],
+        ),
+    ])
+
+
+def retry_delay(attempts):
+    return min(BASE_RETRY_DELAY * (2 ** max(attempts - 1, 0)), MAX_RETRY_DELAY)
+
+
+def claim_batch(batch_size):
+    """Reserva o próximo lote de mensagens pendentes (adia-as por CLAIM_LEASE e conta a tentativa)."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = (
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        messages = list(due)
+        for message in messages:
+            message.attempts += 1
+            message.next_attempt_at = now + CLAIM_LEASE
+        EmailOutbox.objects.bulk_update(messages, ['attempts', 'next_attempt_at'])
+    return messages
+
+
+def send_batch(messages, max_attempts=MAX_ATTEMPTS):
+    """Envia as mensagens reservadas por uma única ligação. Devolve (enviadas, falhadas)."""
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning("Não foi possível ligar ao servidor de email: %s", e)
+        failed = [(message, e) for message in messages]
+    else:
+        try:
+            for message in messages:
+                try:
+                    EmailMessage(message.subject, message.body, message.from_email or None,
+                                 message.recipients(), connection=connection).send()
+                    sent.append(message)
+                except Exception as e:
+                    logger.warning("Falha ao enviar email #%s: %s", message.id, e)
+                    failed.append((message, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent:
+        EmailOutbox.objects.filter(id__in=[m.id for m in sent]).update(status='sent', sent_at=now, last_error='')
+    for message, error in failed:
+        message.last_error = str(error)
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+        else:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+    EmailOutbox.objects.bulk_update([m for m, _ in failed], ['status', 'next_attempt_at', 'last_error'])
+    return len(sent), len(failed)
@@ -0,0 +1,267 @@
+import csv
+import re
+from abc import ABC, abstractmethod
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import Order, OrderItem, CeremonyRegistration, Anamnesis, Appointment
+
+# Exportações do admin em CSV ou XLSX, geradas à medida que são enviadas.
+# Cada exportação percorre o queryset com iterator(chunk_size): a memória não depende do
+# número de linhas e o cabeçalho sai antes da primeira query. O XLSX é escrito sem
+# dependências (zip em streaming com uma folha de strings inline).
+
+CHUNK_SIZE = getattr(settings, 'STORE_EXPORT_CHUNK_SIZE', 2000)
+# Linhas acumuladas antes de cada envio (menos yields, sem juntar o ficheiro inteiro)
+ROWS_PER_WRITE = 500
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class Export(ABC):
+    """Uma exportação: cabeçalhos, preparação do queryset e linhas de cada objeto."""
+    filename = None
+    headers = ()
+
+    def prepare(self, queryset):
+        return queryset
+
+    @abstractmethod
+    def rows(self, obj):
+        """Gera as linhas (listas de valores, pela ordem de `headers`) de um objeto."""
+
+    def iter_rows(self, queryset):
+        for obj in self.prepare(queryset).iterator(chunk_size=CHUNK_SIZE):
+            yield from self.rows(obj)
+
+
+class OrderExport(Export):
+    """Uma linha por artigo; encomendas sem artigos ficam numa linha com as colunas do artigo vazias."""
+    filename = 'encomendas'
+    headers = (
+        'Encomenda', 'Data', 'Cliente', 'Email', 'Morada', 'Cidade', 'Estado', 'Pago', 'Método de Pagamento',
+        'Método de Envio', 'Total da Encomenda', 'Produto', 'Quantidade', 'Preço', 'Subtotal',
+    )
+
+    def prepare(self, queryset):
+        # Com chunk_size, o prefetch corre uma vez por bloco de encomendas
+        # (prefetch_related(None) descarta o do admin, que só traz itens sem resumo)
+        return queryset.select_related('payment_method', 'shipping_method').prefetch_related(None).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product').only(
+                'order_id', 'price', 'quantity', 'product__name',
+            ).order_by('id')),
+        )
+
+    def rows(self, order):
+        head = [
+            order.id, order.created_at, order.full_name, order.email, order.address, order.city,
+            order.get_status_display(), order.paid, order.payment_method, order.shipping_method, order.total_price,
+        ]
+        items = order.items.all()
+        if not items:
+            yield head + [None] * 4
+        for item in items:
+            yield head + [item.product.name, item.quantity, item.price, item.get_cost()]
+
+
+class RegistrationExport(Export):
+    filename = 'inscricoes'
+    headers = (
+        'Inscrição', 'Cerimónia', 'Data da Cerimónia', 'Nome', 'Email', 'Método de Pagamento', 'Inscrito em',
+        'Problemas de Saúde', 'Medicação', 'Cirurgias Recentes', 'Objetivos / Intenções', 'Outras Observações',
+    )
+    anamnesis_fields = ('health_issues', 'medications', 'surgeries', 'goals', 'observations')
+
+    def prepare(self, queryset):
+        return queryset.select_related('ceremony', 'payment_method', 'anamnesis')
+
+    def rows(self, registration):
+        try:
+            anamnesis = registration.anamnesis
+        except Anamnesis.DoesNotExist:
+            anamnesis = None
+        yield [
+            registration.id, registration.ceremony.name, registration.ceremony.event_date, registration.full_name,
+            registration.email, registration.payment_method, registration.created_at,
+            *(getattr(anamnesis, field) if anamnesis else None for field in self.anamnesis_fields),
+        ]
+
+
+class AppointmentExport(Export):
+    filename = 'marcacoes'
+    headers = ('Marcação', 'Terapia', 'Cliente', 'Email', 'Início', 'Fim', 'Confirmado', 'Método de Pagamento', 'Criada em')
+
+    def prepare(self, queryset):
+        return queryset.select_related('therapy', 'user', 'payment_method')
+
+    def rows(self, appointment):
+        user = appointment.user
+        yield [
+            appointment.id, appointment.therapy.name, user.get_full_name() or user.username, user.email,
+            appointment.start_time, appointment.end_time, appointment.confirmed, appointment.payment_method,
+            appointment.created_at,
+        ]
+
+
+EXPORTS = {
+    Order: OrderExport(),
+    CeremonyRegistration: RegistrationExport(),
+    Appointment: AppointmentExport(),
+}
+
+
+# Texto que o Excel/LibreOffice interpretariam como fórmula (ex: um nome "=HYPERLINK(...)"
+# escrito por um cliente); recebe um apóstrofo à frente e fica texto simples.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def escape_formula(text):
+    return f"'{text}" if text.startswith(FORMULA_PREFIXES) else text
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Sim' if value else 'Não'
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if timezone.is_aware(value) else value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def cell_text(value):
+    """Texto da célula; os números ficam como estão (um preço negativo não é uma fórmula)."""
+    text = to_text(value)
+    if isinstance(value, (int, float, Decimal)):
+        return text
+    return escape_formula(text)
+
+
+def csv_chunks(headers, rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    # BOM: o Excel abre o ficheiro como UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    pending = 0
+    for row in rows:
+        if not pending:
+            buffer.seek(0)
+            buffer.truncate()
+        writer.writerow([cell_text(value) for value in row])
+        pending += 1
+        if pending == ROWS_PER_WRITE:
+            yield buffer.getvalue()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+# --- XLSX ---
+
+ILLEGAL_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+XLSX_STATIC_FILES = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Exportação" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class ZipSink:
+    """Destino não pesquisável do ZipFile: os bytes escritos são recolhidos e enviados a seguir."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def xlsx_cell(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(ILLEGAL_XML_RE.sub('', cell_text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_chunks(headers, rows):
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_FILES.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + xlsx_row(headers)
+            ).encode())
+            yield sink.drain()
+            pending = []
+            for row in rows:
+                pending.append(xlsx_row(row))
+                if len(pending) == ROWS_PER_WRITE:
+                    sheet.write(''.join(pending).encode())
+                    pending.clear()
+                    yield sink.drain()
+            sheet.write((''.join(pending) + '</sheetData></worksheet>').encode())
+    yield sink.drain()
+
+
+def export_response(queryset, fmt):
+    """StreamingHttpResponse com o queryset (já filtrado) exportado em `fmt` ('csv' ou 'xlsx')."""
+    export = EXPORTS[queryset.model]
+    chunks = csv_chunks if fmt == 'csv' else xlsx_chunks
+    response = StreamingHttpResponse(chunks(export.headers, export.iter_rows(queryset)), content_type=FORMATS[fmt])
+    filename = f"{export.filename}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Proxies (nginx) não devem acumular a resposta antes de a enviar
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,304 @@
+import bisect
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import (
+    Category, Product, Order, OrderItem, Profile, Therapy, Ceremony, CeremonyRegistration, Appointment,
+    PaymentMethod, ShippingMethod,
+)
+from . import ceremonies, page_cache, reference, sales, search
+from .orders import summarize_items
+
+# Gerador de dados sintéticos para testes de carga (`manage.py generate_fake_data`).
+# Cada entidade é dividida em blocos de ids; um bloco é gerado com um Random semeado por
+# (seed, entidade, bloco), por isso o resultado não depende do número de processos.
+# Os ids são reservados antes (a partir do maior id existente) e gravados explicitamente:
+# as encomendas sabem quais são os ids e os preços dos produtos sem fazer queries.
+
+DEFAULT_COUNTS = {
+    'clients': 500_000,
+    'products': 100_000,
+    'orders': 1_000_000,
+    'appointments': 5_000,
+    'registrations': 5_000,
+}
+CATEGORY_NAMES = ['Velas', 'Incensos', 'Cristais', 'Óleos Essenciais', 'Livros', 'Instrumentos', 'Ervas', 'Joias']
+THERAPIES = [('Reiki', 60), ('Massagem Ayurvédica', 90), ('Limpeza Energética', 45), ('Constelação Familiar', 120)]
+CEREMONY_COUNT = 40
+FIRST_NAMES = ['Ana', 'João', 'Maria', 'Pedro', 'Sofia', 'Tiago', 'Inês', 'Rui', 'Marta', 'Luís', 'Beatriz', 'Miguel']
+LAST_NAMES = ['Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues', 'Martins', 'Sousa', 'Gomes']
+CITIES = ['Lisboa', 'Porto', 'Braga', 'Coimbra', 'Faro', 'Aveiro', 'Évora', 'Funchal']
+WORDS = ['lua', 'sol', 'terra', 'água', 'lavanda', 'sálvia', 'âmbar', 'quartzo', 'rosa', 'cedro', 'mirra', 'lótus']
+# (estado, pago, peso)
+ORDER_STATUSES = [('completed', True, 55), ('shipped', True, 10), ('paid', True, 10), ('pending', False, 15), ('canceled', False, 10)]
+CHUNK_SIZE = 5000
+
+
+def product_price(index):
+    """Preço determinístico do produto `index`: as encomendas calculam-no sem ler a base de dados."""
+    return Decimal(150 + (index * 7919) % 9850) / 100
+
+
+def product_name(index):
+    """Nome determinístico do produto `index` (usado no resumo dos artigos das encomendas)."""
+    h = (index * 2654435761) % 2 ** 32
+    return f"{WORDS[h % len(WORDS)].title()} {WORDS[h // len(WORDS) % len(WORDS)]} {index}"
+
+
+@contextmanager
+def historical_dates(*fields):
+    """Permite gravar created_at no passado (desliga auto_now_add nos campos indicados)."""
+    previous = [(field, field.auto_now_add) for field in fields]
+    for field, _ in previous:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in previous:
+            field.auto_now_add = value
+
+
+def chunked(entity, total, chunk_size):
+    return [(entity, start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+class Plan:
+    """Ids reservados e dados pequenos partilhados por todos os processos."""
+
+    def __init__(self, seed, counts, days=730):
+        self.seed = seed
+        self.counts = counts
+        self.now = timezone.now()
+        self.days = days
+        self.password = make_password('teste12345')
+        self.base = {}
+
+    def prepare(self):
+        """Cria as tabelas pequenas e reserva os intervalos de ids (corre no processo principal)."""
+        self.categories = [
+            Category.objects.get_or_create(slug=slugify(name), defaults={'name': name})[0].id for name in CATEGORY_NAMES
+        ]
+        self.therapies = [
+            (Therapy.objects.get_or_create(
+                slug=slugify(name),
+                defaults={'name': name, 'description': '-', 'image': '', 'price': Decimal('45.00'), 'duration_minutes': minutes},
+            )[0].id, minutes)
+            for name, minutes in THERAPIES
+        ]
+        existing = list(Ceremony.objects.values_list('id', flat=True)[:CEREMONY_COUNT])
+        rng = random.Random(f"{self.seed}:ceremonies")
+        Ceremony.objects.bulk_create([
+            Ceremony(name=f"Cerimónia {rng.choice(WORDS).title()} {i}", description='-', image='',
+                     event_date=self.now + timedelta(days=rng.randint(-365, 180)), max_participants=rng.choice([0, 20, 50]))
+            for i in range(CEREMONY_COUNT - len(existing))
+        ])
+        self.ceremonies = list(Ceremony.objects.values_list('id', flat=True)[:CEREMONY_COUNT])
+        self.prepare_seats()
+        self.payment_methods = list(PaymentMethod.objects.values_list('id', flat=True)) or [
+            PaymentMethod.objects.create(name=name).id for name in ('MB Way', 'Transferência', 'Multibanco')
+        ]
+        self.shipping_methods = list(ShippingMethod.objects.values_list('id', flat=True)) or [
+            ShippingMethod.objects.create(name=name, price=price).id for name, price in (('CTT', '3.50'), ('Estafeta', '6.00'))
+        ]
+        for key, model in (('clients', User), ('products', Product), ('orders', Order), ('items', OrderItem),
+                           ('profiles', Profile), ('appointments', Appointment), ('registrations', CeremonyRegistration)):
+            self.base[key] = (model.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        # Cada encomenda tem no máximo 5 artigos: os ids dos artigos são base + 5 * índice + posição
+        self.items_per_order = 5
+
+    def prepare_seats(self):
+        """
+        Lugares para as inscrições, sem passar de max_participants (contando as que já existem).
+        As primeiras inscrições ocupam os lugares das cerimónias com limite, por blocos
+        (`seat_ends` acumulado); as restantes vão para as cerimónias sem limite. Se não houver
+        nenhuma sem limite, o número de inscrições é reduzido aos lugares livres.
+        """
+        self.limited_ceremonies, self.seat_ends, self.open_ceremonies = [], [], []
+        free = 0
+        rows = (Ceremony.objects.filter(id__in=self.ceremonies).annotate(taken=Count('registrations'))
+                .order_by('id').values_list('id', 'max_participants', 'taken'))
+        for ceremony_id, max_participants, taken in rows:
+            if not max_participants:
+                self.open_ceremonies.append(ceremony_id)
+            elif taken < max_participants:
+                free += max_participants - taken
+                self.limited_ceremonies.append(ceremony_id)
+                self.seat_ends.append(free)
+        if not self.open_ceremonies:
+            self.counts['registrations'] = min(self.counts['registrations'], free)
+
+    def ceremony_for(self, index, rng):
+        """Cerimónia da inscrição número `index` (não depende da ordem em que os blocos correm)."""
+        if self.seat_ends and index < self.seat_ends[-1]:
+            return self.limited_ceremonies[bisect.bisect_right(self.seat_ends, index)]
+        return rng.choice(self.open_ceremonies)
+
+    def stages(self, chunk_size=CHUNK_SIZE):
+        first = chunked('clients', self.counts['clients'], chunk_size) + chunked('products', self.counts['products'], chunk_size)
+        second = (chunked('orders', self.counts['orders'], chunk_size)
+                  + chunked('appointments', self.counts['appointments'], chunk_size)
+                  + chunked('registrations', self.counts['registrations'], chunk_size))
+        return [first, second]
+
+    def client_id(self, rng):
+        return self.base['clients'] + rng.randrange(self.counts['clients']) if self.counts['clients'] else None
+
+    def past(self, rng):
+        return self.now - timedelta(seconds=rng.randrange(self.days * 24 * 3600))
+
+
+def generate_clients(plan, rng, start, stop):
+    users, profiles = [], []
+    for i in range(start, stop):
+        user_id = plan.base['clients'] + i
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(User(
+            id=user_id, username=f"cliente{user_id}", email=f"cliente{user_id}@exemplo.com", password=plan.password,
+            first_name=first, last_name=last, date_joined=plan.past(rng),
+        ))
+        profiles.append(Profile(
+            id=plan.base['profiles'] + i, user_id=user_id, phone=f"9{rng.randrange(10**8):08d}",
+            address=f"Rua {rng.choice(LAST_NAMES)} {rng.randint(1, 300)}", postal_code=f"{rng.randint(1000, 9999)}-{rng.randint(100, 999)}",
+        ))
+    User.objects.bulk_create(users)
+    Profile.objects.bulk_create(profiles)
+
+
+def generate_products(plan, rng, start, stop):
+    created_at = Product._meta.get_field('created_at')
+    with historical_dates(created_at):
+        Product.objects.bulk_create([
+            Product(
+                id=plan.base['products'] + i, category_id=rng.choice(plan.categories),
+                name=product_name(i), slug=f"produto-{plan.base['products'] + i}",
+                description=' '.join(rng.choices(WORDS, k=30)), price=product_price(i), stock=rng.randint(0, 200),
+                is_active=rng.random() > 0.05, is_featured=rng.random() < 0.01, created_at=plan.past(rng),
+            )
+            for i in range(start, stop)
+        ])
+
+
+def generate_orders(plan, rng, start, stop):
+    statuses = [(status, paid) for status, paid, _ in ORDER_STATUSES]
+    weights = [weight for _, _, weight in ORDER_STATUSES]
+    orders, items = [], []
+    for i in range(start, stop):
+        order_id = plan.base['orders'] + i
+        status, paid = rng.choices(statuses, weights)[0]
+        total = Decimal('0.00')
+        lines = []
+        for position in range(rng.randint(1, plan.items_per_order)):
+            index = rng.randrange(plan.counts['products'])
+            quantity = rng.randint(1, 3)
+            price = product_price(index)
+            total += price * quantity
+            lines.append((quantity, product_name(index)))
+            items.append(OrderItem(
+                id=plan.base['items'] + i * plan.items_per_order + position, order_id=order_id,
+                product_id=plan.base['products'] + index, price=price, quantity=quantity,
+            ))
+        orders.append(Order(
+            id=order_id, user_id=plan.client_id(rng) if rng.random() < 0.7 else None,
+            full_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", email=f"encomenda{order_id}@exemplo.com",
+            address=f"Rua {rng.choice(LAST_NAMES)} {rng.randint(1, 300)}", city=rng.choice(CITIES),
+            created_at=plan.past(rng), paid=paid, status=status, total_price=total,
+            items_summary=summarize_items(lines), items_count=sum(quantity for quantity, _ in lines),
+            payment_method_id=rng.choice(plan.payment_methods), shipping_method_id=rng.choice(plan.shipping_methods),
+        ))
+    with historical_dates(Order._meta.get_field('created_at')):
+        Order.objects.bulk_create(orders)
+    OrderItem.objects.bulk_create(items)
+
+
+def generate_appointments(plan, rng, start, stop):
+    appointments = []
+    for i in range(start, stop):
+        therapy_id, minutes = rng.choice(plan.therapies)
+        start_time = (plan.now + timedelta(days=rng.randint(-365, 90))).replace(hour=rng.randint(9, 18), minute=0, second=0, microsecond=0)
+        appointments.append(Appointment(
+            id=plan.base['appointments'] + i, user_id=plan.client_id(rng), therapy_id=therapy_id,
+            start_time=start_time, end_time=start_time + timedelta(minutes=minutes), confirmed=rng.random() < 0.7,
+            payment_method_id=rng.choice(plan.payment_methods),
+        ))
+    Appointment.objects.bulk_create(appointments)
+
+
+def generate_registrations(plan, rng, start, stop):
+    CeremonyRegistration.objects.bulk_create([
+        CeremonyRegistration(
+            id=plan.base['registrations'] + i, ceremony_id=plan.ceremony_for(i, rng), user_id=plan.client_id(rng),
+            full_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", email=f"inscricao{i}@exemplo.com",
+            payment_method_id=rng.choice(plan.payment_methods),
+        )
+        for i in range(start, stop)
+    ])
+
+
+GENERATORS = {
+    'clients': generate_clients,
+    'products': generate_products,
+    'orders': generate_orders,
+    'appointments': generate_appointments,
+    'registrations': generate_registrations,
+}
+
+
+def run_chunk(plan, task):
+    entity, start, stop = task
+    rng = random.Random(f"{plan.seed}:{entity}:{start}")
+    with transaction.atomic():
+        GENERATORS[entity](plan, rng, start, stop)
+    return entity, stop - start
+
+
+def reset_sequences():
+    """Depois de ids explícitos, as sequências (PostgreSQL) têm de avançar para o maior id."""
+    models = [User, Profile, Product, Order, OrderItem, Appointment, CeremonyRegistration]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def generate(plan, workers=1, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Gera tudo por fases (clientes e produtos antes das encomendas/marcações/inscrições).
+    Com workers > 1 os blocos de cada fase correm num pool de processos (fork); em SQLite
+    as escritas são serializadas pela base de dados, por isso só compensa em PostgreSQL.
+    """
+    plan.prepare()
+    done = dict.fromkeys(GENERATORS, 0)
+    for tasks in plan.stages(chunk_size):
+        if workers > 1:
+            # Cada processo abre a sua ligação: não pode herdar a do pai
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                results = pool.map(run_chunk, [plan] * len(tasks), tasks)
+                for entity, count in results:
+                    done[entity] += count
+                    if progress:
+                        progress(done)
+        else:
+            for task in tasks:
+                entity, count = run_chunk(plan, task)
+                done[entity] += count
+                if progress:
+                    progress(done)
+    reset_sequences()
+    # bulk_create não dispara sinais: índice de pesquisa, resumos de vendas, lugares e caches de uma vez no fim
+    search.rebuild()
+    sales.rebuild()
+    ceremonies.recount()
+    reference.invalidate('categories')
+    page_cache.bump_catalogue_version()
+    return done
@@ -1,10 +1,19 @@
 from django import forms
 from django.contrib.auth.models import User
-from .models import Order, Client, CeremonyRegistration, Anamnesis, PaymentMethod, Appointment
+from .models import Order, Client, CeremonyRegistration, Anamnesis, PaymentMethod, ShippingMethod, Appointment
+from . import reference
 from django.utils import timezone
 from datetime import timedelta
 
+def use_cached_choices(field, objects):
+    """Preenche as opções a partir dos dados de referência em cache (mostrar o formulário não faz queries)."""
+    empty = [('', field.empty_label)] if field.empty_label is not None else []
+    field.choices = empty + [(obj.pk, str(obj)) for obj in objects]
+
 class OrderCreateForm(forms.ModelForm):
+    # Gerado ao mostrar o formulário; reenviar o mesmo token devolve a encomenda já criada
+    checkout_token = forms.CharField(widget=forms.HiddenInput, max_length=64)
+
     class Meta:
         model = Order
         fields = ['full_name', 'email', 'address', 'city', 'payment_method', 'shipping_method']
@@ -12,6 +21,13 @@ class OrderCreateForm(forms.ModelForm):
             'address': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['payment_method'].queryset = PaymentMethod.objects.filter(is_active=True)
+        self.fields['shipping_method'].queryset = ShippingMethod.objects.filter(is_active=True)
+        use_cached_choices(self.fields['payment_method'], reference.payment_methods())
+        use_cached_choices(self.fields['shipping_method'], reference.shipping_methods())
+
 class UserRegisterForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput, label="Palavra-passe")
     confirm_password = forms.CharField(widget=forms.PasswordInput, label="Confirmar Palavra-passe")
@@ -55,6 +71,10 @@ class CeremonyRegistrationForm(forms.ModelForm):
         model = CeremonyRegistration
         fields = ['full_name', 'email', 'payment_method']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_cached_choices(self.fields['payment_method'], reference.payment_methods())
+
 class AnamnesisForm(forms.ModelForm):
     class Meta:
         model = Anamnesis
@@ -88,6 +108,10 @@ class AppointmentForm(forms.ModelForm):
         model = Appointment
         fields = ['start_time', 'payment_method']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_cached_choices(self.fields['payment_method'], reference.payment_methods())
+
     def clean_start_time(self):
         start_time = self.cleaned_data['start_time']
         if start_time < timezone.now():
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from .page_cache import bump_catalogue_version
+
+# Versões redimensionadas (WebP e JPEG) das imagens carregadas no admin.
+# Ficam ao lado do original: products/vela.jpg -> products/vela.w640.webp, products/vela.w640.jpg
+# São geradas num pool de processos depois do commit (store/signals.py), nunca no pedido
+# do admin; `python manage.py generate_renditions` gera as que faltam nas imagens antigas.
+# A tag {% responsive_image %} (templatetags/store_images.py) monta o srcset com as que existem.
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = tuple(getattr(settings, 'STORE_IMAGE_WIDTHS', (320, 640, 1024, 1600)))
+FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 6}), ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}))
+POOL_WORKERS = getattr(settings, 'STORE_IMAGE_WORKERS', 2)
+# Segundos que as larguras disponíveis de cada imagem ficam na cache
+WIDTHS_TIMEOUT = 24 * 3600
+MISSING_WIDTHS_TIMEOUT = 60
+
+# (modelo, campo) com imagens que têm versões redimensionadas
+IMAGE_FIELDS = (
+    ('Product', 'image'),
+    ('ProductImage', 'image'),
+    ('Therapy', 'image'),
+    ('Ceremony', 'image'),
+    ('SiteSettings', 'banner_image'),
+)
+
+_pool = None
+
+
+def rendition_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f"{root}.w{width}.{ext}"
+
+
+def is_rendition(name):
+    root, ext = os.path.splitext(name)
+    suffix = os.path.splitext(root)[1]
+    return ext[1:] in ('webp', 'jpg') and suffix.startswith('.w') and suffix[2:].isdigit()
+
+
+def widths_key(name):
+    return f"store:renditions:{hashlib.md5(name.encode()).hexdigest()}"
+
+
+def available_widths(name, storage=default_storage):
+    """
+    Larguras com versão JPEG já gerada (o WebP é gravado antes, na mesma passagem).
+    Guardadas na cache: o render não faz um storage.exists por largura em cada imagem.
+    generate_renditions apaga a entrada quando grava versões novas.
+    """
+    key = widths_key(name)
+    widths = cache.get(key)
+    if widths is None:
+        widths = [width for width in WIDTHS if storage.exists(rendition_name(name, width, 'jpg'))]
+        # Sem versões (ainda a gerar noutro processo): volta a verificar pouco depois
+        cache.set(key, widths, WIDTHS_TIMEOUT if widths else MISSING_WIDTHS_TIMEOUT)
+    return widths
+
+
+def missing_renditions(name, original_width=None, storage=default_storage):
+    """Nomes das versões que faltam (só as mais estreitas do que o original, se a largura for conhecida)."""
+    return [
+        rendition_name(name, width, ext) for width in WIDTHS for ext, _, _ in FORMATS
+        if (original_width is None or width < original_width) and not storage.exists(rendition_name(name, width, ext))
+    ]
+
+
+def generate_renditions(name, force=False, storage=default_storage):
+    """
+    Gera as versões de `name` mais estreitas do que o original. Devolve quantos ficheiros gravou.
+    Corre nos processos do pool: só usa o storage, nunca a base de dados.
+    Os nomes das versões são fixos, por isso se já existirem todas o ficheiro nem é aberto;
+    se faltar alguma, lê-se só o cabeçalho (largura) antes de decidir descodificar a imagem.
+    """
+    if not force and not missing_renditions(name, storage=storage):
+        return 0
+    with storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        if not force and not missing_renditions(name, original.width, storage):
+            return 0
+        original.load()
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    written = 0
+    for width in WIDTHS:
+        if width >= original.width:
+            break
+        height = round(original.height * width / original.width)
+        resized = None
+        for ext, pil_format, options in FORMATS:
+            target = rendition_name(name, width, ext)
+            if not force and storage.exists(target):
+                continue
+            if resized is None:
+                resized = original.resize((width, height), Image.LANCZOS)
+            image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+    if written:
+        cache.delete(widths_key(name))
+    return written
+
+
+def _generate(name, force=False):
+    try:
+        return name, generate_renditions(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+def create_pool(workers=POOL_WORKERS):
+    # Método de arranque da plataforma (spawn no Windows e no macOS): os processos começam
+    # sem Django carregado, por isso cada um corre django.setup() antes da primeira tarefa
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+
+def _discard_pool(pool):
+    """Esquece um pool avariado (um processo morreu): o próximo schedule cria outro."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _log_result(pool, name, future):
+    try:
+        name, written, error = future.result()
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        written, error = 0, str(e) or "processo terminado"
+    except Exception as e:
+        written, error = 0, str(e)
+    if error:
+        logger.warning("Falha ao gerar versões de %s: %s", name, error)
+    elif written:
+        # As páginas em cache ainda apontam para o original
+        bump_catalogue_version()
+
+
+def schedule(names):
+    """
+    Envia imagens para o pool de processos sem esperar pelo resultado.
+    Corre depois do commit do admin: uma falha aqui fica no log e nunca chega ao pedido.
+    """
+    global _pool
+    for name in filter(None, names):
+        pool = _pool
+        try:
+            if pool is None:
+                pool = _pool = create_pool()
+            pool.submit(_generate, name).add_done_callback(partial(_log_result, pool, name))
+        except BrokenProcessPool as e:
+            _discard_pool(pool)
+            logger.warning("Falha ao gerar versões de %s: %s", name, e)
+        except Exception as e:
+            logger.warning("Falha ao gerar versões de %s: %s", name, e)
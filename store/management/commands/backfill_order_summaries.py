@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.orders import backfill_items_summaries
+
+
+class Command(BaseCommand):
+    help = "Preenche o resumo dos artigos (items_summary/items_count) das encomendas criadas antes do campo existir."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Encomendas por lote.")
+        parser.add_argument('--all', action='store_true', help="Recalcula todas as encomendas, não só as que não têm resumo.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size tem de ser maior que zero.")
+
+        def progress(done):
+            if done % (options['batch_size'] * 20) == 0:
+                self.stdout.write(f"  {done} encomendas")
+
+        total = backfill_items_summaries(options['batch_size'], only_missing=not options['all'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Encomendas atualizadas: {total}."))
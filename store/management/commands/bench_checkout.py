@@ -0,0 +1,210 @@
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Sum
+from django.test import Client as TestClient
+from store import reservations
+from store.cart import CART_SESSION_KEY
+from store.models import Category, Product, Order, OrderItem
+
+# Benchmark de concorrência do checkout.
+# Lança N processos que fazem checkout em simultâneo através do test client do Django,
+# a maioria a disputar as últimas unidades de um único produto, e verifica no fim
+# que o stock nunca foi vendido a mais.
+
+HOT_PRODUCT_SLUG = 'bench-hot-product'
+FORM_DATA = {'full_name': 'Benchmark', 'email': 'bench@exemplo.com', 'address': 'Rua do Teste', 'city': 'Lisboa'}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def release_cart(client):
+    """Liberta as reservas que o carrinho deste cliente ainda tenha (checkout falhado)."""
+    cart_token = client.session.get(CART_SESSION_KEY)
+    if cart_token:
+        try:
+            reservations.release(cart_token)
+        except OperationalError:
+            pass
+
+
+def run_worker(worker_id, options, hot_id, cold_ids, barrier, results):
+    # Cada processo abre a sua própria ligação à base de dados
+    connections.close_all()
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    # Os erros de lock são contabilizados no relatório; não é preciso o traceback de cada um
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    rng = random.Random(options['seed'] + worker_id)
+    samples = []
+    update_times = []
+
+    def time_stock_updates(execute, sql, params, many, context):
+        # O UPDATE condicional ao stock é onde os pedidos esperam pelo lock
+        if sql.startswith('UPDATE "store_product"'):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                update_times.append(time.perf_counter() - start)
+        return execute(sql, params, many, context)
+
+    barrier.wait()
+    with connection.execute_wrapper(time_stock_updates):
+        for _ in range(options['orders']):
+            client = TestClient()
+            product_id = hot_id if rng.random() < options['hot_ratio'] else rng.choice(cold_ids)
+            try:
+                response = client.post(f'/carrinho/api/adicionar/{product_id}/',
+                                       {'quantity': rng.randint(1, options['max_quantity'])})
+            except OperationalError:
+                samples.append(('cart_add_failed', 0.0))
+                continue
+            if response.status_code == 409:
+                # As unidades que restam estão reservadas por outros carrinhos: não há checkout
+                samples.append(('reserved_out', 0.0))
+                continue
+            start = time.perf_counter()
+            try:
+                response = client.post('/checkout/', {**FORM_DATA, 'checkout_token': uuid.uuid4().hex})
+                if response.status_code != 200:
+                    outcome = 'empty_cart'
+                elif b'Stock insuficiente' in response.content:
+                    outcome = 'out_of_stock'
+                else:
+                    outcome = 'ok'
+            except OperationalError as e:
+                outcome = 'locked' if 'locked' in str(e) else 'db_error'
+            except Exception:
+                outcome = 'error'
+            samples.append((outcome, time.perf_counter() - start))
+            release_cart(client)
+    results.put({'samples': samples, 'update_times': update_times})
+
+
+class Command(BaseCommand):
+    help = "Benchmark de checkouts concorrentes (débito, latência, erros de lock e verificação de stock)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Número de processos.")
+        parser.add_argument('--orders', type=int, default=50, help="Checkouts por processo.")
+        parser.add_argument('--hot-stock', type=int, default=20, help="Stock inicial do produto disputado.")
+        parser.add_argument('--hot-ratio', type=float, default=0.8, help="Fração de checkouts no produto disputado.")
+        parser.add_argument('--cold-products', type=int, default=50, help="Produtos com stock abundante.")
+        parser.add_argument('--max-quantity', type=int, default=2, help="Quantidade máxima por encomenda.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--sqlite', help="Ficheiro SQLite (WAL) a usar; por defeito um ficheiro temporário novo.")
+        parser.add_argument('--busy-timeout', type=float, default=5.0, help="Timeout de lock do SQLite (segundos).")
+        parser.add_argument('--deferred', action='store_true',
+                            help="Usa transações DEFERRED no SQLite, para comparar com o IMMEDIATE das settings.")
+        parser.add_argument('--use-default-database', action='store_true',
+                            help="Usa a base de dados configurada (ex: PostgreSQL local) em vez de um ficheiro SQLite.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['orders'] < 1:
+            raise CommandError("--workers e --orders têm de ser maiores que zero.")
+
+        if not options['use_default_database']:
+            self.use_sqlite_file(options)
+        vendor = connection.vendor
+
+        hot_id, cold_ids = self.prepare_catalogue(options)
+        orders_before = set(Order.objects.values_list('id', flat=True))
+        connections.close_all()
+
+        ctx = multiprocessing.get_context('fork')
+        barrier = ctx.Barrier(options['workers'] + 1)
+        results = ctx.Queue()
+        processes = [
+            ctx.Process(target=run_worker, args=(i, options, hot_id, cold_ids, barrier, results))
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        collected = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        self.report(options, vendor, collected, elapsed, hot_id, orders_before)
+
+    def use_sqlite_file(self, options):
+        path = options['sqlite'] or os.path.join(tempfile.mkdtemp(prefix='bench_checkout_'), 'bench.sqlite3')
+        connections.close_all()
+        db = connections['default'].settings_dict
+        db['ENGINE'] = 'django.db.backends.sqlite3'
+        db['NAME'] = path
+        db.setdefault('OPTIONS', {})['timeout'] = options['busy_timeout']
+        db['OPTIONS']['transaction_mode'] = 'DEFERRED' if options['deferred'] else 'IMMEDIATE'
+        call_command('migrate', verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        self.stdout.write(f"Base de dados SQLite (WAL): {path}")
+
+    def prepare_catalogue(self, options):
+        category, _ = Category.objects.get_or_create(slug='bench', defaults={'name': 'Benchmark'})
+        hot, _ = Product.objects.update_or_create(
+            slug=HOT_PRODUCT_SLUG,
+            defaults={'category': category, 'name': 'Produto Disputado', 'price': '10.00',
+                      'stock': options['hot_stock'], 'is_active': True},
+        )
+        cold_ids = []
+        for i in range(options['cold_products']):
+            product, _ = Product.objects.update_or_create(
+                slug=f'bench-cold-{i}',
+                defaults={'category': category, 'name': f'Produto Benchmark {i}', 'price': '5.00',
+                          'stock': 1_000_000, 'is_active': True},
+            )
+            cold_ids.append(product.id)
+        return hot.id, cold_ids
+
+    def report(self, options, vendor, collected, elapsed, hot_id, orders_before):
+        samples = [sample for result in collected for sample in result['samples']]
+        update_times = [t for result in collected for t in result['update_times']]
+        outcomes = {}
+        for outcome, _ in samples:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        latencies = [duration for outcome, duration in samples if outcome in ('ok', 'out_of_stock')]
+
+        new_orders = Order.objects.exclude(id__in=orders_before)
+        sold = OrderItem.objects.filter(order__in=new_orders, product_id=hot_id).aggregate(total=Sum('quantity'))['total'] or 0
+        remaining = Product.objects.get(id=hot_id).stock
+        oversold = max(0, sold - options['hot_stock'])
+        consistent = sold + remaining == options['hot_stock']
+
+        ms = lambda seconds: f"{seconds * 1000:.1f} ms"
+        self.stdout.write(f"\nBase de dados: {vendor} | processos: {options['workers']} | checkouts: {len(samples)}")
+        self.stdout.write(f"Tempo total: {elapsed:.2f} s | encomendas/s: {outcomes.get('ok', 0) / elapsed:.1f}")
+        self.stdout.write(f"Resultados: {', '.join(f'{k}={v}' for k, v in sorted(outcomes.items()))}")
+        self.stdout.write(
+            f"Latência checkout: p50={ms(percentile(latencies, 50))} p95={ms(percentile(latencies, 95))} "
+            f"p99={ms(percentile(latencies, 99))}"
+        )
+        if update_times:
+            self.stdout.write(
+                f"Espera no UPDATE de stock: média={ms(statistics.mean(update_times))} "
+                f"p95={ms(percentile(update_times, 95))} máx={ms(max(update_times))}"
+            )
+        self.stdout.write(
+            f"Produto disputado: stock inicial={options['hot_stock']} vendido={sold} restante={remaining}"
+        )
+        if consistent and not oversold:
+            self.stdout.write(self.style.SUCCESS("Invariante de stock OK (sem vendas a mais)."))
+        else:
+            self.stdout.write(self.style.ERROR(f"Invariante de stock FALHOU: vendido a mais={oversold}."))
@@ -0,0 +1,23 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store.media import COMPRESSIBLE_EXTENSIONS, compress_file
+
+
+class Command(BaseCommand):
+    help = "Cria versões .gz dos ficheiros de media de texto (SVG, CSV, ...) quando compensa."
+
+    def handle(self, *args, **options):
+        created = skipped = 0
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                if not filename.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                    continue
+                path = os.path.join(directory, filename)
+                if os.path.exists(path + '.gz') and os.path.getmtime(path + '.gz') >= os.path.getmtime(path):
+                    skipped += 1
+                elif compress_file(path):
+                    created += 1
+                else:
+                    skipped += 1
+        self.stdout.write(self.style.SUCCESS(f"Ficheiros comprimidos: {created} | ignorados: {skipped}."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store import reservations
+
+
+class Command(BaseCommand):
+    help = "Apaga em lote as reservas de stock expiradas."
+
+    def handle(self, *args, **options):
+        deleted = reservations.expire()
+        self.stdout.write(self.style.SUCCESS(f"Reservas expiradas apagadas: {deleted}."))
@@ -0,0 +1,49 @@
+import os
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from store import images
+from store.storage import BLOB_DIR, BLOB_RE, media_storage
+
+
+class Command(BaseCommand):
+    help = "Apaga os blobs de media (e as suas versões redimensionadas) que nenhum registo usa."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Mostra o que seria apagado sem apagar.")
+        parser.add_argument('--min-age', type=float, default=24,
+                            help="Só apaga blobs com mais de N horas (uploads cujo registo ainda não foi gravado).")
+
+    def handle(self, *args, **options):
+        storage = media_storage()
+        referenced = set()
+        for model_name, field in images.IMAGE_FIELDS:
+            model = apps.get_model('store', model_name)
+            for name in model.objects.values_list(field, flat=True).iterator():
+                match = BLOB_RE.match(name or '')
+                if match:
+                    referenced.add(match['digest'])
+
+        cutoff = time.time() - options['min_age'] * 3600
+        root = storage.path(BLOB_DIR)
+        deleted = kept = freed = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                match = BLOB_RE.match(name)
+                if match is None or match['digest'] in referenced or os.path.getmtime(path) > cutoff:
+                    kept += 1
+                    continue
+                size = os.path.getsize(path)
+                if options['dry_run']:
+                    self.stdout.write(f"  {name}")
+                else:
+                    storage.delete(name)
+                deleted += 1
+                freed += size
+
+        action = "A apagar" if options['dry_run'] else "Apagados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action}: {deleted} ficheiros ({freed / 1024 / 1024:.1f} MB) | mantidos: {kept}."
+        ))
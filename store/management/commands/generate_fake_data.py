@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store import fake_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos para testes de carga (clientes, produtos, encomendas, marcações e inscrições). "
+        "A mesma seed numa base de dados vazia gera sempre os mesmos dados, com qualquer número de processos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Multiplica os volumes por defeito (ex: 0.01 para um ensaio rápido).")
+        for entity, count in fake_data.DEFAULT_COUNTS.items():
+            parser.add_argument(f'--{entity}', type=int, help=f"Por defeito {count} × scale.")
+        parser.add_argument('--days', type=int, default=730, help="Janela (dias para trás) das datas das encomendas.")
+        parser.add_argument('--workers', type=int, default=1, help="Processos em paralelo (compensa em PostgreSQL).")
+        parser.add_argument('--chunk-size', type=int, default=fake_data.CHUNK_SIZE, help="Linhas por bulk_create/transação.")
+
+    def handle(self, *args, **options):
+        counts = {
+            entity: options[entity] if options[entity] is not None else int(count * options['scale'])
+            for entity, count in fake_data.DEFAULT_COUNTS.items()
+        }
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size e --workers têm de ser maiores que zero.")
+        if any(counts[entity] for entity in ('orders', 'appointments', 'registrations')) and not counts['clients']:
+            raise CommandError("São precisos clientes para gerar encomendas, marcações e inscrições.")
+        if counts['orders'] and not counts['products']:
+            raise CommandError("São precisos produtos para gerar encomendas.")
+
+        self.stdout.write(", ".join(f"{entity}: {count}" for entity, count in counts.items()))
+        started = time.perf_counter()
+        last = [started]
+
+        def progress(done):
+            now = time.perf_counter()
+            if now - last[0] >= 5:
+                last[0] = now
+                self.stdout.write(f"  {now - started:.0f} s | " + ", ".join(f"{e}: {n}" for e, n in done.items()))
+
+        plan = fake_data.Plan(options['seed'], counts, days=options['days'])
+        done = fake_data.generate(plan, workers=options['workers'], chunk_size=options['chunk_size'], progress=progress)
+        # As inscrições podem ser menos do que as pedidas (lotação das cerimónias)
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {time.perf_counter() - started:.1f} s: " + ", ".join(f"{e}: {n}" for e, n in done.items())
+        ))
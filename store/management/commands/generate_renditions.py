@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from store import images
+from store.page_cache import bump_catalogue_version
+
+
+class Command(BaseCommand):
+    help = "Gera as versões WebP/JPEG redimensionadas das imagens existentes (num pool de processos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=images.POOL_WORKERS, help="Número de processos.")
+        parser.add_argument('--force', action='store_true', help="Volta a gerar versões que já existem.")
+
+    def handle(self, *args, **options):
+        names = set()
+        for model_name, field in images.IMAGE_FIELDS:
+            model = apps.get_model('store', model_name)
+            names.update(model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                         .values_list(field, flat=True).iterator())
+        names = sorted(names)
+        self.stdout.write(f"Imagens: {len(names)}")
+
+        written = failed = 0
+        with images.create_pool(options['workers']) as pool:
+            futures = [pool.submit(images._generate, name, options['force']) for name in names]
+            for done, future in enumerate(futures, 1):
+                name, count, error = future.result()
+                written += count
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                if done % 100 == 0:
+                    self.stdout.write(f"  {done}/{len(names)}")
+
+        if written:
+            # As páginas em cache passam a usar as novas versões
+            bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(f"Ficheiros gerados: {written} | imagens com erro: {failed}."))
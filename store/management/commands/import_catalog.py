@@ -0,0 +1,40 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog_import import BATCH_SIZE, CatalogImporter
+
+
+class Command(BaseCommand):
+    help = "Importa/atualiza o catálogo (categorias, produtos, variantes, imagens) a partir de CSV ou JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Ficheiro .csv ou .jsonl")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help="Por defeito, deduzido da extensão.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Linhas por lote (uma transação por lote).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if not os.path.isfile(path):
+            raise CommandError(f"Ficheiro não encontrado: {path}")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size tem de ser maior que zero.")
+
+        started = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {stats['rows']} linhas | {stats['rows'] / elapsed:.0f} linhas/s | erros: {stats['errors']}")
+
+        importer = CatalogImporter(batch_size=options['batch_size'], progress=progress)
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            stats = importer.run(f, fmt)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {time.perf_counter() - started:.1f} s: {stats['products']} produtos, "
+            f"{stats['variants']} variantes, {stats['images']} imagens, {stats['categories']} categorias novas, "
+            f"{stats['errors']} linhas com erro."
+        ))
+        self.stdout.write("Para gerar as versões redimensionadas das imagens: python manage.py generate_renditions")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from store import page_cache
+
+
+class Command(BaseCommand):
+    help = "Mostra a taxa de acertos da cache de páginas (use --reset para recomeçar a contagem)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Apaga os contadores depois de os mostrar.")
+
+    def handle(self, *args, **options):
+        stats = page_cache.stats()
+        self.stdout.write(
+            f"Acertos: {stats['hits']} | Falhas: {stats['misses']} | Taxa de acertos: {stats['ratio']:.1%}"
+        )
+        if options['reset']:
+            page_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Contadores apagados."))
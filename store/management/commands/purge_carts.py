@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store.models import StoredCart
+
+
+class Command(BaseCommand):
+    help = "Apaga carrinhos anónimos sem atividade (a sessão que os referia já expirou)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SESSION_COOKIE_AGE // 86400,
+                            help="Dias sem atividade (por defeito, a duração da sessão).")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = StoredCart.objects.filter(user__isnull=True, updated_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Apagados {deleted} registos de carrinhos antigos."))
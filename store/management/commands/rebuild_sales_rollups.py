@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from store import sales
+
+
+class Command(BaseCommand):
+    help = "Recalcula as tabelas de resumo das vendas (DailySales e DailyProductSales) a partir das encomendas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Só a partir deste dia (AAAA-MM-DD). Por defeito, tudo.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since tem de ser uma data AAAA-MM-DD.")
+        days = sales.rebuild(since=since)
+        self.stdout.write(self.style.SUCCESS(f"Resumos de vendas recalculados: {days} dias com vendas."))
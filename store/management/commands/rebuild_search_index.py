@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store import search
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o índice de pesquisa (FTS5) dos produtos a partir da base de dados."
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            self.stdout.write(self.style.WARNING("A pesquisa FTS5 só está disponível com SQLite."))
+            return
+        total = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Índice reconstruído: {total} produtos."))
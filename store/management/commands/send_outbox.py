@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from store.emails import MAX_ATTEMPTS, claim_batch, send_batch
+
+
+class Command(BaseCommand):
+    help = "Envia os emails pendentes da EmailOutbox em lotes (uma ligação SMTP por lote), com novas tentativas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help="Continua a correr e verifica a fila periodicamente.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Segundos entre verificações com --loop.")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            messages = claim_batch(options['batch_size'])
+            if messages:
+                sent, failed = send_batch(messages, options['max_attempts'])
+                total_sent += sent
+                total_failed += failed
+                self.stdout.write(f"Lote: {sent} enviados, {failed} com erro.")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Concluído: {total_sent} enviados, {total_failed} com erro."))
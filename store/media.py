@@ -0,0 +1,169 @@
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .storage import is_immutable
+
+# Servir os uploads (MEDIA_URL) em produção, à semelhança do WhiteNoise para os estáticos.
+# O MediaMiddleware responde antes das sessões/autenticação e entrega o ficheiro ao servidor:
+#   - FileResponse usa o wsgi.file_wrapper (sendfile no gunicorn, sem copiar bytes em Python);
+#   - com STORE_MEDIA_ACCEL_REDIRECT (ex: '/protected-media/') devolve só X-Accel-Redirect
+#     e o nginx envia o ficheiro.
+# Suporta ETag/If-None-Match, Last-Modified, Range e variantes .gz criadas por
+# `manage.py compress_media`. Os blobs com nome por hash (store/storage.py) têm cache immutable.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MAX_AGE = getattr(settings, 'STORE_MEDIA_MAX_AGE', 3600)
+ACCEL_REDIRECT = getattr(settings, 'STORE_MEDIA_ACCEL_REDIRECT', None)
+
+# Formatos de texto que compensa comprimir (JPEG/PNG/WebP já vêm comprimidos)
+COMPRESSIBLE_EXTENSIONS = ('.svg', '.txt', '.csv', '.json', '.xml', '.html', '.css', '.js', '.bmp', '.tif', '.tiff')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """Devolve (início, fim) inclusivos de um Range simples, None se não houver, ou False se for inválido."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return False
+    if not start:
+        # bytes=-N: os últimos N bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def cache_control(name):
+    if is_immutable(name):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={MAX_AGE}'
+
+
+def serve_media(request, name):
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("Ficheiro não encontrado.")
+    if not os.path.isfile(path):
+        raise Http404("Ficheiro não encontrado.")
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    range_header = request.META.get('HTTP_RANGE')
+    compressed = os.path.isfile(path + '.gz')
+    encoding = None
+    if compressed and not range_header and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        path, name, encoding = path + '.gz', name + '.gz', 'gzip'
+
+    stat = os.stat(path)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    headers = {
+        'Content-Type': content_type,
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control(name),
+        'Accept-Ranges': 'bytes',
+    }
+    if compressed:
+        headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        # O 304 tem de repetir os validadores para o cliente/proxy renovar a cópia que guardou
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+            if header in headers:
+                not_modified[header] = headers[header]
+        return not_modified
+
+    size = stat.st_size
+    byte_range = None
+    # If-Range: só respeita o Range se o ficheiro ainda for o mesmo
+    if range_header and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    if ACCEL_REDIRECT:
+        # O nginx trata do Range e do envio; só passamos os cabeçalhos
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = ACCEL_REDIRECT.rstrip('/') + '/' + name
+        del response['Content-Type']
+    elif request.method == 'HEAD':
+        response = HttpResponse()
+        response['Content-Length'] = length
+    elif byte_range and end < size - 1:
+        # Intervalo limitado ao meio do ficheiro: lido por blocos
+        response = StreamingHttpResponse(read_range(path, start, length))
+        response['Content-Length'] = length
+    else:
+        # Ficheiro inteiro ou até ao fim: o servidor envia com sendfile a partir da posição atual
+        f = open(path, 'rb')
+        f.seek(start)
+        response = FileResponse(f)
+    for header, value in headers.items():
+        if header == 'Content-Type' and ACCEL_REDIRECT:
+            continue
+        response[header] = value
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+class MediaMiddleware:
+    """Serve MEDIA_URL antes dos restantes middlewares (sem sessão, utilizador nem CSRF)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else None
+
+    def __call__(self, request):
+        if self.prefix and request.path_info.startswith(self.prefix) and request.method in ('GET', 'HEAD'):
+            return serve_media(request, request.path_info[len(self.prefix):])
+        return self.get_response(request)
+
+
+def compress_file(path, min_saving=0.05):
+    """Cria `path.gz` se poupar pelo menos `min_saving`. Devolve True se o ficheiro ficou."""
+    with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb', compresslevel=9) as dst:
+        shutil.copyfileobj(src, dst)
+    original, compressed = os.path.getsize(path), os.path.getsize(path + '.gz')
+    if compressed > original * (1 - min_saving):
+        os.remove(path + '.gz')
+        return False
+    # Mesmo mtime do original: o ETag não muda ao recomprimir
+    stat = os.stat(path)
+    os.utime(path + '.gz', (stat.st_atime, stat.st_mtime))
+    return True
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-17 11:05
+
+from django.db import migrations
+
+# Tabela virtual FTS5 para a pesquisa de produtos (ver store/search.py).
+# Só existe em SQLite; noutras bases de dados a pesquisa usa o filtro icontains.
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts "
+    "USING fts5(name, category, description, tokenize='unicode61 remove_diacritics 2')"
+)
+POPULATE_SQL = (
+    "INSERT INTO store_product_fts (rowid, name, category, description) "
+    "SELECT p.id, p.name, c.name, p.description FROM store_product p "
+    "JOIN store_category c ON c.id = p.category_id"
+)
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_product_active_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:40
+
+import django.db.models.deletion
+import store.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(default=store.models.generate_cart_token, editable=False, max_length=40, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stored_cart', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Carrinho',
+                'verbose_name_plural': 'Carrinhos',
+            },
+        ),
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Quantidade')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.product', verbose_name='Produto')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='store.productvariant', verbose_name='Variante')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='store.storedcart')),
+            ],
+            options={
+                'verbose_name': 'Linha de Carrinho',
+                'verbose_name_plural': 'Linhas de Carrinho',
+                'constraints': [models.UniqueConstraint(fields=('cart', 'key'), name='unique_cart_line_key')],
+            },
+        ),
+    ]
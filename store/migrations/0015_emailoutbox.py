@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_storedcart_cartline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Assunto')),
+                ('body', models.TextField(verbose_name='Mensagem')),
+                ('from_email', models.CharField(blank=True, max_length=255, verbose_name='Remetente')),
+                ('to', models.TextField(help_text='Um endereço por linha', verbose_name='Destinatários')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('sent', 'Enviado'), ('failed', 'Falhado')], default='pending', max_length=10, verbose_name='Estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+            ],
+            options={
+                'verbose_name': 'Email por Enviar',
+                'verbose_name_plural': 'Emails por Enviar',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_token', models.CharField(max_length=40, verbose_name='Carrinho')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantidade')),
+                ('expires_at', models.DateTimeField(verbose_name='Expira em')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='store.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'), models.Index(fields=['expires_at'], name='reservation_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart_token', 'product'), name='unique_reservation_per_cart')],
+            },
+        ),
+    ]
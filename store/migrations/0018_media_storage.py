@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:40
+
+import store.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ceremony',
+            name='image',
+            field=models.ImageField(storage=store.storage.media_storage, upload_to='ceremonies/', verbose_name='Imagem'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=store.storage.media_storage, upload_to='products/', verbose_name='Imagem'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=store.storage.media_storage, upload_to='products/gallery/', verbose_name='Imagem'),
+        ),
+        migrations.AlterField(
+            model_name='sitesettings',
+            name='banner_image',
+            field=models.ImageField(blank=True, null=True, storage=store.storage.media_storage, upload_to='banner/', verbose_name='Imagem do Banner'),
+        ),
+        migrations.AlterField(
+            model_name='therapy',
+            name='image',
+            field=models.ImageField(storage=store.storage.media_storage, upload_to='therapies/', verbose_name='Imagem'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Restrições únicas usadas como chave de upsert pelo `import_catalog`.
+# Antes de as criar resolvem-se os duplicados antigos:
+#   - variantes com o mesmo nome no mesmo produto são renomeadas ("Grande (2)"), nunca apagadas
+#     (podem estar em carrinhos e encomendas);
+#   - imagens repetidas na galeria do mesmo produto são apagadas (fica a de id mais baixo).
+
+
+def rename_duplicate_variants(apps):
+    ProductVariant = apps.get_model('store', 'ProductVariant')
+    duplicated = (
+        ProductVariant.objects.values('product', 'name')
+        .annotate(count=Count('id')).filter(count__gt=1)
+    )
+    for group in duplicated:
+        taken = set(ProductVariant.objects.filter(product=group['product']).values_list('name', flat=True))
+        variants = ProductVariant.objects.filter(product=group['product'], name=group['name']).order_by('id')
+        n = 1
+        for variant in variants[1:]:
+            while True:
+                n += 1
+                suffix = f" ({n})"
+                name = variant.name[:100 - len(suffix)] + suffix
+                if name not in taken:
+                    break
+            taken.add(name)
+            variant.name = name
+            variant.save(update_fields=['name'])
+
+
+def remove_duplicate_images(apps):
+    ProductImage = apps.get_model('store', 'ProductImage')
+    keep = (
+        ProductImage.objects.values('product', 'image')
+        .annotate(keep_id=Min('id'))
+        .values_list('keep_id', flat=True)
+    )
+    ProductImage.objects.exclude(id__in=list(keep)).delete()
+
+
+def remove_duplicates(apps, schema_editor):
+    rename_duplicate_variants(apps)
+    remove_duplicate_images(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_media_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(fields=('product', 'image'), name='unique_product_image'),
+        ),
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(fields=('product', 'name'), name='unique_variant_name'),
+        ),
+    ]
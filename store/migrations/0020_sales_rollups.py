@@ -0,0 +1,78 @@
+# Generated by Django 6.0.1 on 2026-10-17 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+# Tabelas de resumo das vendas (store/sales.py), preenchidas a partir das encomendas existentes.
+# A agregação está copiada aqui de propósito (só modelos históricos): se sales.rebuild mudar,
+# esta migração continua a correr igual numa base de dados nova.
+
+
+def backfill(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    DailySales = apps.get_model('store', 'DailySales')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+
+    # Conta como venda: paga e não cancelada; o dia é a data local de created_at
+    orders = Order.objects.filter(paid=True).exclude(status='canceled')
+    days = (
+        orders.annotate(day=TruncDate('created_at')).values('day')
+        .annotate(count=Count('id'), revenue=Sum('total_price')).order_by()
+    )
+    DailySales.objects.bulk_create(
+        (DailySales(date=row['day'], orders=row['count'], revenue=row['revenue']) for row in days.iterator()),
+        batch_size=1000,
+    )
+    per_product = (
+        OrderItem.objects.filter(order__in=orders)
+        .annotate(day=TruncDate('order__created_at')).values('day', 'product_id')
+        .annotate(sold=Sum('quantity'), sold_revenue=Sum(F('quantity') * F('price'))).order_by()
+    )
+    DailyProductSales.objects.bulk_create(
+        (DailyProductSales(date=row['day'], product_id=row['product_id'], quantity=row['sold'], revenue=row['sold_revenue'])
+         for row in per_product.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_catalog_upsert_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Dia')),
+                ('orders', models.IntegerField(default=0, verbose_name='Encomendas')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Faturação')),
+            ],
+            options={
+                'verbose_name': 'Vendas do Dia',
+                'verbose_name_plural': 'Vendas por Dia',
+                'ordering': ('-date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Dia')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantidade')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Faturação')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Vendas do Produto por Dia',
+                'verbose_name_plural': 'Vendas dos Produtos por Dia',
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
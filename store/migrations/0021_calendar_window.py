@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ceremony',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['start_time', 'end_time'], name='appointment_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ceremony',
+            index=models.Index(fields=['event_date'], name='ceremony_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_calendar_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Nº de Artigos'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_summary',
+            field=models.TextField(blank=True, editable=False, verbose_name='Artigos na Encomenda'),
+        ),
+    ]
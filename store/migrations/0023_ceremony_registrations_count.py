@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Contador de inscrições (store/ceremonies.py), preenchido a partir das inscrições existentes.
+# A contagem está copiada aqui (só modelos históricos) para não depender de ceremonies.recount.
+
+
+def backfill(apps, schema_editor):
+    Ceremony = apps.get_model('store', 'Ceremony')
+    CeremonyRegistration = apps.get_model('store', 'CeremonyRegistration')
+    counts = (
+        CeremonyRegistration.objects.filter(ceremony=OuterRef('pk')).order_by()
+        .values('ceremony').annotate(total=Count('id')).values('total')
+    )
+    Ceremony.objects.update(registrations_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_order_items_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ceremony',
+            name='registrations_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Inscritos'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
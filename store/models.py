@@ -1,6 +1,9 @@
+import secrets
 from django.db import models
 from django.utils.text import slugify
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .storage import media_storage
 from datetime import timedelta
 
 class Category(models.Model):
@@ -27,7 +30,7 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço")
     stock = models.PositiveIntegerField(default=0, verbose_name="Estoque")
     is_active = models.BooleanField(default=True, verbose_name="Ativo?")
-    image = models.ImageField(upload_to='products/', blank=True, null=True, verbose_name="Imagem")
+    image = models.ImageField(storage=media_storage, upload_to='products/', blank=True, null=True, verbose_name="Imagem")
     is_featured = models.BooleanField(default=False, verbose_name="Destaque?")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -36,6 +39,13 @@ class Product(models.Model):
         verbose_name = "Produto"
         verbose_name_plural = "Produtos"
         ordering = ('-created_at',)
+        indexes = [
+            # Suporte à paginação por cursor (store/pagination.py). Índices parciais: em SQLite o
+            # filtro is_active=True é um `WHERE is_active` sem coluna comparável, por isso só um
+            # índice com a mesma condição evita o SCAN + ORDER BY em árvore temporária.
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_active=True), name='product_active_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True), name='product_cat_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -47,11 +57,15 @@ class Product(models.Model):
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/gallery/', verbose_name="Imagem")
+    image = models.ImageField(storage=media_storage, upload_to='products/gallery/', verbose_name="Imagem")
     
     class Meta:
         verbose_name = "Imagem Extra"
         verbose_name_plural = "Imagens Extras"
+        constraints = [
+            # Chave de upsert do `import_catalog`
+            models.UniqueConstraint(fields=['product', 'image'], name='unique_product_image'),
+        ]
 
 class ProductVariant(models.Model):
     product = models.ForeignKey(Product, related_name='variants', on_delete=models.CASCADE)
@@ -61,10 +75,63 @@ class ProductVariant(models.Model):
     class Meta:
         verbose_name = "Variante de Produto"
         verbose_name_plural = "Variantes de Produto"
+        constraints = [
+            # Chave de upsert do `import_catalog`
+            models.UniqueConstraint(fields=['product', 'name'], name='unique_variant_name'),
+        ]
 
     def __str__(self):
         return f"{self.name} (+{self.price_extra}€)"
 
+def generate_cart_token():
+    return secrets.token_urlsafe(24)
+
+class StoredCart(models.Model):
+    """Carrinho guardado no servidor. A sessão guarda apenas o `token` (ver store/cart.py)."""
+    token = models.CharField(max_length=40, unique=True, default=generate_cart_token, editable=False)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='stored_cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Carrinho"
+        verbose_name_plural = "Carrinhos"
+
+    def __str__(self):
+        return f"Carrinho #{self.id}"
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(StoredCart, related_name='lines', on_delete=models.CASCADE)
+    key = models.CharField(max_length=50)  # "<product_id>_<variant_id|no_variant>"
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produto")
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Variante")
+    quantity = models.PositiveIntegerField(default=1, verbose_name="Quantidade")
+
+    class Meta:
+        verbose_name = "Linha de Carrinho"
+        verbose_name_plural = "Linhas de Carrinho"
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'key'], name='unique_cart_line_key'),
+        ]
+
+class StockReservation(models.Model):
+    """Reserva temporária de stock feita por um carrinho (ver store/reservations.py)."""
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE, verbose_name="Produto")
+    cart_token = models.CharField(max_length=40, verbose_name="Carrinho")
+    quantity = models.PositiveIntegerField(verbose_name="Quantidade")
+    expires_at = models.DateTimeField(verbose_name="Expira em")
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+        constraints = [
+            models.UniqueConstraint(fields=['cart_token', 'product'], name='unique_reservation_per_cart'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pendente'),
@@ -82,8 +149,14 @@ class Order(models.Model):
     paid = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Cópia dos artigos feita no checkout (ex: "2x Vela Lua, 1x Incenso"): a lista de encomendas
+    # do admin não precisa de ler OrderItem/Product. Encomendas antigas: `manage.py backfill_order_summaries`
+    items_summary = models.TextField(blank=True, editable=False, verbose_name="Artigos na Encomenda")
+    items_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Nº de Artigos")
     payment_method = models.ForeignKey('PaymentMethod', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Método de Pagamento")
     shipping_method = models.ForeignKey('ShippingMethod', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Método de Envio")
+    # Token único do formulário de checkout: impede encomendas duplicadas (duplo clique / refresh)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ('-created_at',)
@@ -108,7 +181,7 @@ class OrderItem(models.Model):
 
 class SiteSettings(models.Model):
     site_name = models.CharField(max_length=100, default="Minha Loja", verbose_name="Nome da Loja")
-    banner_image = models.ImageField(upload_to='banner/', blank=True, null=True, verbose_name="Imagem do Banner")
+    banner_image = models.ImageField(storage=media_storage, upload_to='banner/', blank=True, null=True, verbose_name="Imagem do Banner")
     banner_title = models.CharField(max_length=100, blank=True, verbose_name="Título do Banner")
     banner_text = models.TextField(blank=True, verbose_name="Texto do Banner")
     primary_color = models.CharField(max_length=7, default="#000000", verbose_name="Cor Principal (Hex)", help_text="Ex: #FF0000")
@@ -183,20 +256,26 @@ class Profile(models.Model):
 class Ceremony(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nome da Cerimónia")
     description = models.TextField(verbose_name="Descrição")
-    image = models.ImageField(upload_to='ceremonies/', verbose_name="Imagem")
+    image = models.ImageField(storage=media_storage, upload_to='ceremonies/', verbose_name="Imagem")
     event_date = models.DateTimeField(verbose_name="Data de Realização")
     max_participants = models.PositiveIntegerField(default=0, verbose_name="Máximo de Participantes", help_text="0 para ilimitado")
     requirements = models.TextField(blank=True, verbose_name="Requisitos e Conselhos", help_text="Informação visível apenas após a inscrição (ex: jejum, o que levar, etc)")
+    updated_at = models.DateTimeField(auto_now=True)
+    # Mantido por store/ceremonies.py (UPDATE condicional): não fazer COUNT às inscrições
+    registrations_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Inscritos")
 
     @property
     def is_full(self):
         if self.max_participants > 0:
-            return self.registrations.count() >= self.max_participants
+            return self.registrations_count >= self.max_participants
         return False
 
     class Meta:
         verbose_name = "Cerimónia"
         verbose_name_plural = "Cerimónias"
+        indexes = [
+            models.Index(fields=['event_date'], name='ceremony_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -234,7 +313,7 @@ class Therapy(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nome da Terapia")
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(verbose_name="Descrição")
-    image = models.ImageField(upload_to='therapies/', verbose_name="Imagem")
+    image = models.ImageField(storage=media_storage, upload_to='therapies/', verbose_name="Imagem")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço")
     duration_minutes = models.PositiveIntegerField(default=60, verbose_name="Duração (minutos)")
     is_active = models.BooleanField(default=True, verbose_name="Ativo?")
@@ -257,12 +336,79 @@ class Appointment(models.Model):
     start_time = models.DateTimeField(verbose_name="Data e Hora de Início")
     end_time = models.DateTimeField(verbose_name="Data e Hora de Fim")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     confirmed = models.BooleanField(default=False, verbose_name="Confirmado?")
     payment_method = models.ForeignKey(PaymentMethod, on_delete=models.SET_NULL, null=True, verbose_name="Método de Pagamento")
 
     class Meta:
         verbose_name = "Marcação"
         verbose_name_plural = "Marcações"
+        indexes = [
+            # Janela da agenda: start_time entre (início - duração máxima) e fim, depois end_time
+            models.Index(fields=['start_time', 'end_time'], name='appointment_window_idx'),
+        ]
 
     def __str__(self):
         return f"{self.therapy.name} - {self.user.username} - {self.start_time}"
+
+class EmailOutbox(models.Model):
+    """Emails por enviar. São gravados na mesma transação que a encomenda e enviados por `manage.py send_outbox`."""
+    STATUS_CHOICES = (
+        ('pending', 'Pendente'),
+        ('sent', 'Enviado'),
+        ('failed', 'Falhado'),
+    )
+    subject = models.CharField(max_length=255, verbose_name="Assunto")
+    body = models.TextField(verbose_name="Mensagem")
+    from_email = models.CharField(max_length=255, blank=True, verbose_name="Remetente")
+    to = models.TextField(verbose_name="Destinatários", help_text="Um endereço por linha")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Estado")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próxima Tentativa")
+    last_error = models.TextField(blank=True, verbose_name="Último Erro")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Enviado em")
+
+    class Meta:
+        verbose_name = "Email por Enviar"
+        verbose_name_plural = "Emails por Enviar"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def recipients(self):
+        return [address for address in self.to.splitlines() if address]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients())}"
+
+class DailySales(models.Model):
+    """Vendas por dia (encomendas pagas e não canceladas), mantidas por store/sales.py."""
+    date = models.DateField(unique=True, verbose_name="Dia")
+    orders = models.IntegerField(default=0, verbose_name="Encomendas")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Faturação")
+
+    class Meta:
+        ordering = ('-date',)
+        verbose_name = "Vendas do Dia"
+        verbose_name_plural = "Vendas por Dia"
+
+    def __str__(self):
+        return f"{self.date}: {self.revenue} €"
+
+class DailyProductSales(models.Model):
+    """Quantidade vendida por produto e por dia (mesmas encomendas que DailySales)."""
+    date = models.DateField(verbose_name="Dia")
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE, verbose_name="Produto")
+    quantity = models.IntegerField(default=0, verbose_name="Quantidade")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Faturação")
+
+    class Meta:
+        verbose_name = "Vendas do Produto por Dia"
+        verbose_name_plural = "Vendas dos Produtos por Dia"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.product_id} x{self.quantity}"
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Now
+from .models import Product, Order, OrderItem
+from .emails import queue_order_emails
+from .reservations import active_holds, with_available_stock
+
+# Criação de encomendas a partir do carrinho.
+# Tudo corre numa só transação e o número de queries não depende do número de linhas.
+
+
+class OutOfStockError(Exception):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f"Stock insuficiente: {names}")
+
+
+def decrement_stock(quantities, cart_token=None):
+    """
+    Desconta o stock de vários produtos num único UPDATE condicional
+    (`stock >= quantidade + reservas ativas de outros carrinhos` avaliado pela base de dados,
+    por isso sem corridas entre pedidos).
+    Lança OutOfStockError se algum produto não tiver stock suficiente; a transação
+    de quem chama desfaz então os descontos já feitos.
+    """
+    if not quantities:
+        return
+    needed = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=PositiveIntegerField(),
+    )
+    updated = (
+        Product.objects.filter(id__in=quantities.keys(), stock__gte=needed + active_holds(exclude_cart=cart_token))
+        .update(stock=F('stock') - needed, updated_at=Now())
+    )
+    if updated != len(quantities):
+        products = with_available_stock(Product.objects.filter(id__in=quantities.keys()).only('id', 'name', 'stock'),
+                                        exclude_cart=cart_token)
+        short = [product for product in products if product.available_stock < quantities[product.id]]
+        raise OutOfStockError(short)
+
+
+def place_order(order, cart):
+    """
+    Grava a encomenda e os seus artigos, desconta o stock e esvazia o carrinho.
+    Se já existir uma encomenda com o mesmo `idempotency_key` (formulário submetido duas vezes),
+    devolve essa encomenda sem repetir nenhuma escrita.
+    """
+    # Os produtos do carrinho são lidos antes da transação: lá dentro só há escritas
+    # (em SQLite a transação segura o lock de escrita do princípio ao fim)
+    cart.hydrate()
+    try:
+        return _place_order(order, cart)
+    except IntegrityError:
+        existing = find_order_by_key(order.idempotency_key)
+        if existing is None:
+            raise
+        return existing
+
+
+def summarize_items(rows):
+    """Texto das linhas (quantidade, nome), ex: "2x Vela Lua, 1x Incenso"."""
+    return ", ".join(f"{quantity}x {name}" for quantity, name in rows)
+
+
+def backfill_items_summaries(batch_size=1000, only_missing=True, progress=None):
+    """Preenche items_summary/items_count das encomendas já existentes, por lotes de ids. Devolve o total."""
+    orders = Order.objects.order_by('id')
+    if only_missing:
+        orders = orders.filter(items_count=0)
+    done, last_id = 0, 0
+    while True:
+        batch = list(orders.filter(id__gt=last_id).only('id')[:batch_size])
+        if not batch:
+            return done
+        rows = defaultdict(list)
+        items = (
+            OrderItem.objects.filter(order_id__in=[order.id for order in batch])
+            .order_by('order_id', 'id').values_list('order_id', 'quantity', 'product__name')
+        )
+        for order_id, quantity, name in items:
+            rows[order_id].append((quantity, name))
+        for order in batch:
+            order.items_summary = summarize_items(rows[order.id])
+            order.items_count = sum(quantity for quantity, _ in rows[order.id])
+        Order.objects.bulk_update(batch, ['items_summary', 'items_count'])
+        done += len(batch)
+        last_id = batch[-1].id
+        if progress:
+            progress(done)
+
+
+def find_order_by_key(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.filter(idempotency_key=idempotency_key).first()
+
+
+@transaction.atomic
+def _place_order(order, cart):
+    items = list(cart)
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item['product_id']] += item['quantity']
+
+    # A encomenda é gravada primeiro: a restrição UNIQUE do idempotency_key falha logo aqui
+    # num reenvio, antes de qualquer desconto de stock
+    order.total_price = sum((item['total_price'] for item in items), Decimal('0.00'))
+    order.items_summary = summarize_items(
+        (item['quantity'], f"{item['name']} ({item['variant_name']})" if item['variant_name'] else item['name'])
+        for item in items
+    )
+    order.items_count = sum(item['quantity'] for item in items)
+    order.save()
+
+    decrement_stock(quantities, cart_token=cart.cart_id)
+
+    # Nota: o modelo OrderItem não tem campo para a variante; o preço já a inclui.
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=item['product_id'], price=item['price'], quantity=item['quantity'])
+        for item in items
+    ])
+    # Os emails de confirmação ficam na EmailOutbox, na mesma transação (enviados por `send_outbox`)
+    queue_order_emails(order)
+    cart.clear()
+    return order
@@ -0,0 +1,113 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+from . import reference
+
+# Cache de páginas inteiras.
+# O HTML destas páginas é igual para todos: a parte pessoal (contador do carrinho, links de conta,
+# token CSRF) é pedida depois do carregamento a /sessao/ (views.session_state).
+# A chave inclui a versão do catálogo, mudada pelos sinais de Product, ProductImage,
+# ProductVariant, Category, Therapy, Ceremony e SiteSettings (store/signals.py): uma
+# alteração no admin invalida todas as páginas de uma vez, sem depender de TTLs.
+# Funciona com qualquer backend de cache (local, ficheiro, Redis); `manage.py page_cache_stats`
+# mostra a taxa de acertos.
+
+CATALOGUE = 'catalogue'
+STATS_KEYS = {'hit': 'store:page:hits', 'miss': 'store:page:misses'}
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# Segundos que um proxy reverso local pode servir a página sem voltar a perguntar;
+# os browsers revalidam sempre (max-age=0)
+SHARED_MAX_AGE = getattr(settings, 'STORE_PAGE_SHARED_MAX_AGE', 60)
+
+
+def bump_catalogue_version():
+    reference.bump_version(CATALOGUE)
+
+
+def is_cacheable_request(request):
+    return request.method in ('GET', 'HEAD')
+
+
+def set_shared_cache_headers(response, timeout=None):
+    s_maxage = SHARED_MAX_AGE if timeout is None else min(SHARED_MAX_AGE, timeout)
+    patch_cache_control(response, public=True, max_age=0, s_maxage=s_maxage)
+
+
+def seconds_until(until):
+    if until is None:
+        return None
+    return max(1, int((until - timezone.now()).total_seconds()))
+
+
+def page_key(request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"store:page:{reference.current_version(CATALOGUE)}:{url}"
+
+
+def record(outcome):
+    key = STATS_KEYS[outcome]
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # A chave foi removida entre o add e o incr (cache cheia); perde-se uma contagem
+        pass
+
+
+def stats():
+    hits = cache.get(STATS_KEYS['hit'], 0)
+    misses = cache.get(STATS_KEYS['miss'], 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'ratio': hits / total if total else 0.0}
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
+
+
+def cache_shared_page(view):
+    """
+    Guarda a resposta 200 da view (GET/HEAD) e marca-a como partilhável por proxies.
+    A view pode indicar até quando a página é válida em `response.page_cache_until`
+    (ex: lista de cerimónias futuras). Respostas que usaram o token CSRF não são guardadas,
+    porque o token é de cada visitante.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            record('hit')
+            content, headers, until = cached
+            response = HttpResponse(content)
+            for header, value in headers.items():
+                response[header] = value
+            set_shared_cache_headers(response, seconds_until(until))
+            # O ETag/Last-Modified guardados continuam válidos enquanto a versão do catálogo não mudar
+            response = get_conditional_response(
+                request, etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(response.get('Last-Modified', '')), response=response,
+            )
+            response['X-Page-Cache'] = 'hit'
+            return response
+
+        record('miss')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            until = getattr(response, 'page_cache_until', None)
+            timeout = seconds_until(until)
+            headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+            cache.set(key, (response.content, headers, until), timeout)
+            set_shared_cache_headers(response, timeout)
+        response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
@@ -0,0 +1,101 @@
+import base64
+from datetime import datetime
+from django.conf import settings
+
+# Paginação por cursor (keyset) sobre a ordenação (-created_at, -id).
+# Em vez de OFFSET, cada página começa logo a seguir à última linha da anterior,
+# por isso a página 500 custa o mesmo que a página 1 (usa o índice do modelo).
+
+PRODUCTS_PER_PAGE = getattr(settings, 'STORE_PRODUCTS_PER_PAGE', 24)
+
+
+def encode_cursor(values):
+    raw = '|'.join(str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, parsers):
+    """Devolve a tupla de valores do cursor (convertidos por `parsers`) ou None se for inválido."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        parts = raw.split('|')
+        if len(parts) != len(parsers):
+            return None
+        return tuple(parse(part) for parse, part in zip(parsers, parts))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def created_at_key(obj):
+    return (obj.created_at.isoformat(), obj.pk)
+
+
+CREATED_AT_PARSERS = (datetime.fromisoformat, int)
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, request, key=created_at_key):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._request = request
+        self._key = key
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _url(self, param, obj):
+        # Mantém os restantes parâmetros (ex: ?q=) e troca apenas o cursor
+        params = self._request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[param] = encode_cursor(self._key(obj))
+        return '?' + params.urlencode()
+
+    @property
+    def next_url(self):
+        if self.has_next and self.object_list:
+            return self._url('after', self.object_list[-1])
+        return None
+
+    @property
+    def previous_url(self):
+        if self.has_previous and self.object_list:
+            return self._url('before', self.object_list[0])
+        return None
+
+
+def get_cursors(request, parsers):
+    """Lê os parâmetros ?after= / ?before= (só um deles é usado)."""
+    after = decode_cursor(request.GET.get('after'), parsers)
+    before = decode_cursor(request.GET.get('before'), parsers) if not after else None
+    return after, before
+
+
+def paginate_keyset(queryset, request, per_page=PRODUCTS_PER_PAGE):
+    after, before = get_cursors(request, CREATED_AT_PARSERS)
+
+    if before:
+        # Página anterior: percorre o índice no sentido inverso e volta a inverter o resultado
+        created_at, pk = before
+        rows = list(
+            queryset.filter(created_at__gte=created_at)
+            .exclude(created_at=created_at, id__lte=pk)
+            .order_by('created_at', 'id')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        object_list = rows[:per_page][::-1]
+        return KeysetPage(object_list, has_next=True, has_previous=has_previous, request=request)
+
+    if after:
+        created_at, pk = after
+        queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+
+    rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], has_next=has_next, has_previous=after is not None, request=request)
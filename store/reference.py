@@ -0,0 +1,108 @@
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from django.core.cache import cache
+from django.db import transaction
+from .models import SiteSettings, Category, PaymentMethod, ShippingMethod
+
+# Dados de referência do site (configurações, categorias, métodos de pagamento e envio).
+# Mudam raramente e aparecem em quase todas as páginas, por isso ficam em três níveis:
+#   1. memorizados no pedido (request._store_reference);
+#   2. guardados em memória no processo, associados a uma versão;
+#   3. a versão de cada conjunto vive na cache do Django (partilhada entre workers).
+# Os sinais post_save/post_delete (store/signals.py) mudam a versão e cada worker
+# recarrega o conjunto no pedido seguinte. Por isso CACHES é uma cache partilhada
+# (ficheiros por defeito, Redis com REDIS_URL; ver config/settings.py).
+
+LOADERS = {
+    'site_settings': lambda: SiteSettings.objects.first(),
+    'categories': lambda: list(Category.objects.all()),
+    'payment_methods': lambda: list(PaymentMethod.objects.filter(is_active=True)),
+    'shipping_methods': lambda: list(ShippingMethod.objects.filter(is_active=True)),
+}
+
+MODEL_DATA = {
+    SiteSettings: 'site_settings',
+    Category: 'categories',
+    PaymentMethod: 'payment_methods',
+    ShippingMethod: 'shipping_methods',
+}
+
+# {nome: (versão, valor)} - próprio de cada processo
+_process_cache = {}
+
+
+def version_key(name):
+    return f"store:reference:{name}:version"
+
+
+def new_version():
+    # Começa pelo instante da alteração (usado no Last-Modified das páginas)
+    return f"{time.time():.6f}-{uuid.uuid4().hex[:8]}"
+
+
+def version_time(version):
+    """Instante em que a versão foi criada (datetime UTC), ou None se não for reconhecível."""
+    try:
+        return datetime.fromtimestamp(float(version.split('-', 1)[0]), tz=dt_timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+def current_version(name):
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Primeira utilização (ou cache limpa): todos os workers acabam com a mesma versão
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get(name, request=None):
+    """Devolve o conjunto `name`, sem queries enquanto a versão não mudar."""
+    memo = None
+    if request is not None:
+        memo = request.__dict__.setdefault('_store_reference', {})
+        if name in memo:
+            return memo[name]
+
+    version = current_version(name)
+    cached = _process_cache.get(name)
+    if cached is None or cached[0] != version:
+        cached = (version, LOADERS[name]())
+        _process_cache[name] = cached
+
+    if memo is not None:
+        memo[name] = cached[1]
+    return cached[1]
+
+
+def site_settings(request=None):
+    return get('site_settings', request)
+
+
+def categories(request=None):
+    return get('categories', request)
+
+
+def category_by_slug(slug, request=None):
+    return next((category for category in categories(request) if category.slug == slug), None)
+
+
+def payment_methods(request=None):
+    return get('payment_methods', request)
+
+
+def shipping_methods(request=None):
+    return get('shipping_methods', request)
+
+
+def bump_version(name):
+    """Muda a versão de `name` depois do commit (antes disso os outros workers leriam dados antigos)."""
+    transaction.on_commit(lambda: cache.set(version_key(name), new_version(), None))
+
+
+def invalidate(name):
+    bump_version(name)
+    transaction.on_commit(lambda: _process_cache.pop(name, None))
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Product, StockReservation
+
+# Reservas de stock com prazo.
+# Cart.add() reserva as unidades durante RESERVATION_TTL; o stock disponível para os outros
+# clientes é o stock menos as reservas ativas. As reservas expiradas são ignoradas e
+# apagadas em lote por `manage.py expire_reservations`.
+
+RESERVATION_TTL = timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def active_holds(exclude_cart=None):
+    """Expressão com o total reservado (reservas ativas) do produto da query exterior."""
+    holds = StockReservation.objects.filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+    if exclude_cart:
+        holds = holds.exclude(cart_token=exclude_cart)
+    total = holds.values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def with_available_stock(queryset, exclude_cart=None):
+    """Anota `available_stock` (stock menos reservas ativas) numa só query."""
+    return queryset.annotate(
+        available_stock=F('stock') - active_holds(exclude_cart)
+    )
+
+
+def hold(cart_token, product_id, quantity, check=True):
+    """
+    Reserva `quantity` unidades (total do produto neste carrinho) e renova o prazo.
+    Com `check`, lança OutOfStockError se as unidades não estiverem disponíveis
+    (para reduzir uma reserva não é preciso verificar). Quantidade 0 apaga a reserva.
+    """
+    from .orders import OutOfStockError
+
+    if quantity <= 0:
+        release(cart_token, product_id)
+        return
+    with transaction.atomic():
+        if check:
+            product = (
+                with_available_stock(Product.objects.select_for_update().only('id', 'name', 'stock'), exclude_cart=cart_token)
+                .get(pk=product_id)
+            )
+            if product.available_stock < quantity:
+                raise OutOfStockError([product])
+        expires_at = timezone.now() + RESERVATION_TTL
+        reservations = StockReservation.objects.filter(cart_token=cart_token, product_id=product_id)
+        if not reservations.update(quantity=quantity, expires_at=expires_at):
+            try:
+                with transaction.atomic():
+                    StockReservation.objects.create(cart_token=cart_token, product_id=product_id,
+                                                    quantity=quantity, expires_at=expires_at)
+            except IntegrityError:
+                reservations.update(quantity=quantity, expires_at=expires_at)
+
+
+def release(cart_token, product_id=None):
+    reservations = StockReservation.objects.filter(cart_token=cart_token)
+    if product_id is not None:
+        reservations = reservations.filter(product_id=product_id)
+    reservations.delete()
+
+
+@transaction.atomic
+def transfer(from_token, to_token):
+    """Passa as reservas de um carrinho para outro (ex: carrinho anónimo -> carrinho do utilizador)."""
+    target = {r.product_id: r for r in StockReservation.objects.filter(cart_token=to_token)}
+    for reservation in StockReservation.objects.filter(cart_token=from_token):
+        existing = target.get(reservation.product_id)
+        if existing is None:
+            reservation.cart_token = to_token
+            reservation.save(update_fields=['cart_token'])
+        else:
+            existing.quantity += reservation.quantity
+            existing.expires_at = max(existing.expires_at, reservation.expires_at)
+            existing.save(update_fields=['quantity', 'expires_at'])
+            reservation.delete()
+
+
+def expire(now=None):
+    """Apaga as reservas expiradas (usa o índice em expires_at). Devolve quantas foram apagadas."""
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
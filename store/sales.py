@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Tabelas de resumo das vendas (DailySales e DailyProductSales) para o dashboard do admin.
+# Conta uma encomenda quando está paga e não foi cancelada; o dia é a data local de created_at.
+# Os sinais (store/signals.py) aplicam só a diferença quando uma encomenda ou um artigo muda,
+# por isso o dashboard lê umas dezenas de linhas em vez de agregar Order/OrderItem inteiros.
+# `manage.py rebuild_sales_rollups` recalcula tudo (ou a partir de um dia) para backfills.
+
+TOP_PRODUCTS_DAYS = getattr(settings, 'STORE_DASHBOARD_TOP_DAYS', 30)
+EXCLUDED_STATUSES = ('canceled',)
+
+
+def counts_as_sale(paid, status):
+    return bool(paid) and status not in EXCLUDED_STATUSES
+
+
+def sale_day(created_at):
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+def order_state(order):
+    """(dia, total) se a encomenda conta como venda, senão None."""
+    if order.created_at is None or not counts_as_sale(order.paid, order.status):
+        return None
+    return sale_day(order.created_at), Decimal(str(order.total_price or 0))
+
+
+def apply(orders=None, products=None):
+    """
+    Soma as diferenças às tabelas: orders = {dia: [encomendas, faturação]},
+    products = {(dia, product_id): [quantidade, faturação]}. Valores negativos subtraem.
+    """
+    from .models import DailySales, DailyProductSales
+    with transaction.atomic():
+        for day, (count, revenue) in (orders or {}).items():
+            if count or revenue:
+                _increment(DailySales, {'date': day}, orders=count, revenue=revenue)
+        for (day, product_id), (quantity, revenue) in (products or {}).items():
+            if quantity or revenue:
+                _increment(DailyProductSales, {'date': day, 'product_id': product_id}, quantity=quantity, revenue=revenue)
+
+
+def _increment(model, key, **deltas):
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Outra transação criou a linha entretanto
+        model.objects.filter(**key).update(**updates)
+
+
+def item_rows(order_id):
+    from .models import OrderItem
+    return OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity', 'price')
+
+
+def order_changed(order_id, old, new):
+    """Aplica a mudança de estado (ver order_state) de uma encomenda: sai do dia antigo, entra no novo."""
+    if old == new:
+        return
+    orders = defaultdict(lambda: [0, Decimal('0.00')])
+    products = defaultdict(lambda: [0, Decimal('0.00')])
+    old_day, new_day = old and old[0], new and new[0]
+    if old:
+        orders[old[0]][0] -= 1
+        orders[old[0]][1] -= old[1]
+    if new:
+        orders[new[0]][0] += 1
+        orders[new[0]][1] += new[1]
+    if old_day != new_day:
+        # Os artigos só mudam de dia quando a encomenda entra, sai ou muda de data
+        for product_id, quantity, price in item_rows(order_id):
+            for day, sign in ((old_day, -1), (new_day, 1)):
+                if day:
+                    products[day, product_id][0] += sign * quantity
+                    products[day, product_id][1] += sign * quantity * price
+    apply(orders, products)
+
+
+def item_changed(order, old, new):
+    """old/new = (product_id, quantidade, preço) ou None (artigo criado/apagado)."""
+    state = order_state(order)
+    if state is None or old == new:
+        return
+    day = state[0]
+    products = defaultdict(lambda: [0, Decimal('0.00')])
+    for row, sign in ((old, -1), (new, 1)):
+        if row:
+            product_id, quantity, price = row
+            price = Decimal(str(price))
+            products[day, product_id][0] += sign * quantity
+            products[day, product_id][1] += sign * quantity * price
+    apply(products=products)
+
+
+def sold_orders(Order):
+    return Order.objects.filter(paid=True).exclude(status__in=EXCLUDED_STATUSES)
+
+
+@transaction.atomic
+def rebuild(since=None, apps=global_apps, batch_size=1000):
+    """Recalcula as tabelas a partir das encomendas (desde o dia `since`, ou tudo). Devolve o número de dias."""
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    DailySales = apps.get_model('store', 'DailySales')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+
+    orders = sold_orders(Order)
+    items = OrderItem.objects.filter(order__in=orders)
+    rollups, product_rollups = DailySales.objects.all(), DailyProductSales.objects.all()
+    if since:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        orders, items = orders.filter(created_at__gte=start), items.filter(order__created_at__gte=start)
+        rollups, product_rollups = rollups.filter(date__gte=since), product_rollups.filter(date__gte=since)
+    rollups.delete()
+    product_rollups.delete()
+
+    days = (
+        orders.annotate(day=TruncDate('created_at')).values('day')
+        .annotate(count=Count('id'), revenue=Sum('total_price')).order_by()
+    )
+    DailySales.objects.bulk_create(
+        (DailySales(date=row['day'], orders=row['count'], revenue=row['revenue']) for row in days.iterator()),
+        batch_size=batch_size,
+    )
+    per_product = (
+        items.annotate(day=TruncDate('order__created_at')).values('day', 'product_id')
+        .annotate(sold=Sum('quantity'), sold_revenue=Sum(F('quantity') * F('price'))).order_by()
+    )
+    DailyProductSales.objects.bulk_create(
+        (DailyProductSales(date=row['day'], product_id=row['product_id'], quantity=row['sold'], revenue=row['sold_revenue'])
+         for row in per_product.iterator()),
+        batch_size=batch_size,
+    )
+    return DailySales.objects.filter(date__gte=since).count() if since else DailySales.objects.count()
+
+
+def dashboard_numbers(today=None):
+    """Vendas de hoje, da semana e do mês (uma query sobre ≤ 31 linhas) e o top 10 recente."""
+    from .models import DailySales, DailyProductSales
+    today = today or timezone.localdate()
+    start_week = today - timedelta(days=today.weekday())
+    start_month = today.replace(day=1)
+    totals = DailySales.objects.filter(date__gte=min(start_week, start_month), date__lte=today).aggregate(
+        day=Sum('revenue', filter=Q(date=today)),
+        week=Sum('revenue', filter=Q(date__gte=start_week)),
+        month=Sum('revenue', filter=Q(date__gte=start_month)),
+    )
+    top_products = (
+        DailyProductSales.objects.filter(date__gt=today - timedelta(days=TOP_PRODUCTS_DAYS), date__lte=today)
+        .values('product__name').annotate(total_sold=Sum('quantity')).filter(total_sold__gt=0)
+        .order_by('-total_sold')[:10]
+    )
+    cents = Decimal('0.01')
+    return {
+        'sales_day': (totals['day'] or Decimal(0)).quantize(cents),
+        'sales_week': (totals['week'] or Decimal(0)).quantize(cents),
+        'sales_month': (totals['month'] or Decimal(0)).quantize(cents),
+        'top_products': top_products,
+        'top_products_days': TOP_PRODUCTS_DAYS,
+    }
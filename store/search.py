@@ -0,0 +1,154 @@
+import re
+from django.db import connection
+from .pagination import PRODUCTS_PER_PAGE, KeysetPage, get_cursors
+
+# Pesquisa de produtos com SQLite FTS5.
+# A tabela virtual é criada pela migração 0013 e mantida pelos sinais em store/signals.py.
+# `python manage.py rebuild_search_index` volta a construí-la de raiz.
+
+FTS_TABLE = 'store_product_fts'
+
+# Pesos do bm25 por coluna (nome, categoria, descrição): um termo no nome conta mais
+BM25_WEIGHTS = (10.0, 4.0, 1.0)
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(name, category, description, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_TABLE_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """
+    Converte o texto do utilizador numa expressão MATCH segura.
+    Cada palavra vai entre aspas; só a última é pesquisada como prefixo (ainda a ser escrita).
+    """
+    tokens = TOKEN_RE.findall(query or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_products(product_ids):
+    """(Re)indexa os produtos indicados lendo-os da base de dados numa só query."""
+    if not is_enabled() or not product_ids:
+        return
+    product_ids = list(product_ids)
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, category, description) "
+            "SELECT p.id, p.name, c.name, p.description FROM store_product p "
+            "JOIN store_category c ON c.id = p.category_id "
+            f"WHERE p.id IN ({placeholders})",
+            product_ids,
+        )
+
+
+def remove_products(product_ids):
+    if not is_enabled() or not product_ids:
+        return
+    product_ids = list(product_ids)
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+
+def update_category(category):
+    """Atualiza o nome da categoria em todos os produtos indexados dessa categoria."""
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET category = %s "
+            "WHERE rowid IN (SELECT id FROM store_product WHERE category_id = %s)",
+            [category.name, category.pk],
+        )
+
+
+def rebuild():
+    """Reconstrói o índice inteiro. Devolve o número de produtos indexados."""
+    if not is_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_TABLE_SQL)
+        cursor.execute(CREATE_TABLE_SQL)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, category, description) "
+            "SELECT p.id, p.name, c.name, p.description FROM store_product p "
+            "JOIN store_category c ON c.id = p.category_id"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search_products(query, request, category=None, per_page=PRODUCTS_PER_PAGE):
+    """
+    Pesquisa produtos ativos ordenados por relevância (bm25) e devolve uma KeysetPage.
+    O cursor é (rank, id), por isso a paginação continua a não usar OFFSET.
+    """
+    from .models import Product
+
+    match = build_match_expression(query)
+    if not match:
+        return KeysetPage([], has_next=False, has_previous=False, request=request)
+
+    after, before = get_cursors(request, (float, int))
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    sql = (
+        f"SELECT f.rowid, f.rank FROM ("
+        f"  SELECT rowid, bm25({FTS_TABLE}, {weights}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        f") f JOIN store_product p ON p.id = f.rowid "
+        f"WHERE p.is_active = 1"
+    )
+    params = [match]
+    if category is not None:
+        sql += " AND p.category_id = %s"
+        params.append(category.pk)
+
+    cursor_values = after or before
+    if cursor_values:
+        rank, pk = cursor_values
+        op = '>' if after else '<'
+        sql += f" AND (f.rank {op} %s OR (f.rank = %s AND f.rowid {op} %s))"
+        params += [rank, rank, pk]
+
+    direction = 'DESC' if before else 'ASC'
+    sql += f" ORDER BY f.rank {direction}, f.rowid {direction} LIMIT %s"
+    params.append(per_page + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+
+    products = Product.objects.in_bulk([pk for pk, _ in rows])
+    object_list = []
+    for pk, rank in rows:
+        product = products.get(pk)
+        if product is not None:
+            product.search_rank = rank
+            object_list.append(product)
+
+    if before:
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, after is not None
+    return KeysetPage(
+        object_list, has_next=has_next, has_previous=has_previous, request=request,
+        key=lambda obj: (repr(obj.search_rank), obj.pk),
+    )
@@ -0,0 +1,152 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, ProductImage, ProductVariant, Category, Therapy, Ceremony, SiteSettings, Order, OrderItem, CeremonyRegistration
+from .cart import merge_cart_on_login
+from . import ceremonies, images, page_cache, reference, sales, search
+
+# --- ÍNDICE DE PESQUISA (FTS5) ---
+# Mantém a tabela store_product_fts sincronizada com Product e Category.
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    # Uma categoria nova ainda não tem produtos indexados
+    if not raw and not created:
+        search.update_category(instance)
+
+# --- DADOS DE REFERÊNCIA (store/reference.py) ---
+
+def reference_data_changed(sender, raw=False, **kwargs):
+    if not raw:
+        reference.invalidate(reference.MODEL_DATA[sender])
+
+for model in reference.MODEL_DATA:
+    post_save.connect(reference_data_changed, sender=model, dispatch_uid=f'reference_saved_{model.__name__}')
+    post_delete.connect(reference_data_changed, sender=model, dispatch_uid=f'reference_deleted_{model.__name__}')
+
+# --- CACHE DE PÁGINAS (store/page_cache.py) ---
+
+CATALOGUE_MODELS = (Product, ProductImage, ProductVariant, Category, Therapy, Ceremony, SiteSettings)
+
+def catalogue_changed(sender, raw=False, **kwargs):
+    if not raw:
+        page_cache.bump_catalogue_version()
+
+for model in CATALOGUE_MODELS:
+    post_save.connect(catalogue_changed, sender=model, dispatch_uid=f'catalogue_saved_{model.__name__}')
+    post_delete.connect(catalogue_changed, sender=model, dispatch_uid=f'catalogue_deleted_{model.__name__}')
+
+# --- VERSÕES REDIMENSIONADAS DAS IMAGENS (store/images.py) ---
+
+def image_fields(sender, update_fields=None):
+    return [
+        field for model_name, field in images.IMAGE_FIELDS
+        if model_name == sender.__name__ and (update_fields is None or field in update_fields)
+    ]
+
+def image_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # O nome final do ficheiro só é conhecido depois de gravado: aqui guarda-se o anterior
+    fields = image_fields(sender, update_fields)
+    old = None
+    if not raw and fields and instance.pk:
+        old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._images_before = old or {}
+
+def image_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_images_before', {})
+    names = [
+        getattr(instance, field).name for field in image_fields(sender, update_fields)
+        if getattr(instance, field).name != before.get(field)
+    ]
+    if names:
+        # Só quando a imagem mudou; geradas fora do pedido, depois do commit (o ficheiro já está gravado)
+        transaction.on_commit(lambda: images.schedule(names))
+
+for model in (Product, ProductImage, Therapy, Ceremony, SiteSettings):
+    pre_save.connect(image_before_save, sender=model, dispatch_uid=f'image_before_save_{model.__name__}')
+    post_save.connect(image_saved, sender=model, dispatch_uid=f'image_saved_{model.__name__}')
+
+# --- RESUMOS DE VENDAS (store/sales.py) ---
+# O pre_save guarda o estado anterior; o post_save aplica só a diferença.
+
+@receiver(pre_save, sender=Order)
+def order_before_save(sender, instance, raw=False, **kwargs):
+    old = None
+    if not raw and instance.pk:
+        old = Order.objects.filter(pk=instance.pk).first()
+    instance._sales_state = sales.order_state(old) if old else None
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sales.order_changed(instance.pk, getattr(instance, '_sales_state', None), sales.order_state(instance))
+        instance._sales_state = sales.order_state(instance)
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Os artigos (apagados em cascata antes da encomenda) já saíram de DailyProductSales
+    sales.order_changed(instance.pk, sales.order_state(instance), None)
+
+def item_row(item):
+    return (item.product_id, item.quantity, item.price)
+
+@receiver(pre_save, sender=OrderItem)
+def item_before_save(sender, instance, raw=False, **kwargs):
+    old = None
+    if not raw and instance.pk:
+        old = OrderItem.objects.filter(pk=instance.pk).values_list('product_id', 'quantity', 'price').first()
+    instance._sales_row = old
+
+@receiver(post_save, sender=OrderItem)
+def item_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sales.item_changed(instance.order, getattr(instance, '_sales_row', None), item_row(instance))
+
+@receiver(post_delete, sender=OrderItem)
+def item_deleted(sender, instance, **kwargs):
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order is not None:
+        sales.item_changed(order, item_row(instance), None)
+
+# --- LUGARES NAS CERIMÓNIAS (store/ceremonies.py) ---
+# As inscrições do site já ocupam o lugar em ceremonies.register(); aqui ficam as do admin.
+
+@receiver(pre_save, sender=CeremonyRegistration)
+def registration_before_save(sender, instance, raw=False, **kwargs):
+    instance._old_ceremony_id = None
+    if not raw and instance.pk:
+        instance._old_ceremony_id = CeremonyRegistration.objects.filter(pk=instance.pk).values_list('ceremony_id', flat=True).first()
+
+@receiver(post_save, sender=CeremonyRegistration)
+def registration_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if not getattr(instance, '_seat_claimed', False):
+            ceremonies.adjust(instance.ceremony_id, 1)
+    elif instance._old_ceremony_id not in (None, instance.ceremony_id):
+        ceremonies.adjust(instance._old_ceremony_id, -1)
+        ceremonies.adjust(instance.ceremony_id, 1)
+
+@receiver(post_delete, sender=CeremonyRegistration)
+def registration_deleted(sender, instance, **kwargs):
+    ceremonies.adjust(instance.ceremony_id, -1)
+
+# --- CARRINHO ---
+
+@receiver(user_logged_in)
+def merge_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        merge_cart_on_login(request, user)
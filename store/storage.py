@@ -0,0 +1,84 @@
+import hashlib
+import os
+import re
+import tempfile
+from django.core.files.storage import FileSystemStorage
+
+# Storage endereçado por conteúdo para os ImageField da loja.
+# Cada ficheiro é gravado como blobs/<2 primeiros>/<sha256>.<ext>: o mesmo conteúdo carregado
+# várias vezes (banner repetido, imagens de exemplo, galerias reutilizadas) fica guardado uma
+# só vez, e um nome nunca muda de conteúdo, por isso o URL pode ter cache "immutable".
+# `python manage.py gc_media` apaga os blobs que já nenhum registo usa.
+
+BLOB_DIR = 'blobs'
+BLOB_RE = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(\.w\d+)?\.\w+$')
+
+
+def content_digest(content):
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+def blob_name(digest, ext):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{ext.lower()}"
+
+
+def is_immutable(name):
+    """Blobs (e as versões redimensionadas deles) nunca mudam de conteúdo."""
+    return BLOB_RE.match(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final vem do conteúdo (_save); não há sufixos aleatórios
+        return name
+
+    def _save(self, name, content):
+        # Não usa FileSystemStorage._save: com um nome fixo, o ciclo dele em FileExistsError
+        # (get_available_name) nunca terminaria quando dois pedidos gravam o mesmo conteúdo.
+        ext = os.path.splitext(name)[1]
+        name = blob_name(content_digest(content), ext)
+        if self.exists(name):
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        # Grava num temporário da mesma pasta e publica-o de uma vez: nunca há um blob a meio
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            try:
+                os.link(tmp_path, full_path)
+            except FileExistsError:
+                # Outro pedido gravou o mesmo conteúdo entretanto: o blob já está completo
+                pass
+            except OSError:
+                # Sistema de ficheiros sem hard links; o conteúdo é o mesmo, substituir é seguro
+                os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+
+def media_storage():
+    # Callable nos campos: as migrações não guardam a instância do storage
+    return ContentAddressedStorage()
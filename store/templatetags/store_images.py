@@ -0,0 +1,41 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from ..images import available_widths, rendition_name
+
+register = template.Library()
+
+
+def srcset(image, widths, ext):
+    storage = image.storage
+    return ', '.join(f"{storage.url(rendition_name(image.name, width, ext))} {width}w" for width in widths)
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', alt='', css_class='', style=''):
+    """
+    <picture> com srcset WebP/JPEG das versões já geradas e loading="lazy".
+    Enquanto não houver versões (acabou de ser carregada) usa o original.
+    """
+    if not image:
+        return ''
+    widths = available_widths(image.name, image.storage)
+    attrs = format_html_join(' ', '{}="{}"', [(k, v) for k, v in (('class', css_class), ('style', style)) if v])
+    if not widths:
+        return format_html('<img src="{}" alt="{}" loading="lazy" decoding="async" {}>', image.url, alt, attrs)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async" {}>'
+        '</picture>',
+        srcset(image, widths, 'webp'), sizes,
+        image.storage.url(rendition_name(image.name, widths[-1], 'jpg')), srcset(image, widths, 'jpg'), sizes, alt, attrs,
+    )
+
+
+@register.simple_tag
+def rendition_url(image, width):
+    """URL da maior versão JPEG até `width` (ex: imagens de fundo em CSS); o original se não houver."""
+    if not image:
+        return ''
+    widths = [w for w in available_widths(image.name, image.storage) if w <= width]
+    return image.storage.url(rendition_name(image.name, widths[-1], 'jpg')) if widths else image.url
@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import csv
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+from django.db.models import Count
+from django.utils.text import slugify
+from .cart import CART_SESSION_KEY, CacheCartBackend
+from .pagination import encode_cursor, paginate_keyset
+from .emails import queue_email
+from . import ceremonies, fake_data, images, search
+from .storage import media_storage
+from .models import (
+    Category, Product, Order, Ceremony, CeremonyRegistration, Therapy, StoredCart, CartLine, EmailOutbox,
+    StockReservation, SiteSettings, PaymentMethod, ShippingMethod, OrderItem, DailySales, DailyProductSales,
+    Appointment, Anamnesis,
+)
 
-# Create your tests here.
+
+_module_cleanups = []
+
+
+def setUpModule():
+    # O mesmo backend de cache que o site (ficheiros, partilhado entre processos), numa pasta
+    # temporária: cache.clear() nos testes não toca na cache real em var/cache
+    cache_dir = tempfile.mkdtemp(prefix='loja_test_cache_')
+    override = override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+    })
+    override.enable()
+    _module_cleanups.extend([override.disable, lambda: shutil.rmtree(cache_dir, ignore_errors=True)])
+
+
+def tearDownModule():
+    while _module_cleanups:
+        _module_cleanups.pop()()
+
+
+def iter_route_paths(patterns, prefix=''):
+    """Percorre o URLconf e devolve as rotas (só RoutePattern; os regex do admin são ignorados)."""
+    for pattern in patterns:
+        route = getattr(pattern.pattern, '_route', None)
+        if route is None:
+            continue
+        if isinstance(pattern, URLResolver):
+            yield from iter_route_paths(pattern.url_patterns, prefix + route)
+        elif isinstance(pattern, URLPattern):
+            yield prefix + route
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.velas, self.livros = Category.objects.create(name='Velas'), Category.objects.create(name='Livros')
+        products = Product.objects.bulk_create(
+            Product(category=self.velas if i % 2 else self.livros, name=f'Produto {i}', slug=f'produto-{i}', price='1.00')
+            for i in range(7)
+        )
+        # Vários produtos com o mesmo created_at: o id desempata
+        moment = timezone.now()
+        Product.objects.filter(id__in=[p.id for p in products[:4]]).update(created_at=moment)
+        Product.objects.filter(id__in=[p.id for p in products[4:]]).update(created_at=moment - timedelta(days=1))
+        self.expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def page(self, url, queryset=None, per_page=3):
+        return paginate_keyset(queryset or Product.objects.all(), self.factory.get(url), per_page=per_page)
+
+    def test_next_and_previous_cursors_walk_ties_in_order(self):
+        seen, url, pages = [], '/', []
+        while url:
+            page = self.page(url)
+            pages.append(page)
+            seen += [p.id for p in page]
+            url = page.next_url
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+
+        # Voltar atrás a partir da última página devolve exatamente a página do meio
+        previous = self.page(pages[-1].previous_url)
+        self.assertEqual([p.id for p in previous], self.expected[3:6])
+        self.assertEqual([p.id for p in self.page(previous.previous_url)], self.expected[:3])
+
+    def test_category_filter_and_tampered_cursor(self):
+        velas = Product.objects.filter(category=self.velas)
+        first = self.page('/', velas, per_page=2)
+        second = self.page(first.next_url, velas, per_page=2)
+        self.assertIsNone(second.next_url)
+        self.assertEqual([p.id for p in first] + [p.id for p in second],
+                         [pk for pk in self.expected if pk in set(velas.values_list('id', flat=True))])
+
+        # Cursor inválido: volta à primeira página em vez de dar erro
+        for cursor in ('lixo', encode_cursor(('não-é-data', 1)), encode_cursor(('2026-01-01T00:00:00',))):
+            self.assertEqual([p.id for p in self.page(f'/?after={cursor}')], self.expected[:3])
+        response = self.client.get('/?after=%%%')
+        self.assertEqual(response.status_code, 200)
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.category = Category.objects.create(name='Velas')
+
+    def make(self, name, description='', **kwargs):
+        return Product.objects.create(category=self.category, name=name, slug=slugify(name), price='1.00',
+                                      description=description, **kwargs)
+
+    def indexed(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT name FROM {search.FTS_TABLE} WHERE rowid = %s", [product.pk])
+            row = cursor.fetchone()
+        return row and row[0]
+
+    def results(self, query):
+        return [p.name for p in search.search_products(query, self.factory.get('/'))]
+
+    def test_bm25_ranks_name_matches_first_and_skips_inactive(self):
+        self.make('Incenso de Mirra', description='aroma de lavanda')
+        self.make('Vela de Lavanda')
+        self.make('Lavanda Antiga', is_active=False)
+        self.assertEqual(self.results('lavanda'), ['Vela de Lavanda', 'Incenso de Mirra'])
+        # Sem acentos e com prefixo na última palavra
+        self.assertEqual(self.results('lavan'), ['Vela de Lavanda', 'Incenso de Mirra'])
+
+    def test_index_follows_product_changes(self):
+        product = self.make('Vela Lua')
+        self.assertEqual(self.indexed(product), 'Vela Lua')
+        product.name = 'Vela Sol'
+        product.save()
+        self.assertEqual(self.indexed(product), 'Vela Sol')
+        self.assertEqual(self.results('lua'), [])
+        product.delete()
+        self.assertIsNone(self.indexed(product))
+
+    def test_fts_syntax_in_query_is_harmless(self):
+        self.make('Vela "Lua" - Grande')
+        for query in ('"', 'vela"', '*', 'lua*', '-grande', 'vela NEAR lua', 'NEAR(', 'vela AND', '(', ':', '^lua'):
+            self.results(query)
+        self.assertEqual(self.results('"lua" -grande'), ['Vela "Lua" - Grande'])
+
+
+class AnonymousSessionWriteTests(TestCase):
+    """Páginas de consulta não podem criar sessões (nem Set-Cookie de sessão) para visitantes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+        ceremony = Ceremony.objects.create(
+            name='Lua Cheia', description='-', image='ceremonies/x.jpg',
+            event_date=timezone.now() + timedelta(days=7),
+        )
+        registration = CeremonyRegistration.objects.create(ceremony=ceremony, full_name='Ana', email='ana@exemplo.com')
+        Therapy.objects.create(name='Reiki', description='-', image='therapies/x.jpg', price='40.00')
+        cls.values = {
+            'category_slug': category.slug,
+            'slug': product.slug,
+            'product_id': product.id,
+            'cart_key': f'{product.id}_no_variant',
+            'ceremony_id': ceremony.id,
+            'registration_id': registration.id,
+            'object_id': product.id,
+        }
+
+    def build_path(self, route):
+        def replace(match):
+            return str(self.values.get(match.group(2), 1))
+        return '/' + re.sub(r'<(?:(\w+):)?(\w+)>', replace, route)
+
+    def test_get_requests_do_not_write_sessions(self):
+        paths = sorted(set(self.build_path(route) for route in iter_route_paths(get_resolver().url_patterns)))
+        self.assertIn('/', paths)
+        for path in paths:
+            with self.subTest(path=path), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+                session_writes = [
+                    q['sql'] for q in queries
+                    if 'django_session' in q['sql'] and not q['sql'].lstrip().upper().startswith('SELECT')
+                ]
+                self.assertEqual(session_writes, [])
+
+    def test_cart_add_creates_session(self):
+        response = self.client.post(f"/carrinho/adicionar/{self.values['product_id']}/", HTTP_ORIGIN='http://testserver')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertIn(CART_SESSION_KEY, self.client.session)
+
+
+class ServerSideCartTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+        cls.other = Product.objects.create(category=category, name='Incenso', price='3.50', stock=5)
+        cls.user = User.objects.create_user(username='ana', password='segredo-123')
+
+    def add(self, product, times=1):
+        for _ in range(times):
+            self.client.post(f'/carrinho/adicionar/{product.id}/', HTTP_ORIGIN='http://testserver')
+
+    def test_session_only_holds_cart_id(self):
+        self.add(self.product, times=3)
+        self.add(self.other)
+        self.assertEqual(list(self.client.session.keys()), [CART_SESSION_KEY])
+        self.assertEqual(
+            dict(CartLine.objects.values_list('product_id', 'quantity')),
+            {self.product.id: 3, self.other.id: 1},
+        )
+
+    def test_login_merges_anonymous_cart_into_user_cart(self):
+        user_cart = StoredCart.objects.create(user=self.user)
+        CartLine.objects.create(cart=user_cart, key=f'{self.product.id}_no_variant', product=self.product, quantity=2)
+        self.add(self.product)
+        self.add(self.other)
+
+        self.client.post('/login/', {'username': 'ana', 'password': 'segredo-123'})
+
+        self.assertEqual(self.client.session[CART_SESSION_KEY], user_cart.token)
+        self.assertEqual(StoredCart.objects.count(), 1)
+        self.assertEqual(
+            dict(user_cart.lines.values_list('product_id', 'quantity')),
+            {self.product.id: 3, self.other.id: 1},
+        )
+
+    def test_cart_page_query_count_does_not_grow_with_lines(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/carrinho/')
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        self.add(self.product)
+        self.add(self.other)
+        small = count_queries()
+
+        category = self.product.category
+        products = Product.objects.bulk_create(
+            Product(category=category, name=f'Extra {i}', slug=f'extra-{i}', price='1.10') for i in range(48)
+        )
+        cart = StoredCart.objects.get()
+        CartLine.objects.bulk_create(
+            CartLine(cart=cart, key=f'{p.id}_no_variant', product=p, quantity=2) for p in products
+        )
+        self.assertEqual(count_queries(), small)
+
+
+    def test_cart_add_form_works_without_csrf_token_from_same_origin(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        path = f'/carrinho/adicionar/{self.product.id}/'
+        self.assertEqual(client.post(path, HTTP_ORIGIN='http://testserver').status_code, 302)
+        self.assertEqual(client.post(path, HTTP_REFERER=f'http://testserver/produto/{self.product.slug}/').status_code, 302)
+        self.assertEqual(client.post(path, HTTP_ORIGIN='https://loja.pythonanywhere.com').status_code, 302)
+        self.assertEqual(CartLine.objects.get().quantity, 3)
+
+        for headers in ({'HTTP_ORIGIN': 'https://outro-site.com'}, {'HTTP_ORIGIN': 'null'}, {}):
+            with self.subTest(headers=headers):
+                self.assertEqual(client.post(path, **headers).status_code, 403)
+        self.assertEqual(CartLine.objects.get().quantity, 3)
+
+    # O lock do CacheCartBackend precisa de um cache.add atómico (Redis/Memcached ou memória)
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cache_backend_concurrent_adds_keep_every_line(self):
+        backend = CacheCartBackend()
+        cart_id = backend.create()
+        real_get = LocMemCache.get
+
+        def slow_get(self, key, *args, **kwargs):
+            # Alarga a janela entre ler e gravar: sem lock, as threads perdiam incrementos
+            value = real_get(self, key, *args, **kwargs)
+            time.sleep(0.001)
+            return value
+
+        def add_many(product_id):
+            for _ in range(20):
+                backend.add(cart_id, product_id, None, 1)
+
+        with mock.patch.object(LocMemCache, 'get', slow_get):
+            threads = [threading.Thread(target=add_many, args=(pid,)) for pid in (1, 1, 2, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        lines = backend.load(cart_id)
+        self.assertEqual({key: line['quantity'] for key, line in lines.items()}, {'1_no_variant': 40, '2_no_variant': 40})
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CART_BACKEND='store.cart.CacheCartBackend',
+    )
+    def test_cache_backend_refuses_writes_when_the_lock_is_taken(self):
+        key = f'{self.product.id}_no_variant'
+        self.client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': 1})
+        cart_id = self.client.session[CART_SESSION_KEY]
+        # Outro pedido segura o lock e não o larga dentro do prazo
+        cache.set(CacheCartBackend()._key(cart_id) + ':lock', 'outro-pedido', 60)
+
+        with mock.patch.object(CacheCartBackend, 'lock_timeout', 0.05):
+            response = self.client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': 2})
+            self.assertEqual(response.status_code, 409)
+            response = self.client.post(f'/carrinho/api/remover/{key}/')
+            self.assertEqual(response.status_code, 409)
+
+        self.assertEqual({k: line['quantity'] for k, line in CacheCartBackend().load(cart_id).items()}, {key: 1})
+        self.assertEqual(list(StockReservation.objects.values_list('quantity', flat=True)), [1])
+
+class CartApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+
+    def test_add_update_remove(self):
+        response = self.client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': 2})
+        key = f'{self.product.id}_no_variant'
+        self.assertEqual(response.json(), {
+            'count': 2, 'total': '19.80', 'lines': [{'key': key, 'quantity': 2, 'total_price': '19.80'}],
+        })
+
+        response = self.client.post(f'/carrinho/api/quantidade/{key}/', {'quantity': 3})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(response.json()['total'], '29.70')
+
+        response = self.client.post(f'/carrinho/api/remover/{key}/')
+        self.assertEqual(response.json(), {'count': 0, 'total': '0.00', 'lines': []})
+        self.assertEqual(self.client.get('/carrinho/api/').json()['count'], 0)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post('/carrinho/api/quantidade/1_no_variant/', {'quantity': 1}).status_code, 404)
+        self.assertEqual(self.client.get(f'/carrinho/api/adicionar/{self.product.id}/').status_code, 405)
+        response = self.client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class CheckoutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Velas')
+        cls.form_data = {'full_name': 'Ana Silva', 'email': 'ana@exemplo.com', 'address': 'Rua 1', 'city': 'Lisboa'}
+
+    def make_products(self, count, stock=5):
+        return Product.objects.bulk_create(
+            Product(category=self.category, name=f'Produto {i}', slug=f'produto-{i}', price='2.50', stock=stock)
+            for i in range(count)
+        )
+
+    def checkout(self, products, quantity=1, before_submit=None):
+        for product in products:
+            self.client.post(f'/carrinho/api/adicionar/{product.id}/', {'quantity': quantity})
+        if before_submit:
+            before_submit()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/checkout/', {**self.form_data, 'checkout_token': uuid.uuid4().hex})
+        return response, len(queries)
+
+    def test_checkout_decrements_stock_and_creates_items(self):
+        products = self.make_products(3)
+        response, _ = self.checkout(products, quantity=2)
+        self.assertTemplateUsed(response, 'store/order_success.html')
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, Decimal('15.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual((order.items_summary, order.items_count), ('2x Produto 0, 2x Produto 1, 2x Produto 2', 6))
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_short_stock_rolls_back_everything(self):
+        # O stock baixa (ex: acerto no admin) depois de os artigos estarem no carrinho
+        products = self.make_products(2)
+        response, _ = self.checkout(
+            products, quantity=2, before_submit=lambda: Product.objects.filter(pk=products[1].pk).update(stock=1),
+        )
+        self.assertContains(response, 'Stock insuficiente para: Produto 1')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('id', 'stock')), {products[0].id: 5, products[1].id: 1})
+
+    def test_resubmitting_the_same_token_returns_the_existing_order(self):
+        products = self.make_products(1)
+        self.client.post(f'/carrinho/api/adicionar/{products[0].id}/', {'quantity': 2})
+        data = {**self.form_data, 'checkout_token': 'token-unico'}
+        first = self.client.post('/checkout/', data)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post('/checkout/', data)
+        self.assertEqual(first.context['order'], second.context['order'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock, 3)
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+    def test_unique_key_is_enforced_inside_place_order(self):
+        # Simula a corrida: a verificação na view ainda não viu a primeira encomenda
+        products = self.make_products(1)
+        self.client.post(f'/carrinho/api/adicionar/{products[0].id}/')
+        self.client.post('/checkout/', {**self.form_data, 'checkout_token': 'corrida'})
+        self.client.post(f'/carrinho/api/adicionar/{products[0].id}/')
+        with mock.patch('store.views.find_order_by_key', return_value=None):
+            response = self.client.post('/checkout/', {**self.form_data, 'checkout_token': 'corrida'})
+        self.assertTemplateUsed(response, 'store/order_success.html')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock, 4)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        _, few = self.checkout(self.make_products(2))
+        Product.objects.all().delete()
+        _, many = self.checkout(self.make_products(20))
+        self.assertEqual(few, many)
+
+
+class EmailOutboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+
+    def test_checkout_queues_emails_without_sending(self):
+        self.client.post(f'/carrinho/api/adicionar/{self.product.id}/')
+        self.client.post('/checkout/', {
+            'full_name': 'Ana', 'email': 'ana@exemplo.com', 'address': 'Rua 1', 'city': 'Lisboa', 'checkout_token': 'abc',
+        })
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 2)
+
+        call_command('send_outbox', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ['ana@exemplo.com'])
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 2)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        queue_email('Olá', 'Mensagem', ['ana@exemplo.com'])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP em baixo')):
+            call_command('send_outbox', stdout=StringIO())
+        message = EmailOutbox.objects.get()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(message.last_error, 'SMTP em baixo')
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        call_command('send_outbox', stdout=StringIO())
+        self.assertEqual(EmailOutbox.objects.get().status, 'sent')
+
+
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=3)
+        cls.form_data = {'full_name': 'Ana', 'email': 'ana@exemplo.com', 'address': 'Rua 1', 'city': 'Lisboa'}
+
+    def add(self, client, quantity):
+        return client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': quantity})
+
+    def test_hold_blocks_other_carts(self):
+        self.assertEqual(self.add(self.client, 2).status_code, 200)
+        other = self.client_class()
+        self.assertEqual(self.add(other, 2).status_code, 409)
+        self.assertEqual(self.add(other, 1).status_code, 200)
+        self.assertEqual(
+            sorted(StockReservation.objects.values_list('quantity', flat=True)), [1, 2],
+        )
+
+        response = self.client.get(f'/produto/{self.product.id}/disponibilidade/')
+        self.assertEqual(response.json(), {'available_stock': 0})
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_cached_product_page_does_not_embed_availability(self):
+        cache.clear()
+        path = f'/produto/{self.product.slug}/'
+        availability = f'/produto/{self.product.id}/disponibilidade/'
+        self.client.get(path)
+        self.assertEqual(self.client.get(availability).json(), {'available_stock': 3})
+
+        self.add(self.client, 2)
+        self.client.post('/checkout/', {**self.form_data, 'checkout_token': 'abc'})
+        # O checkout não invalida as páginas do catálogo; o stock vem sempre do endpoint
+        response = self.client.get(path)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, '<span data-available-stock></span>')
+        self.assertEqual(self.client.get(availability).json(), {'available_stock': 1})
+
+    def test_checkout_respects_other_holds_and_releases_own(self):
+        self.add(self.client, 2)
+        # O stock baixa depois da reserva: só resta 1 unidade para além das 2 reservadas
+        Product.objects.filter(pk=self.product.pk).update(stock=2)
+        other = self.client_class()
+        self.assertEqual(self.add(other, 1).status_code, 409)
+
+        self.client.post('/checkout/', {**self.form_data, 'checkout_token': 'reserva'})
+        self.assertEqual(Product.objects.get().stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_free_stock_and_are_swept(self):
+        self.add(self.client, 3)
+        other = self.client_class()
+        self.assertEqual(self.add(other, 1).status_code, 409)
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add(other, 1).status_code, 200)
+
+        call_command('expire_reservations', stdout=StringIO())
+        self.assertEqual(list(StockReservation.objects.values_list('quantity', flat=True)), [1])
+
+    def test_removing_a_line_releases_the_hold(self):
+        self.add(self.client, 2)
+        self.client.post(f'/carrinho/api/remover/{self.product.id}_no_variant/')
+        self.assertFalse(StockReservation.objects.exists())
+
+
+
+class CheckoutBenchmarkTests(TestCase):
+
+    def test_bench_checkout_smoke(self):
+        # Corre noutro processo: o comando troca a base de dados por um ficheiro SQLite e faz fork dos workers
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        # A base de dados e a cache do projeto nunca são abertas: tudo fica na pasta temporária
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'config.settings',
+            'SQLITE_PATH': os.path.join(workdir, 'default.sqlite3'),
+            'CACHE_BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'CACHE_LOCATION': os.path.join(workdir, 'cache'),
+        }
+        env.pop('REDIS_URL', None)
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'bench_checkout', '--workers', '2', '--orders', '2',
+             '--hot-stock', '1', '--hot-ratio', '1', '--cold-products', '1',
+             '--sqlite', os.path.join(workdir, 'bench.sqlite3')],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Invariante de stock OK', result.stdout)
+        outcomes = dict(
+            item.split('=') for item in re.search(r'Resultados: (.*)', result.stdout).group(1).split(', ')
+        )
+        self.assertEqual(sum(map(int, outcomes.values())), 4)
+        self.assertNotIn('error', outcomes)
+
+class ReferenceDataTests(TestCase):
+    REFERENCE_TABLES = ('store_sitesettings', 'store_category', 'store_paymentmethod', 'store_shippingmethod')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Velas')
+        Product.objects.create(category=cls.category, name='Vela', price='9.90', stock=5)
+        SiteSettings.objects.create(site_name='Loja Zen')
+        PaymentMethod.objects.create(name='MB Way')
+        ShippingMethod.objects.create(name='CTT', price='3.00')
+
+    def setUp(self):
+        cache.clear()
+
+    def reference_queries(self, path):
+        self.client.get(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries if any(table in q['sql'] for table in self.REFERENCE_TABLES)]
+
+    def test_pages_do_not_query_reference_data(self):
+        self.client.post(f'/carrinho/api/adicionar/{Product.objects.get().id}/')
+        for path in ('/', f'/categoria/{self.category.slug}/', '/checkout/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.reference_queries(path), [])
+
+    def test_saving_invalidates_the_cache(self):
+        self.assertContains(self.client.get('/'), 'Loja Zen')
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteSettings.objects.update(site_name='Loja Nova')
+            SiteSettings.objects.get().save()
+        self.assertContains(self.client.get('/'), 'Loja Nova')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentMethod.objects.create(name='Transferência')
+        self.client.post(f'/carrinho/api/adicionar/{Product.objects.get().id}/')
+        self.assertContains(self.client.get('/checkout/'), 'Transferência')
+
+
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path='/', client=None):
+        response = (client or self.client).get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Vela')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.get('/?q=vela')['X-Page-Cache'], 'miss')
+
+        out = StringIO()
+        call_command('page_cache_stats', stdout=out)
+        self.assertIn('Acertos: 1 | Falhas: 2', out.getvalue())
+
+    def test_catalogue_change_bumps_the_version(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Vela Nova')
+            Product.objects.get(pk=self.product.pk).save()
+        response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Vela Nova')
+
+    def test_pages_are_shared_between_visitors(self):
+        path = f'/produto/{self.product.slug}/'
+        first = self.get(path)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertNotIn('Cookie', first.get('Vary', ''))
+        self.assertIn('s-maxage', first['Cache-Control'])
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, first.cookies)
+
+        # Com carrinho e com login o HTML é o mesmo: a parte pessoal vem de /sessao/
+        self.client.post(f'/carrinho/api/adicionar/{self.product.id}/')
+        self.assertEqual(self.get(path)['X-Page-Cache'], 'hit')
+        other = self.client_class()
+        other.force_login(User.objects.create_user(username='ana', password='segredo-123'))
+        self.assertEqual(self.get(path, client=other)['X-Page-Cache'], 'hit')
+
+    def test_session_state_endpoint(self):
+        response = self.get('/sessao/')
+        self.assertEqual(response.json()['cart_count'], 0)
+        self.assertEqual(response.json()['account']['label'], 'Login')
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        self.client.force_login(User.objects.create_user(username='ana', password='segredo-123'))
+        token = self.get('/sessao/').json()['csrf_token']
+        self.client.post(f'/carrinho/api/adicionar/{self.product.id}/', {'quantity': 2})
+        state = self.get('/sessao/').json()
+        self.assertEqual((state['cart_count'], state['account']['label']), (2, 'Minha Conta'))
+        self.assertTrue(token)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Velas')
+        cls.product = Product.objects.create(category=category, name='Vela', price='9.90', stock=5)
+        cls.path = f'/produto/{cls.product.slug}/'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matching_etag_returns_304_before_rendering(self):
+        response = self.client.get(self.path)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cached['X-Page-Cache'], 'hit')
+
+        # Sem a página em cache: o 304 sai da query do próprio produto, sem render nem agregados
+        with mock.patch('store.page_cache.is_cacheable_request', return_value=False), \
+                mock.patch('store.views.render') as render, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('MAX', queries[0]['sql'])
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertEqual(self.client.get('/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_list_etag_follows_the_rows_of_the_page(self):
+        Product.objects.bulk_create(
+            Product(category=self.product.category, name=f'Incenso {i}', slug=f'incenso-{i}', price='2.00')
+            for i in range(3)
+        )
+        with mock.patch('store.page_cache.is_cacheable_request', return_value=False), \
+                mock.patch('store.views.paginate_keyset', side_effect=lambda qs, request: paginate_keyset(qs, request, per_page=2)):
+            first = self.client.get('/')
+            etag = first['ETag']
+            next_url = first.context['products'].next_url
+            self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            # Uma alteração sem sinais (update) a um produto de outra página não muda esta página
+            Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now())
+            self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get('/' + next_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+            # ... mas uma alteração numa linha da página muda o ETag
+            shown = first.context['products'].object_list[0]
+            Product.objects.filter(pk=shown.pk).update(updated_at=timezone.now())
+            self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_produce_a_new_etag(self):
+        etag = self.client.get(self.path)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ImageRenditionTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        cache.clear()
+
+    def upload(self, name, width=1200, height=800):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'purple').save(buffer, 'JPEG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_renditions_are_written_next_to_the_original(self):
+        name = self.upload('products/vela.jpg')
+        self.assertEqual(images.generate_renditions(name), 6)
+        self.assertEqual(images.available_widths(name), [320, 640, 1024])
+        self.assertTrue(default_storage.exists('products/vela.w640.webp'))
+        # Já existem: não volta a gerar nem descodifica o original
+        with mock.patch.object(images.Image.Image, 'load') as load:
+            self.assertEqual(images.generate_renditions(name), 0)
+        load.assert_not_called()
+
+        default_storage.delete('products/vela.w640.jpg')
+        self.assertEqual(images.generate_renditions(name), 1)
+
+    def test_renditions_are_scheduled_only_when_the_image_changes(self):
+        category = Category.objects.create(name='Velas')
+        with mock.patch.object(images, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Product.objects.create(category=category, name='Vela', price='1.00',
+                                                 image=self.upload('products/vela.jpg'))
+            schedule.assert_called_once_with(['products/vela.jpg'])
+
+            schedule.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                product.price = '2.00'
+                product.save()
+                product.save(update_fields=['price'])
+            schedule.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                product.image = self.upload('products/lua.jpg')
+                product.save()
+            schedule.assert_called_once_with(['products/lua.jpg'])
+
+    def test_template_tag_emits_srcset(self):
+        category = Category.objects.create(name='Velas')
+        product = Product(category=category, name='Vela', price='1.00', image=self.upload('products/vela.jpg'))
+        template = Template('{% load store_images %}{% responsive_image product.image sizes="50vw" alt="Vela" %}')
+
+        html = template.render(Context({'product': product}))
+        self.assertIn('src="/media/products/vela.jpg"', html)
+        self.assertIn('loading="lazy"', html)
+
+        images.generate_renditions(product.image.name)
+        html = template.render(Context({'product': product}))
+        # As larguras ficam em cache: os renders seguintes não perguntam ao storage
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.assertEqual(template.render(Context({'product': product})), html)
+        exists.assert_not_called()
+        self.assertIn('<source type="image/webp" srcset="/media/products/vela.w320.webp 320w, ', html)
+        self.assertIn('/media/products/vela.w1024.jpg 1024w" sizes="50vw"', html)
+
+    def test_schedule_failures_are_logged_and_the_pool_is_replaced(self):
+        from concurrent.futures.process import BrokenProcessPool
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('worker morreu')
+        healthy = mock.Mock()
+        with mock.patch.object(images, '_pool', None), \
+                mock.patch.object(images, 'create_pool', side_effect=[broken, healthy]) as create_pool, \
+                self.assertLogs('store.images', 'WARNING') as logs:
+            images.schedule(['products/a.jpg', 'products/b.jpg'])
+            self.assertIs(images._pool, healthy)
+        self.assertEqual(create_pool.call_count, 2)
+        broken.shutdown.assert_called_once()
+        healthy.submit.assert_called_once()
+        self.assertIn('products/a.jpg', logs.output[0])
+
+    def test_backfill_command(self):
+        category = Category.objects.create(name='Velas')
+        Product.objects.create(category=category, name='Vela', price='1.00', image=self.upload('products/a.jpg'))
+        Therapy.objects.create(name='Reiki', description='-', price='40.00', image=self.upload('therapies/b.jpg', 500, 500))
+        out = StringIO()
+        call_command('generate_renditions', workers=1, stdout=out)
+        self.assertIn('Ficheiros gerados: 8', out.getvalue())
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(name='Velas')
+
+    def product(self, name, content):
+        product = Product(category=self.category, name=name, price='1.00')
+        product.image.save('foto.JPG', ContentFile(content), save=False)
+        product.save()
+        return product
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.product('A', b'mesmo conteudo')
+        second = self.product('B', b'mesmo conteudo')
+        other = self.product('C', b'outro conteudo')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(first.image.read(), b'mesmo conteudo')
+
+    def test_concurrent_identical_save_returns_the_existing_blob(self):
+        storage = media_storage()
+        first = storage.save('a.jpg', ContentFile(b'mesmo conteudo'))
+        # Como um segundo pedido que verificou exists() antes de o primeiro gravar
+        with mock.patch.object(type(storage), 'exists', return_value=False):
+            second = storage.save('b.jpg', ContentFile(b'mesmo conteudo'))
+        self.assertEqual(first, second)
+        self.assertEqual(storage.open(first).read(), b'mesmo conteudo')
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(first))), [os.path.basename(first)])
+
+    def test_gc_removes_unreferenced_blobs_and_renditions(self):
+        kept = self.product('A', b'usado')
+        dropped = self.product('B', b'sem uso')
+        rendition = images.rendition_name(dropped.image.name, 320, 'webp')
+        default_storage.save(rendition, ContentFile(b'x'))
+        dropped_name = dropped.image.name
+        dropped.delete()
+
+        out = StringIO()
+        call_command('gc_media', min_age=0, stdout=out)
+        self.assertIn('Apagados: 2 ficheiros', out.getvalue())
+        self.assertFalse(default_storage.exists(dropped_name))
+        self.assertFalse(default_storage.exists(rendition))
+        self.assertTrue(default_storage.exists(kept.image.name))
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.content = bytes(range(256)) * 4
+        self.name = media_storage().save('foto.jpg', ContentFile(self.content))
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_file_with_immutable_cache_and_etag(self):
+        response = self.client.get(f'/media/{self.name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+        cached = self.client.get(f'/media/{self.name}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+            self.assertEqual(cached[header], response[header])
+        cached = self.client.get(f'/media/{self.name}', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/media/nao-existe.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../config/settings.py').status_code, 404)
+
+    def test_range_requests(self):
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(self.body(response), self.content[10:20])
+
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=-6')
+        self.assertEqual(self.body(response), self.content[-6:])
+        self.assertEqual(self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=5000-').status_code, 416)
+        # If-Range com outro ETag: o ficheiro mudou, devolve-o inteiro
+        response = self.client.get(f'/media/{self.name}', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_precompressed_variant(self):
+        name = default_storage.save('docs/lista.csv', ContentFile(b'nome;preco\n' * 200))
+        call_command('compress_media', stdout=StringIO())
+        response = self.client.get(f'/media/{name}', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertNotIn('Content-Encoding', self.client.get(f'/media/{name}'))
+
+
+class ImportCatalogTests(TestCase):
+
+    def write(self, suffix, content):
+        f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        self.addCleanup(os.remove, f.name)
+        with f:
+            f.write(content)
+        return f.name
+
+    def test_csv_import_upserts_and_resolves_slug_collisions(self):
+        path = self.write('.csv', (
+            "category,name,price,stock,variants,images\n"
+            "Velas,Vela Lua,9.90,5,Pequena:0|Grande:2.50,blobs/a.jpg\n"
+            "Velas,Vela-Lua,8.00,1,,\n"
+            "Incensos,Incenso,3.5,10,,\n"
+            "Incensos,,3.5,10,,\n"
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, batch_size=2, stdout=out, stderr=err)
+        self.assertIn('3 produtos', out.getvalue())
+        self.assertIn('linha 5', err.getvalue())
+        self.assertEqual(
+            dict(Product.objects.values_list('slug', 'name')),
+            {'vela-lua': 'Vela Lua', 'vela-lua-2': 'Vela-Lua', 'incenso': 'Incenso'},
+        )
+        vela = Product.objects.get(slug='vela-lua')
+        self.assertEqual(dict(vela.variants.values_list('name', 'price_extra')),
+                         {'Pequena': Decimal('0.00'), 'Grande': Decimal('2.50')})
+        self.assertEqual(list(vela.images.values_list('image', flat=True)), ['blobs/a.jpg'])
+
+        # Segunda importação: atualiza em vez de duplicar
+        path = self.write('.jsonl', (
+            '{"category": "Velas", "name": "Vela Lua", "slug": "vela-lua", "price": "11.00", "stock": 2,'
+            ' "variants": [{"name": "Grande", "price_extra": "3.00"}], "images": ["blobs/a.jpg"]}\n'
+        ))
+        call_command('import_catalog', path, stdout=StringIO())
+        vela.refresh_from_db()
+        self.assertEqual((vela.price, vela.stock), (Decimal('11.00'), 2))
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(vela.variants.get(name='Grande').price_extra, Decimal('3.00'))
+        self.assertEqual(vela.images.count(), 1)
+
+    def test_reimport_without_slugs_matches_existing_products(self):
+        category = Category.objects.create(name='Velas')
+        original = Product.objects.create(category=category, name='Vela Lua', price='9.90', stock=5)
+        path = self.write('.csv', (
+            "category,name,price,stock\n"
+            "Velas,Vela-Lua,8.00,1\n"
+            "Velas,Vela Lua,7.00,3\n"
+        ))
+        for _ in range(2):
+            call_command('import_catalog', path, stdout=StringIO())
+            self.assertEqual(
+                dict(Product.objects.values_list('slug', 'name')),
+                {'vela-lua': 'Vela Lua', 'vela-lua-2': 'Vela-Lua'},
+            )
+        original.refresh_from_db()
+        self.assertEqual((original.price, original.stock), (Decimal('7.00'), 3))
+        self.assertEqual(Product.objects.get(slug='vela-lua-2').price, Decimal('8.00'))
+
+    def test_reimport_keeps_columns_missing_from_the_file(self):
+        category = Category.objects.create(name='Velas')
+        Product.objects.create(category=category, name='Vela Lua', price='9.90', stock=5, description='Cera de soja',
+                               image='blobs/a.jpg', is_featured=True)
+        call_command('import_catalog', self.write('.csv', "category,name,price\nVelas,Vela Lua,7.00\n"), stdout=StringIO())
+        call_command('import_catalog', self.write('.jsonl', '{"category": "Velas", "name": "Vela Lua", "price": "6", "stock": 2}\n'),
+                     stdout=StringIO())
+        product = Product.objects.get()
+        self.assertEqual(
+            (product.price, product.stock, product.description, product.image.name, product.is_featured),
+            (Decimal('6.00'), 2, 'Cera de soja', 'blobs/a.jpg', True),
+        )
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Velas')
+        self.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Produto {i}', slug=f'produto-{i}', price='2.50', stock=5) for i in range(2)
+        )
+
+    def make_order(self, paid=False, total='12.50'):
+        order = Order.objects.create(full_name='Ana', email='ana@exemplo.com', address='Rua 1', city='Lisboa',
+                                     paid=paid, total_price=total)
+        OrderItem.objects.create(order=order, product=self.products[0], price='2.50', quantity=3)
+        OrderItem.objects.create(order=order, product=self.products[1], price='5.00', quantity=1)
+        return order
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.filter(orders__gt=0).values_list('date', 'orders', 'revenue')),
+            sorted(DailyProductSales.objects.filter(quantity__gt=0).values_list('date', 'product_id', 'quantity', 'revenue')),
+        )
+
+    def test_rollups_follow_paid_and_status_changes(self):
+        today = timezone.localdate()
+        order = self.make_order()
+        self.make_order(paid=True, total='7.50')
+        self.assertEqual(self.rollups()[0], [(today, 1, Decimal('7.50'))])
+
+        order.paid = True
+        order.save()
+        self.assertEqual(self.rollups()[0], [(today, 2, Decimal('20.00'))])
+        self.assertIn((today, self.products[0].id, 6, Decimal('15.00')), self.rollups()[1])
+
+        # Incremental e rebuild dão o mesmo resultado
+        incremental = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(self.rollups()[0], [(today, 1, Decimal('7.50'))])
+        Order.objects.all().delete()
+        self.assertEqual(self.rollups(), ([], []))
+
+    def test_dashboard_reads_rollups(self):
+        self.make_order(paid=True)
+        admin_user = User.objects.create_superuser('admin', 'admin@exemplo.com', 'segredo')
+        self.client.force_login(admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/')
+        self.assertEqual(response.context['sales_day'], Decimal('12.50'))
+        self.assertEqual(response.context['sales_month'], Decimal('12.50'))
+        self.assertEqual([row['total_sold'] for row in response.context['top_products']], [3, 1])
+        self.assertFalse([q for q in queries if 'SUM(' in q['sql'] and 'store_order' in q['sql']])
+
+
+class CalendarEventsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@exemplo.com', 'segredo'))
+        customer = User.objects.create_user('rita', first_name='Rita')
+        therapy = Therapy.objects.create(name='Reiki', description='-', image='t.jpg', price='40.00')
+        self.start = timezone.make_aware(datetime(2026, 9, 28))
+        self.inside = Appointment.objects.create(
+            user=customer, therapy=therapy, start_time=self.start + timedelta(days=2), end_time=self.start + timedelta(days=2, hours=1),
+        )
+        # Começa antes da janela mas ainda está a decorrer no início
+        Appointment.objects.create(user=customer, therapy=therapy, start_time=self.start - timedelta(hours=1),
+                                   end_time=self.start + timedelta(minutes=30), confirmed=True)
+        Appointment.objects.create(user=customer, therapy=therapy, start_time=self.start - timedelta(days=30),
+                                   end_time=self.start - timedelta(days=30) + timedelta(hours=1))
+        Ceremony.objects.create(name='Lua Cheia', description='-', image='c.jpg', event_date=self.start + timedelta(days=5))
+        Ceremony.objects.create(name='Antiga', description='-', image='c.jpg', event_date=self.start - timedelta(days=90))
+        self.url = '/admin/agenda/events/?start=2026-09-28T00:00:00Z&end=2026-11-09T00:00:00Z'
+
+    def test_feed_is_window_bounded_and_conditional(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        events = response.json()
+        self.assertEqual(sorted(e['title'] for e in events), ['Cerimónia: Lua Cheia', 'Reiki (Rita)', 'Reiki (Rita)'])
+        self.assertIn(f'/admin/store/appointment/{self.inside.id}/change/', [e['url'] for e in events])
+        # Sessão/utilizador + 2 agregados para o ETag + 1 query por modelo
+        self.assertLessEqual(len(queries), 6)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.inside.confirmed = True
+        self.inside.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/admin/agenda/events/?start=ontem').status_code, 400)
+
+
+class OrderChangelistTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@exemplo.com', 'segredo'))
+        category = Category.objects.create(name='Velas')
+        self.products = Product.objects.bulk_create(
+            Product(category=category, name=f'Produto {i}', slug=f'produto-{i}', price='2.50', stock=5) for i in range(3)
+        )
+
+    def make_orders(self, count):
+        customer = User.objects.create_user(f'cliente{Order.objects.count()}')
+        for _ in range(count):
+            order = Order.objects.create(user=customer, full_name='Ana', email='ana@exemplo.com', address='Rua 1', city='Lisboa')
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, price='2.50', quantity=2) for product in self.products
+            )
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/store/order/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.make_orders(2)
+        # Sem resumo (encomendas antigas): os itens vêm de uma query pré-carregada
+        response, few = self.changelist_queries()
+        self.assertContains(response, '2x Produto 0, 2x Produto 1, 2x Produto 2')
+        self.make_orders(10)
+        self.assertEqual(self.changelist_queries()[1], few)
+
+        call_command('backfill_order_summaries', batch_size=5, stdout=StringIO())
+        order = Order.objects.first()
+        self.assertEqual((order.items_summary, order.items_count), ('2x Produto 0, 2x Produto 1, 2x Produto 2', 6))
+        response, after = self.changelist_queries()
+        self.assertLessEqual(after, few)
+        self.assertContains(response, '2x Produto 0, 2x Produto 1, 2x Produto 2')
+
+
+class CeremonyCapacityTests(TestCase):
+
+    def setUp(self):
+        self.ceremony = Ceremony.objects.create(name='Lua Cheia', description='-', image='c.jpg',
+                                                event_date=timezone.now() + timedelta(days=5), max_participants=2)
+        self.payment = PaymentMethod.objects.create(name='MB Way')
+
+    def sign_up(self, name):
+        return self.client.post(f'/cerimonias/{self.ceremony.id}/', {
+            'full_name': name, 'email': 'a@exemplo.com', 'payment_method': self.payment.id,
+        })
+
+    def test_last_seat_is_claimed_once(self):
+        self.assertTemplateUsed(self.sign_up('Ana'), 'store/ceremony_success.html')
+        # Dois pedidos que já passaram a verificação is_full disputam o último lugar
+        self.assertTrue(ceremonies.claim_seat(self.ceremony.id))
+        self.assertFalse(ceremonies.claim_seat(self.ceremony.id))
+        self.ceremony.refresh_from_db()
+        self.assertTrue(self.ceremony.is_full)
+        response = self.sign_up('Rui')
+        self.assertContains(response, 'lotada')
+        self.assertEqual(self.ceremony.registrations.count(), 1)
+
+    def test_admin_changes_keep_counter_in_sync(self):
+        registration = CeremonyRegistration.objects.create(ceremony=self.ceremony, full_name='Ana', email='a@exemplo.com')
+        other = Ceremony.objects.create(name='Sol', description='-', image='c.jpg', event_date=timezone.now())
+        self.ceremony.refresh_from_db()
+        self.assertEqual(self.ceremony.registrations_count, 1)
+        registration.ceremony = other
+        registration.save()
+        self.assertEqual(dict(Ceremony.objects.values_list('name', 'registrations_count')), {'Lua Cheia': 0, 'Sol': 1})
+        registration.delete()
+        self.assertEqual(Ceremony.objects.get(name='Sol').registrations_count, 0)
+        ceremonies.recount()
+        self.assertEqual(set(Ceremony.objects.values_list('registrations_count', flat=True)), {0})
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@exemplo.com', 'segredo'))
+        category = Category.objects.create(name='Velas')
+        product = Product.objects.create(category=category, name='Vela Lua', slug='vela-lua', price='2.50', stock=5)
+        for name, paid in (('Ana', True), ('Rui', False)):
+            order = Order.objects.create(full_name=name, email='a@exemplo.com', address='Rua 1', city='Lisboa', paid=paid)
+            OrderItem.objects.create(order=order, product=product, price='2.50', quantity=2)
+        Order.objects.create(full_name='Sem Itens', email='s@exemplo.com', address='Rua 2', city='Porto', paid=True)
+
+    def test_csv_export_streams_filtered_changelist(self):
+        response = self.client.get('/admin/store/order/exportar/csv/?paid__exact=1')
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][0], 'Encomenda')
+        self.assertEqual(sorted((row[2], row[11], row[14]) for row in rows[1:]), [('Ana', 'Vela Lua', '5.00'), ('Sem Itens', '', '')])
+        self.assertIn('attachment; filename="encomendas-', response['Content-Disposition'])
+
+    def test_xlsx_action_exports_selection(self):
+        registration = CeremonyRegistration.objects.create(
+            ceremony=Ceremony.objects.create(name='Lua Cheia', description='-', image='c.jpg', event_date=timezone.now()),
+            full_name='Ana <Silva>', email='a@exemplo.com',
+        )
+        Anamnesis.objects.create(registration=registration, goals='Paz & luz')
+        response = self.client.post('/admin/store/ceremonyregistration/', {
+            'action': 'export_xlsx', '_selected_action': [registration.id],
+        })
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIn('xl/workbook.xml', archive.namelist())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('Ana &lt;Silva&gt;', sheet)
+        self.assertIn('Paz &amp; luz', sheet)
+        self.assertEqual(sheet.count('<row>'), 2)
+
+    def test_formula_cells_are_escaped(self):
+        order = Order.objects.create(
+            full_name='=HYPERLINK("http://x.pt","clique")', email='-2+3@exemplo.com', address='@SUM(A1)',
+            city='\tLisboa', paid=True,
+        )
+        response = self.client.get(f'/admin/store/order/exportar/csv/?id__exact={order.id}')
+        row = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))[1]
+        self.assertEqual(row[2:6], ["'=HYPERLINK(\"http://x.pt\",\"clique\")", "'-2+3@exemplo.com", "'@SUM(A1)", "'\tLisboa"])
+        self.assertEqual(row[10], '0.00')
+
+        response = self.client.get(f'/admin/store/order/exportar/xlsx/?id__exact={order.id}')
+        sheet = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t xml:space="preserve">\'=HYPERLINK(', sheet)
+        self.assertIn('<t xml:space="preserve">\'@SUM(A1)</t>', sheet)
+        self.assertNotIn('<t xml:space="preserve">=', sheet)
+
+
+class FakeDataTests(TestCase):
+    COUNTS = {'clients': 20, 'products': 15, 'orders': 30, 'appointments': 5, 'registrations': 2000}
+
+    def generate(self):
+        call_command('generate_fake_data', seed=7, chunk_size=8, stdout=StringIO(), **self.COUNTS)
+        return list(Order.objects.order_by('id').values_list('full_name', 'total_price', 'status', 'items_count'))
+
+    def test_generated_rows_respect_the_model_invariants(self):
+        self.generate()
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(Product.objects.count(), 15)
+        self.assertEqual(User.objects.filter(username__startswith='cliente').count(), 20)
+        statuses = {value for value, _ in Order._meta.get_field('status').choices}
+        for order in Order.objects.prefetch_related('items__product'):
+            items = list(order.items.all())
+            self.assertTrue(1 <= len(items) <= 5)
+            self.assertEqual(order.items_count, sum(item.quantity for item in items))
+            self.assertIn(order.status, statuses)
+            self.assertEqual(order.total_price, sum(item.price * item.quantity for item in items))
+            self.assertTrue(all(item.price == item.product.price for item in items))
+        # created_at histórico (auto_now_add desligado durante a geração)
+        self.assertLess(Order.objects.earliest('created_at').created_at, timezone.now() - timedelta(days=1))
+
+        # Nenhuma cerimónia com limite passa de max_participants e o contador bate certo
+        ceremonies = Ceremony.objects.annotate(taken=Count('registrations'))
+        self.assertTrue(any(c.max_participants for c in ceremonies))
+        for ceremony in ceremonies:
+            self.assertEqual(ceremony.registrations_count, ceremony.taken)
+            if ceremony.max_participants:
+                self.assertLessEqual(ceremony.taken, ceremony.max_participants)
+        expected = self.COUNTS['registrations']
+        if not any(c.max_participants == 0 for c in ceremonies):
+            expected = min(expected, sum(c.max_participants for c in ceremonies))
+        self.assertEqual(CeremonyRegistration.objects.count(), expected)
+
+    def test_same_seed_generates_the_same_data(self):
+        first = self.generate()
+        for model in (Order, CeremonyRegistration, Appointment, Product):
+            model.objects.all().delete()
+        User.objects.filter(username__startswith='cliente').delete()
+        self.assertEqual(self.generate(), first)
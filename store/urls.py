@@ -8,9 +8,15 @@ urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('categoria/<slug:category_slug>/', views.product_list, name='category_detail'),
     path('produto/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('produto/<int:product_id>/disponibilidade/', views.product_availability, name='product_availability'),
     path('carrinho/', views.cart_detail, name='cart_detail'),
     path('carrinho/adicionar/<int:product_id>/', views.cart_add, name='cart_add'),
     path('carrinho/remover/<str:cart_key>/', views.cart_remove, name='cart_remove'),
+    path('sessao/', views.session_state, name='session_state'),
+    path('carrinho/api/', views.cart_api_summary, name='cart_api_summary'),
+    path('carrinho/api/adicionar/<int:product_id>/', views.cart_api_add, name='cart_api_add'),
+    path('carrinho/api/quantidade/<str:cart_key>/', views.cart_api_update, name='cart_api_update'),
+    path('carrinho/api/remover/<str:cart_key>/', views.cart_api_remove, name='cart_api_remove'),
     path('checkout/', views.checkout, name='checkout'),
     path('minha-conta/', views.profile, name='profile'),
     path('registar/', views.register, name='register'),
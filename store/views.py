@@ -1,54 +1,126 @@
+import secrets
+from urllib.parse import urlsplit
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Product, Category, ProductVariant, Order, OrderItem, Ceremony, SiteSettings, CeremonyRegistration, Anamnesis, Therapy, Appointment
-from .cart import Cart
+from .models import Product, ProductVariant, Order, OrderItem, Ceremony, CeremonyRegistration, Anamnesis, Therapy, Appointment
+from .cart import CartBusyError, get_cart
+from .pagination import paginate_keyset
+from .orders import place_order, find_order_by_key, OutOfStockError
+from .reservations import with_available_stock
+from . import ceremonies, reference, search
 from .forms import OrderCreateForm, UserUpdateForm, UserRegisterForm, CeremonyRegistrationForm, ContactForm, AnamnesisForm, AppointmentForm
-from django.core.mail import send_mail
+from .emails import queue_email
+from .page_cache import cache_shared_page
+from .conditional import catalogue_condition
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
+from django.core.exceptions import PermissionDenied
 from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import is_same_domain
 from django.utils import timezone
 
+OUT_OF_STOCK_MESSAGE = "Não há unidades suficientes disponíveis deste produto."
+CART_BUSY_MESSAGE = "O carrinho está a ser atualizado noutro pedido. Tente novamente."
+
 # Função auxiliar para obter configurações em todas as views
 def get_common_context():
-    return {'site_settings': SiteSettings.objects.first()}
+    return {'site_settings': reference.site_settings()}
+
+def product_page(request, category_slug=None):
+    """
+    Produtos que product_list mostra (página do cursor ou da pesquisa e destaques).
+    Calculados uma vez por pedido: servem o ETag (catalogue_condition) e o render.
+    """
+    if not hasattr(request, '_store_product_page'):
+        category = None
+        products = Product.objects.filter(is_active=True)
+
+        # Filtro por Categoria
+        if category_slug:
+            category = reference.category_by_slug(category_slug, request)
+            if category is None:
+                raise Http404("Categoria não encontrada.")
+            products = products.filter(category=category)
+
+        # Pesquisa (Search) - índice FTS5 ordenado por relevância (store/search.py)
+        query = request.GET.get('q')
+        if query and search.is_enabled():
+            products = search.search_products(query, request, category=category)
+        else:
+            if query:
+                products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            products = paginate_keyset(products, request)
+
+        # Produtos em Destaque (apenas na Homepage sem filtros)
+        featured_products = []
+        is_first_page = not (request.GET.get('after') or request.GET.get('before'))
+        if not category_slug and not query and is_first_page:
+            featured_products = list(Product.objects.filter(is_active=True, is_featured=True)[:4])
+
+        request._store_product_page = {
+            'products': products,
+            'category': category,
+            'featured_products': featured_products,
+            'query': query,
+        }
+    return request._store_product_page
 
+def product_page_rows(request, category_slug=None):
+    page = product_page(request, category_slug)
+    return [*page['products'], *page['featured_products']]
+
+@cache_shared_page
+@catalogue_condition(product_page_rows)
 def product_list(request, category_slug=None):
-    category = None
-    products = Product.objects.filter(is_active=True)
-    
-    # Filtro por Categoria
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-
-    # Pesquisa (Search)
-    query = request.GET.get('q')
-    if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
-
-    # Produtos em Destaque (apenas na Homepage sem filtros)
-    featured_products = []
-    if not category_slug and not query:
-        featured_products = Product.objects.filter(is_active=True, is_featured=True)[:4]
-
-    context = {
-        'products': products, 
-        'category': category,
-        'featured_products': featured_products,
-        'query': query
-    }
+    context = dict(product_page(request, category_slug))
     context.update(get_common_context())
     return render(request, 'store/product_list.html', context)
 
+def detail_product(request, slug):
+    """Produto da página de detalhe, memorizado no pedido (ETag e render usam a mesma query)."""
+    if not hasattr(request, '_store_detail_product'):
+        request._store_detail_product = get_object_or_404(Product, slug=slug, is_active=True)
+    return request._store_detail_product
+
+@cache_shared_page
+@catalogue_condition(lambda request, slug: [detail_product(request, slug)])
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    context = {'product': product}
+    return render_product_detail(request, slug)
+
+def render_product_detail(request, slug, error=None):
+    # O stock disponível muda com cada reserva: não entra na página em cache (ver product_availability)
+    product = detail_product(request, slug)
+    context = {'product': product, 'error': error}
     context.update(get_common_context())
     return render(request, 'store/product_detail.html', context)
 
+def is_same_origin(request):
+    """O pedido veio de uma página deste site (cabeçalho Origin, ou Referer) ou de CSRF_TRUSTED_ORIGINS."""
+    source = request.META.get('HTTP_ORIGIN') or request.META.get('HTTP_REFERER')
+    if not source:
+        return False
+    source = urlsplit(source)
+    if source.scheme == request.scheme and source.netloc == request.get_host():
+        return True
+    return any(
+        source.scheme == trusted.scheme and is_same_domain(source.netloc, trusted.netloc.replace('*', '', 1))
+        for trusted in map(urlsplit, settings.CSRF_TRUSTED_ORIGINS)
+    )
+
+# A página do produto fica em cache para todos, por isso o formulário não leva token CSRF
+# (funciona sem JavaScript); a proteção contra pedidos de outros sites é a verificação de origem.
+@csrf_exempt
 def cart_add(request, product_id):
-    cart = Cart(request)
+    if request.method == 'POST' and not is_same_origin(request):
+        raise PermissionDenied("Origem do pedido não verificada.")
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     variant = None
     
@@ -57,12 +129,17 @@ def cart_add(request, product_id):
         if variant_id:
             variant = get_object_or_404(ProductVariant, id=variant_id)
         
-        cart.add(product=product, variant=variant)
+        try:
+            cart.add(product=product, variant=variant)
+        except OutOfStockError:
+            return render_product_detail(request, product.slug, error=OUT_OF_STOCK_MESSAGE)
+        except CartBusyError:
+            return render_product_detail(request, product.slug, error=CART_BUSY_MESSAGE)
         
     return redirect('store:cart_detail')
 
 def cart_remove(request, cart_key):
-    cart = Cart(request)
+    cart = get_cart(request)
     cart.remove(cart_key)
     return redirect('store:cart_detail')
 
@@ -71,6 +148,97 @@ def cart_detail(request):
     context.update(get_common_context())
     return render(request, 'store/cart_detail.html', context)
 
+# --- API JSON DO CARRINHO ---
+# Respostas pequenas para o frontend atualizar a página sem redirect nem novo render da base.
+
+def cart_summary_data(cart):
+    return {
+        'count': len(cart),
+        'total': str(cart.get_total_price()),
+        'lines': [
+            {'key': item['key'], 'quantity': item['quantity'], 'total_price': str(item['total_price'])}
+            for item in cart
+        ],
+    }
+
+def parse_quantity(value, default=1):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+@require_GET
+@never_cache
+def session_state(request):
+    """Parte pessoal das páginas (pedida por base.html depois do carregamento)."""
+    if request.user.is_authenticated and not request.user.is_staff:
+        account = {'url': reverse('store:profile'), 'label': 'Minha Conta'}
+    else:
+        account = {'url': reverse('store:login'), 'label': 'Login'}
+    response = JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'account': account,
+        'cart_count': len(get_cart(request)),
+        'csrf_token': get_token(request),
+    })
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+@require_GET
+@never_cache
+def product_availability(request, product_id):
+    """Stock disponível (stock menos reservas ativas), pedido pela página do produto depois do carregamento."""
+    product = get_object_or_404(with_available_stock(Product.objects.only('id', 'stock')), id=product_id, is_active=True)
+    return JsonResponse({'available_stock': max(0, product.available_stock)})
+
+@require_GET
+def cart_api_summary(request):
+    return JsonResponse(cart_summary_data(get_cart(request)))
+
+@require_POST
+def cart_api_add(request, product_id):
+    cart = get_cart(request)
+    product = get_object_or_404(Product, id=product_id, is_active=True)
+    variant = None
+    variant_id = request.POST.get('variant')
+    if variant_id:
+        variant = get_object_or_404(ProductVariant, id=variant_id, product=product)
+    quantity = parse_quantity(request.POST.get('quantity'))
+    if quantity < 1:
+        return JsonResponse({'error': 'Quantidade inválida.'}, status=400)
+    try:
+        cart.add(product=product, quantity=quantity, variant=variant)
+    except OutOfStockError:
+        return JsonResponse({'error': OUT_OF_STOCK_MESSAGE}, status=409)
+    except CartBusyError:
+        return JsonResponse({'error': CART_BUSY_MESSAGE}, status=409)
+    return JsonResponse(cart_summary_data(cart))
+
+@require_POST
+def cart_api_update(request, cart_key):
+    cart = get_cart(request)
+    if cart_key not in cart.cart:
+        return JsonResponse({'error': 'Artigo não encontrado no carrinho.'}, status=404)
+    quantity = parse_quantity(request.POST.get('quantity'), default=None)
+    if quantity is None or quantity < 0:
+        return JsonResponse({'error': 'Quantidade inválida.'}, status=400)
+    try:
+        cart.set_quantity(cart_key, quantity)
+    except OutOfStockError:
+        return JsonResponse({'error': OUT_OF_STOCK_MESSAGE}, status=409)
+    except CartBusyError:
+        return JsonResponse({'error': CART_BUSY_MESSAGE}, status=409)
+    return JsonResponse(cart_summary_data(cart))
+
+@require_POST
+def cart_api_remove(request, cart_key):
+    cart = get_cart(request)
+    try:
+        cart.remove(cart_key)
+    except CartBusyError:
+        return JsonResponse({'error': CART_BUSY_MESSAGE}, status=409)
+    return JsonResponse(cart_summary_data(cart))
+
 @login_required
 def profile(request):
     # Se for Administrador (Staff), ignora a sessão e redireciona para login de cliente
@@ -109,7 +277,13 @@ def register(request):
     return render(request, 'store/register.html', context)
 
 def checkout(request):
-    cart = Cart(request)
+    cart = get_cart(request)
+    if request.method == 'POST':
+        # Reenvio de um formulário já processado (duplo clique / refresh): mostra a encomenda existente
+        existing_order = find_order_by_key(request.POST.get('checkout_token'))
+        if existing_order:
+            return render(request, 'store/order_success.html', {'order': existing_order})
+
     if not cart:
         return redirect('store:product_list')
 
@@ -121,57 +295,20 @@ def checkout(request):
             # Apenas associa se NÃO for administrador (staff)
             if request.user.is_authenticated and not request.user.is_staff:
                 order.user = request.user
-            order.total_price = cart.get_total_price()
-            order.save()
-            
-            for item in cart:
-                # 1. Obter Produto (usando ID direto do carrinho - muito mais seguro)
-                product_id = item.get('product_id')
-                product = get_object_or_404(Product, id=product_id)
-                
-                # --- GESTÃO DE STOCK ---
-                if product.stock >= item['quantity']:
-                    product.stock -= item['quantity']
-                    product.save()
-                
-                # 2. Obter Variante (opcional, apenas para referência futura)
-                variant_id = item.get('variant_id')
-                # Nota: O modelo OrderItem atual não tem campo para guardar a variante,
-                # por isso não a passamos no create abaixo para evitar erros.
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    price=item['price'],
-                    quantity=item['quantity'],
-                    # variant=variant  <-- Comentado pois o campo não existe no modelo OrderItem
-                )
-            
-            cart.clear()
-            
-            # Enviar emails de confirmação
-            subject = f'Confirmação da Encomenda #{order.id}'
-            message = f'Olá {order.full_name},\n\nObrigado pela sua encomenda! O total foi de {order.total_price}€.\n\nEnviaremos novidades sobre o envio em breve.'
-            
+            order.idempotency_key = form.cleaned_data['checkout_token']
             try:
-                # Email para o cliente
-                send_mail(subject, message, settings.EMAIL_HOST_USER, [order.email])
-                
-                # Email para o admin
-                send_mail(
-                    f'Nova Encomenda #{order.id}',
-                    f'Recebeu uma nova encomenda de {order.full_name} no valor de {order.total_price}€.',
-                    settings.EMAIL_HOST_USER,
-                    ['seu_email_de_admin@exemplo.com'], # Substitua pelo seu email
-                    fail_silently=True
-                )
-            except Exception as e:
-                # Não impede o fluxo, mas regista o erro na consola do servidor
-                print(f"ERRO AO ENVIAR EMAIL: {e}")
+                order = place_order(order, cart)
+            except OutOfStockError as e:
+                # Nada foi gravado (a transação foi desfeita); o cliente ajusta o carrinho
+                names = ', '.join(product.name for product in e.products)
+                error = f"Stock insuficiente para: {names}. Por favor ajuste o seu carrinho."
+                context = {'form': form, 'error': error}
+                context.update(get_common_context())
+                return render(request, 'store/checkout.html', context)
 
             return render(request, 'store/order_success.html', {'order': order})
     else:
-        initial_data = {}
+        initial_data = {'checkout_token': secrets.token_urlsafe(24)}
         # Apenas preenche dados se NÃO for administrador
         if request.user.is_authenticated and not request.user.is_staff:
             initial_data['full_name'] = f"{request.user.first_name} {request.user.last_name}".strip()
@@ -189,30 +326,41 @@ def checkout(request):
     context.update(get_common_context())
     return render(request, 'store/checkout.html', context)
 
+@cache_shared_page
 def ceremony_list(request):
     # Mostra apenas cerimónias futuras (data maior ou igual a hoje)
-    ceremonies = Ceremony.objects.filter(event_date__gte=timezone.now()).order_by('event_date')
+    ceremonies = list(Ceremony.objects.filter(event_date__gte=timezone.now()).order_by('event_date'))
     context = {'ceremonies': ceremonies}
     context.update(get_common_context())
-    return render(request, 'store/ceremony_list.html', context)
+    response = render(request, 'store/ceremony_list.html', context)
+    if ceremonies:
+        # A página em cache deixa de ser válida quando a primeira cerimónia passar
+        response.page_cache_until = ceremonies[0].event_date
+    return response
+
+def render_ceremony_full(request, ceremony):
+    context = {'ceremony': ceremony, 'form': CeremonyRegistrationForm(), 'error': 'Desculpe, esta cerimónia já está lotada.'}
+    context.update(get_common_context())
+    return render(request, 'store/ceremony_detail.html', context)
 
 def ceremony_detail(request, ceremony_id):
     ceremony = get_object_or_404(Ceremony, id=ceremony_id)
     
     if request.method == 'POST':
-        # Verifica se está cheia antes de processar
+        # Verifica se está cheia antes de processar (o contador evita um COUNT)
         if ceremony.is_full:
-            context = {'ceremony': ceremony, 'form': CeremonyRegistrationForm(), 'error': 'Desculpe, esta cerimónia já está lotada.'}
-            context.update(get_common_context())
-            return render(request, 'store/ceremony_detail.html', context)
+            return render_ceremony_full(request, ceremony)
 
         form = CeremonyRegistrationForm(request.POST)
         if form.is_valid():
             registration = form.save(commit=False)
-            registration.ceremony = ceremony
             if request.user.is_authenticated:
                 registration.user = request.user
-            registration.save()
+            try:
+                # O lugar é ocupado com um UPDATE condicional: o último lugar não é vendido duas vezes
+                ceremonies.register(ceremony, registration)
+            except ceremonies.CeremonyFullError:
+                return render_ceremony_full(request, ceremony)
             context = {'ceremony': ceremony, 'registration': registration}
             context.update(get_common_context())
             return render(request, 'store/ceremony_success.html', context)
@@ -258,17 +406,14 @@ def contact_view(request):
         form = ContactForm(request.POST)
         if form.is_valid():
             # Tenta obter o email de destino das configurações, senão usa o do settings
-            site_settings = SiteSettings.objects.first()
+            site_settings = reference.site_settings(request)
             dest_email = site_settings.contact_email if site_settings and site_settings.contact_email else settings.EMAIL_HOST_USER
             
             subject = f"Contacto do Site: {form.cleaned_data['subject']}"
             message = f"De: {form.cleaned_data['name']} <{form.cleaned_data['email']}>\n\n{form.cleaned_data['message']}"
-            
-            try:
-                send_mail(subject, message, settings.EMAIL_HOST_USER, [dest_email], fail_silently=True)
-            except:
-                pass # Em produção deve-se logar o erro
-                
+            # Enviado pelo comando `send_outbox` (o pedido não espera pelo servidor SMTP)
+            queue_email(subject, message, [dest_email])
+
             context = {}
             context.update(get_common_context())
             return render(request, 'store/contact_success.html', context)
@@ -278,6 +423,7 @@ def contact_view(request):
     context.update(get_common_context())
     return render(request, 'store/contact.html', context)
 
+@cache_shared_page
 def therapy_list(request):
     therapies = Therapy.objects.filter(is_active=True)
     context = {'therapies': therapies}